@@ -1,166 +1,20 @@
 import streamlit as st
-import os
-import tempfile
-from docxtpl import DocxTemplate, InlineImage
-from docx import Document
-from docx.shared import Inches
-from io import BytesIO
-import fitz
 import datetime
-
-def clean_numbers(text):
-    return "".join(filter(str.isdigit, str(text)))
-
-def format_cnpj(cnpj):
-    cnpj = clean_numbers(cnpj)
-    if len(cnpj) == 14:
-        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
-    return cnpj
-
-def format_cpf(cpf):
-    cpf = clean_numbers(cpf)
-    if len(cpf) == 11:
-        return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
-    return cpf
-
-def pdf_balanco_duas_paginas(pdf_path):
-    doc = fitz.open(pdf_path)
-    images = []
-
-    for i in range(2):
-        if i < len(doc):
-            pix = doc[i].get_pixmap(dpi = 200)
-            img_bytes = pix.tobytes("png")
-            images.append(img_bytes)
-        else:
-            images.append(None)
-    return images
-
-def pdf_to_images(pdf_path):
-    images = []
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        pix = page.get_pixmap(dpi=200)
-        img_bytes = pix.tobytes("png")
-        images.append(img_bytes)
-    return images
-
-def insert_pdf_at_placeholder(main_doc, placeholder, pdf_path):
-    images = pdf_to_images(pdf_path)
-    for paragraph in main_doc.paragraphs:
-        if placeholder in paragraph.text:
-            paragraph.text = paragraph.text.replace(placeholder, "")
-            for img in images:
-                run = paragraph.add_run()
-                run.add_picture(BytesIO(img), width=Inches(6))
-            return True
-
-def insert_docx_at_placeholder(main_doc: Document, placeholder: str, insert_doc_path: str):
-    insert_doc = Document(insert_doc_path)
-    for paragraph in main_doc.paragraphs:
-        if placeholder in paragraph.text:
-            paragraph.text = paragraph.text.replace(placeholder, "")
-            for element in reversed(insert_doc.element.body):
-                paragraph._element.addnext(element)
-            return True
-        
-meses_pt = {
-    1:"Janeiro", 2:"Fevereiro", 3:"Março", 4:"Abril",
-    5:"Maio", 6:"Junho", 7:"Julho", 8:"Agosto",
-    9:"Setembro", 10:"Outubro",11:"Novembro",12:"Dezembro"
-}
-
-def generate_document(input_data):
-    temp_paths = {}
-
-    data_e_hora_atual = datetime.datetime.now()
-    dia = data_e_hora_atual.day
-    mes = meses_pt[data_e_hora_atual.month]
-    ano = data_e_hora_atual.year
-    data_atual_formatada = f"{dia} de {mes} de {ano}"
-    
-    for key, uploaded_file in input_data['uploads'].items():
-        if uploaded_file is not None:
-            suffix = os.path.splitext(uploaded_file.name)[1]
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                temp_paths[key] = tmp_file.name
-        else:
-            return None, f"O arquivo {key} é obrigatório!"
-    
-    # === B) Definir os Caminhos Finais para a Lógica de Geração ===
-    CAMINHO_TEMPLETE = "templete_base_ofc.docx"
-    
-    TEMP_BASE_DOCX = os.path.join(tempfile.gettempdir(), "temporario_base.docx")
-    TEMP_CART_DOCX = os.path.join(tempfile.gettempdir(), "temp_cart.docx")
-    TEMP_RENDERED = os.path.join(tempfile.gettempdir(), "temp_rendered.docx")
-    
-    final_docx_buffer = BytesIO() 
-
-    try:
-        
-        doc = DocxTemplate(CAMINHO_TEMPLETE)
-
-        balanco_imgs = pdf_balanco_duas_paginas(temp_paths['balanco_file'])
-        balanco_pt1_img = InlineImage(doc, BytesIO(balanco_imgs[0]), width=Inches(6))
-        balanco_pt2_img = InlineImage(doc, BytesIO(balanco_imgs[1]), width=Inches(6))
-
-        context = {
-            'nome_empresa': input_data['nome_empresa'],
-            'data_atual': data_atual_formatada,
-            'periodo_anual': input_data['periodo_anual'],
-            'cnpj_empresa': input_data['cnpj_empresa'],
-            'data_dem_encerradas': input_data['data_dem_encerradas'],
-            'razao_social_empresa': input_data['razao_social_empresa'],
-            'periodo_em_data': input_data['periodo_em_data'],
-            'balanco_patrimonial_pt1': balanco_pt1_img,
-            'balanco_patrimonial_pt2': balanco_pt2_img,
-            'demontr_resultado': '[[DEMONSTR_RESULTADO]]',
-            'socios': input_data['socios'],
-            'explic_demonstr': '[[EXP_DEMONSTR]]', 
-            'carta_responsb': '[[CARTA_RESP]]'
-        }
-
-        doc.render(context)
-        doc.save(TEMP_RENDERED)
-
-        final_doc = Document(TEMP_RENDERED)
-
-        insert_pdf_at_placeholder(final_doc, '[[DEMONSTR_RESULTADO]]', temp_paths['demstr_result_file'])
-        insert_docx_at_placeholder(final_doc, '[[EXP_DEMONSTR]]', temp_paths['explic_demonstr_file'])
-        insert_docx_at_placeholder(final_doc, '[[CARTA_RESP]]', temp_paths['carta_responsb_file'])
-
-        final_doc.save(final_docx_buffer)
-        final_docx_buffer.seek(0)
-        
-        return final_docx_buffer.getvalue(), None
-
-    except Exception as e:
-        if "No such file or directory" in str(e) and CAMINHO_TEMPLETE in str(e):
-            return None, f"Erro: O template DOCX '{CAMINHO_TEMPLETE}' não foi encontrado no repositório. Certifique-se de que ele foi enviado ao GitHub."
-        
-        if "No pandoc was found" in str(e):
-             return None, f"Erro: O Pandoc é necessário para converter Markdown. Por favor, instale o Pandoc no ambiente ou use uma solução de deploy que o inclua. Erro detalhado: {e}"
-
-        if "index out of range" in str(e):
-             return None, f"Erro: O arquivo 'Balanco Patrimonial' (PDF) deve ter pelo menos 2 páginas. Detalhes: {e}"
-       
-        return None, f"Erro durante a geração: {e}"
-    
-    finally:
-        temp_files_to_clean = [
-            TEMP_BASE_DOCX, TEMP_CART_DOCX, TEMP_RENDERED, 
-            temp_paths.get('balanco_pt1_file'), temp_paths.get('balanco_pt2_file'), 
-            temp_paths.get('demstr_result_file'), temp_paths.get('explic_demonstr_file'), 
-            temp_paths.get('carta_responsb_file')
-        ]
-        
-        for temp_file in [f for f in temp_files_to_clean if f]:
-            try:
-                os.remove(temp_file)
-            except Exception:
-                pass
+import time
+from functools import partial
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Só módulos leves: PyMuPDF, python-docx e docxtpl carregam nos processos da
+# fila, na primeira geração (ver campos.py).
+from armazem_artefatos import obter_armazem
+from campos import (
+    cnpj_valido, cpfs_invalidos, format_cnpj, ler_socios_csv, nome_arquivo_dossie, normalizar_cpfs,
+    periodos_from_datas, socios_em_colunas, socios_em_linhas, ARQUIVOS_OBRIGATORIOS, COLUNAS_SOCIOS, ETAPAS,
+    FORMATOS_SAIDA, MODOS_DEMONSTRACOES
+)
+from fila_jobs import CONCLUIDO, ESTADOS_FINAIS, NA_FILA, FilaCheia, obter_fila
+from perfis_raster import PAGINAS_AMOSTRA, PERFIS, PERFIL_PADRAO, comparar_perfis
+from registro_templates import obter_registro
 
 
 # --- 2. Interface Streamlit ---
@@ -173,7 +27,13 @@ tab1, tab2, tab3 = st.tabs(["Dados da Empresa/Períodos", "Dados dos Sócios", "
 
 input_data = {}
 
-with tab1:
+# Cada aba é um fragmento: digitar num campo reexecuta só
+# aquele trecho, e não a página inteira. O script todo roda de novo no
+# clique em GERAR, e aí os fragmentos preenchem input_data com os valores
+# guardados nos widgets.
+
+@st.fragment
+def dados_empresa():
     col1, col2 = st.columns(2)
     
     with col1:
@@ -183,6 +43,8 @@ with tab1:
         cnpj_input = st.text_input("CNPJ ", value= "23766826000161")
         input_data['cnpj_empresa'] = format_cnpj(cnpj_input)
         st.markdown(f"**CNPJ Formatado:** `{format_cnpj(input_data['cnpj_empresa'])}`")
+        if not cnpj_valido(input_data['cnpj_empresa']):
+            st.warning("CNPJ inválido: confira os dígitos verificadores.")
 
     with col2:
 
@@ -208,98 +70,307 @@ with tab1:
         )
 
 
-        mes_inicio_curto = str(data_inicio.month).zfill(2)
-        ano_inicio_curto = str(data_inicio.year)[-2:]
-        mes_fim_curto = str(data_fim.month).zfill(2)
-        ano_fim_curto = str(data_fim.year)[-2:]
-        
-        if data_inicio.year != data_fim.year:
-             input_data['periodo_em_data'] = f"{mes_inicio_curto}/{ano_inicio_curto} a {mes_fim_curto}/{ano_fim_curto}"
-        else:
-             input_data['periodo_em_data'] = f"{mes_inicio_curto} a {mes_fim_curto}/{ano_fim_curto}"
-        
-        mes_desc_inicio = meses_pt.get(data_inicio.month)
-        mes_desc_fim = meses_pt.get(data_fim.month)
-        
-        if data_inicio.year == data_fim.year:
-            periodo_anual_desc = f"{mes_desc_inicio} a {mes_desc_fim} de {data_inicio.year}"
-        else:
-            periodo_anual_desc = f"{mes_desc_inicio} de {data_inicio.year} a {mes_desc_fim} de {data_fim.year}"
-
-        input_data['periodo_anual'] = periodo_anual_desc
-
-        input_data['data_dem_encerradas'] = data_fim.strftime("%d/%m/%Y")
-        
+        input_data.update(periodos_from_datas(data_inicio, data_fim))
+
         st.markdown("---")
         st.markdown(f"**Período de Referência (periodo_em_data):** `{input_data['periodo_em_data']}`")
         st.markdown(f"**Descrição Anual (periodo_anual):** `{input_data['periodo_anual']}`")
 
 
+with tab1:
+    dados_empresa()
+
+
+def trocar_socios(colunas):
+    """Substitui os sócios da grade. A versão nova na chave descarta as edições pendentes do editor."""
+    st.session_state.socios = colunas
+    st.session_state.versao_socios = st.session_state.get('versao_socios', 0) + 1
+
+
+@st.fragment
+def editor_socios():
+    # Os sócios ficam em colunas (campos.py) e são editados numa grade só: com
+    # centenas de sócios, a página continua com um widget, e não três por sócio.
+    versao = st.session_state.setdefault('versao_socios', 0)
+
+    with st.expander("📋 Importar sócios de CSV ou da planilha"):
+        arquivo = st.file_uploader("Arquivo CSV (nome, CPF, cargo)", type=["csv", "txt"], key=f"csv_socios_{versao}")
+        colado = st.text_area("Ou cole aqui as linhas da planilha", key=f"colar_socios_{versao}", height=120)
+        acrescentar = st.checkbox("Acrescentar aos sócios atuais (em vez de substituir)", key=f"acrescentar_{versao}")
+        if st.button("Importar sócios"):
+            novos = ler_socios_csv(arquivo.getvalue() if arquivo else colado)
+            if not novos['nome']:
+                st.warning("Nenhum sócio encontrado: envie um CSV ou cole as linhas da planilha.")
+            else:
+                if acrescentar:
+                    atuais = socios_em_colunas(socios_em_linhas(st.session_state.socios_editados))
+                    novos = {c: atuais[c] + novos[c] for c in COLUNAS_SOCIOS}
+                # A grade logo abaixo já sai com a chave nova e os sócios importados.
+                trocar_socios(novos)
+
+    editados = st.data_editor(
+        st.session_state.socios,
+        key=f"grade_socios_{versao}",
+        num_rows="dynamic",
+        width="stretch",
+        column_config={
+            'nome': st.column_config.TextColumn("Nome", width="large"),
+            'cpf': st.column_config.TextColumn("CPF", help="Com ou sem pontuação: é formatado ao gerar."),
+            'cargo': st.column_config.TextColumn("Cargo"),
+        },
+    )
+    st.session_state.socios_editados = editados
+
+    cpfs = normalizar_cpfs(editados['cpf'])
+    invalidos = cpfs_invalidos(cpfs)
+    total = len(socios_em_linhas(editados))
+    st.caption(f"{total} sócio(s).")
+    if invalidos:
+        linhas = ", ".join(str(i + 1) for i in invalidos[:20]) + (" ..." if len(invalidos) > 20 else "")
+        st.warning(f"{len(invalidos)} CPF(s) inválido(s), nas linhas {linhas}: confira os dígitos verificadores.")
+    if cpfs != [str(c or '') for c in editados['cpf']] and st.button("Formatar CPFs"):
+        trocar_socios({**editados, 'cpf': cpfs})
+        st.rerun()
+
+    input_data["socios"] = socios_em_linhas({**editados, 'cpf': cpfs})
+
+
 with tab2:
     st.subheader("Dados dos Sócios")
     if "socios" not in st.session_state:
-        st.session_state.socios = [{"nome": "", "cpf": "", "cargo": ""}]
-
-    for i, socio in enumerate(st.session_state.socios):
-        st.write(f"##### --- Sócio {i+1} ---")
-        socio["nome"] = st.text_input(f"Nome do Sócio {i+1}", value=socio["nome"], key=f"nome_{i}")
-
-        cpf_input = f"cpf_input_{i}"
-        cpf_value = st.text_input(f"CPF do Sócio {i+1}", value=clean_numbers(socio["cpf"]), key=cpf_input)
-        st.session_state.socios[i]["cpf"]= format_cpf(cpf_value)
-
-        st.markdown(f"**CPF Formatado:** `{format_cpf(st.session_state.socios[i]['cpf'])}`")
-        
-        socio["cargo"] = st.text_input(f"Cargo do Sócio {i+1}", value=socio["cargo"], key=f"cargo_{i}")
-        if st.button(f"Remover Sócio {i+1}", key=f"remove_{i}"):
-            st.session_state.socios.pop(i)
-            st.experimental_rerun()
-
-    if st.button("➕ Adicionar Sócio"):
-        st.session_state.socios.append({"nome": "", "cpf": "", "cargo": ""})
-
-input_data["socios"] = st.session_state.socios
+        st.session_state.socios = socios_em_colunas([{"nome": "", "cpf": "", "cargo": ""}])
+    editor_socios()
 
 input_data['uploads'] = {}
-
-with tab3:
+armazem = obter_armazem()
+
+def upload_em_disco(chave, rotulo, tipos):
+    """file_uploader cujo arquivo vai para o armazém em disco assim que chega.
+
+    A sessão guarda só o hash e o nome, e o arquivo sai da memória do
+    servidor. Retorna o caminho no armazém (ou None).
+    """
+    enviados = st.session_state.setdefault('arquivos_enviados', {})
+    versoes = st.session_state.setdefault('versoes_upload', {})
+    upload = st.file_uploader(rotulo, type=tipos, key=f"{chave}_{versoes.get(chave, 0)}")
+    if upload is not None:
+        enviados[chave] = (armazem.guardar(upload), upload.name)
+        # O Streamlit só solta os uploads no fim da sessão: o arquivo é removido
+        # já, e o widget é recriado vazio (chave nova) para não pedir por ele.
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            ctx.uploaded_file_mgr.remove_file(ctx.session_id, upload.file_id)
+        versoes[chave] = versoes.get(chave, 0) + 1
+        st.rerun()
+
+    if chave in enviados:
+        hash_arquivo, nome = enviados[chave]
+        if armazem.contem(hash_arquivo):
+            st.caption(f"📎 {nome} (para trocar, envie outro arquivo)")
+            return armazem.caminho(hash_arquivo)
+        del enviados[chave]
+        st.caption(f"⚠️ {nome} expirou; envie de novo.")
+    return None
+
+@st.fragment
+def arquivos_e_opcoes():
     st.subheader("Balancos e Demonstrações (PDF)")
     col5, col6 = st.columns(2)
     
     with col5:
-        input_data['uploads']['balanco_file'] = st.file_uploader("Balanco Patrimonial (PDF)", type=["pdf"])
+        input_data['uploads']['balanco_file'] = upload_em_disco('balanco_file', "Balanco Patrimonial (PDF)", ["pdf"])
     with col6:
-        input_data['uploads']['demstr_result_file'] = st.file_uploader("Demonstração do Resultado (DRE)", type=["pdf"])
+        input_data['uploads']['demstr_result_file'] = upload_em_disco('demstr_result_file', "Demonstração do Resultado (DRE)", ["pdf"])
 
-    st.subheader("Arquivos de Texto (WORD)")
+    st.subheader("Arquivos de Texto (WORD ou Markdown)")
     col7, col8 = st.columns(2)
     with col7:
-        input_data['uploads']['explic_demonstr_file'] = st.file_uploader("Notas Explicativas", type=["docx"], key='notas')
+        input_data['uploads']['explic_demonstr_file'] = upload_em_disco('explic_demonstr_file', "Notas Explicativas", ["docx", "md"])
     with col8:
-        input_data['uploads']['carta_responsb_file'] = st.file_uploader("Carta de Responsabilidade", type=["docx"], key='carta')
+        input_data['uploads']['carta_responsb_file'] = upload_em_disco('carta_responsb_file', "Carta de Responsabilidade", ["docx", "md"])
+
+    nomes_templates = obter_registro().nomes()
+    if len(nomes_templates) > 1:
+        st.subheader("Papel Timbrado")
+        input_data['template'] = st.selectbox("Template do dossiê", options=nomes_templates)
+
+    st.subheader("Formato de Saída")
+    input_data['formato_saida'] = st.radio(
+        "Formato do dossiê",
+        options=list(FORMATOS_SAIDA),
+        format_func=lambda f: {"docx": "DOCX (Word)", "pdf": "PDF (páginas originais do balanço/DRE, sem rasterizar)"}[f],
+        horizontal=True
+    )
+
+    if input_data['formato_saida'] == 'docx':
+        input_data['modo_demonstracoes'] = st.radio(
+            "Balanço e DRE no Word como",
+            options=list(MODOS_DEMONSTRACOES),
+            format_func=lambda m: {"imagem": "Imagens das páginas", "tabela": "Tabelas do Word (extraídas do texto do PDF)"}[m],
+            horizontal=True,
+            help="No modo tabela, páginas sem texto aproveitável (ex.: digitalizadas) continuam como imagem."
+        )
+        input_data['otimizar_docx'] = st.checkbox(
+            "Otimizar o arquivo final",
+            help="Remove partes e estilos não usados, junta imagens repetidas e reduz imagens das notas/carta "
+                 "acima da resolução do perfil. Deixa o DOCX menor para e-mail e arquivo."
+        )
+
+    st.subheader("Qualidade das Imagens")
+    input_data['perfil_raster'] = st.selectbox(
+        "Perfil de imagem dos PDFs",
+        options=list(PERFIS),
+        index=list(PERFIS).index(PERFIL_PADRAO),
+        help="screen: leve, para envio por e-mail · print: impressão · archive: máxima qualidade · original: 200 DPI em PNG (comportamento antigo)"
+    )
+
+    pdf_comparacao = input_data['uploads']['demstr_result_file'] or input_data['uploads']['balanco_file']
+    if pdf_comparacao is not None and st.button("Comparar perfis com o padrão antigo"):
+        # Só algumas páginas: a comparação roda na sessão e não pode segurar a página
+        # o tempo de rasterizar uma DRE inteira cinco vezes.
+        with st.spinner(f"Renderizando até {PAGINAS_AMOSTRA} páginas do PDF em cada perfil..."):
+            comparacao = comparar_perfis(pdf_comparacao, amostra=PAGINAS_AMOSTRA)
+        st.caption(f"Amostra de {comparacao['original']['paginas']} páginas do PDF.")
+        st.table({
+            nome: {
+                "Tamanho (MB)": f"{r['bytes'] / 1e6:.2f}",
+                "Economia de tamanho": f"{r['economia_bytes']:.0%}",
+                "Tempo (s)": f"{r['segundos']:.2f}",
+                "Economia de tempo": f"{r['economia_tempo']:.0%}",
+            }
+            for nome, r in comparacao.items()
+        })
+
+
+with tab3:
+    arquivos_e_opcoes()
+
+fila = obter_fila()
+
+COLUNAS_PREVIA = 6
+
+def mostrar_previa(input_data):
+    """Miniaturas do dossiê montado, mostradas uma a uma à medida que são renderizadas."""
+    # Import local: a prévia carrega PyMuPDF e python-docx neste processo, só quando pedida.
+    from previa import gerar_previa
+
+    inicio = time.perf_counter()
+    with st.spinner("Lendo os arquivos..."):
+        paginas, erro = gerar_previa(input_data)
+    if erro:
+        st.error(erro)
+        return
+
+    st.subheader("👁️ Prévia do dossiê")
+    colunas = st.columns(COLUNAS_PREVIA)
+    total = 0
+    for pagina in paginas:
+        with colunas[total % COLUNAS_PREVIA]:
+            if pagina.imagem:
+                st.image(pagina.imagem, caption=pagina.rotulo)
+            else:
+                st.info(pagina.rotulo)
+        total += 1
+    st.caption(f"{total} miniaturas em {time.perf_counter() - inicio:.2f}s. Baixa resolução, só para conferir "
+               "a ordem das páginas: notas e carta aparecem só na primeira página. Se estiver tudo no lugar, gere o dossiê.")
+
+
+if st.button("👁️ Prévia rápida", help="Miniaturas do dossiê montado em baixa resolução, em menos de um segundo."):
+    if all(input_data['uploads'][f] is not None for f in ARQUIVOS_OBRIGATORIOS):
+        mostrar_previa(input_data)
+    else:
+        st.warning("Por favor, faça o upload de todos os 4 arquivos antes da prévia.")
 
 if st.button("✅ GERAR DOCUMENTO FINAL", type="primary"):
-    required_files = [
-        'balanco_file', 'demstr_result_file', 
-        'explic_demonstr_file', 'carta_responsb_file'
-    ]
-    
-    all_files_uploaded = all(input_data['uploads'][f] is not None for f in required_files)
+    all_files_uploaded = all(input_data['uploads'][f] is not None for f in ARQUIVOS_OBRIGATORIOS)
     
     if all_files_uploaded:
-        with st.spinner("Gerando documento... Isso pode levar alguns segundos."):
-            file_data, error = generate_document(input_data)
-        
-        if file_data:
-            st.success("Documento gerado com sucesso!")
-            st.download_button(
-                label="Clique para Baixar Document.docx",
-                data=file_data,
-                file_name=f"Dossie_Contabil_{input_data['nome_empresa']}.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-        else:
-            st.error(f"Falha na geração do documento. Detalhes: {error}")
+        try:
+            # O job fica na URL: recarregar a página continua acompanhando o mesmo dossiê.
+            st.query_params['job'] = fila.enviar(input_data)
+        except FilaCheia as e:
+            st.warning(str(e))
+        except ValueError as e:
+            st.error(str(e))
             
     else:
-        st.warning("Por favor, faça o upload de todos os 4 arquivos antes de gerar.")
\ No newline at end of file
+        st.warning("Por favor, faça o upload de todos os 4 arquivos antes de gerar.")
+
+
+@st.fragment(run_every=1.0)
+def acompanhar_job(job_id):
+    estado = fila.status(job_id)
+    if estado['estado'] in ESTADOS_FINAIS:
+        st.rerun()
+    if estado['estado'] == NA_FILA:
+        st.progress(0.0, text=f"Na fila (posição {estado['posicao_fila']})...")
+    else:
+        st.progress(estado['progresso'], text=f"{estado['descricao_etapa'] or 'Iniciando'}...")
+
+
+def ler_dossie(job_id):
+    # Chamada só no clique do download, fora da execução do script: a sessão
+    # não segura os bytes do dossiê. O arquivo é fechado aqui mesmo; se ele
+    # saiu do armazém depois de a página ser montada, o Streamlit mostra a
+    # falha do download no lugar de um arquivo vazio.
+    arquivo = fila.abrir_artefato(job_id)
+    if arquivo is None:
+        raise FileNotFoundError(f"O dossiê do pedido {job_id} expirou. Gere novamente.")
+    with arquivo:
+        return arquivo.read()
+
+
+job_id = st.query_params.get('job')
+estado_job = fila.status(job_id) if job_id else None
+
+if estado_job is None:
+    pass
+elif estado_job['estado'] not in ESTADOS_FINAIS:
+    acompanhar_job(job_id)
+elif estado_job['estado'] == CONCLUIDO and not fila.artefato_disponivel(job_id):
+    st.warning("O dossiê gerado expirou. Gere novamente.")
+elif estado_job['estado'] == CONCLUIDO:
+    st.success(f"Documento gerado com sucesso! ({estado_job['segundos']:.1f}s)")
+    extensao = estado_job['formato']
+    st.download_button(
+        label=f"Clique para Baixar Document.{extensao}",
+        data=partial(ler_dossie, job_id),
+        file_name=nome_arquivo_dossie(estado_job['nome_empresa'], extensao),
+        mime=FORMATOS_SAIDA[extensao]
+    )
+else:
+    st.error(f"Falha na geração do documento. Detalhes: {estado_job['erro']}")
+
+if estado_job and estado_job['medicoes']:
+    medicoes = estado_job['medicoes']
+    pico = medicoes.get('pico_rss_mb')
+    memoria = f", pico de {pico:.0f} MB" if pico is not None else ""
+    with st.expander(f"Tempo e memória por etapa ({medicoes['segundos']:.2f}s no total{memoria})"):
+        otimizacao = medicoes.get('otimizacao')
+        if otimizacao and 'economia_bytes' in otimizacao:
+            st.write(f"Otimização: {otimizacao['bytes_antes'] / 1e6:.2f} → {otimizacao['bytes_depois'] / 1e6:.2f} MB "
+                     f"({otimizacao['economia']:.0%} menor)")
+        cache = medicoes.get('cache_raster')
+        if cache:
+            st.write(f"Cache de imagens: {cache['hits_memoria'] + cache['hits_disco']} acertos, "
+                     f"{cache['misses']} falhas")
+        st.table([
+            {
+                "Etapa": ETAPAS.get(m['etapa'], m['etapa']),
+                "Tempo (s)": f"{m['segundos']:.2f}",
+                "CPU (s)": f"{m['cpu_segundos']:.2f}",
+                "Pico de memória (MB)": f"{m['pico_rss_mb']:.0f}" if m['pico_rss_mb'] is not None else "-",
+                "Variação (MB)": f"{m['delta_rss_mb']:+.0f}" if m.get('delta_rss_mb') is not None else "-",
+                "Bytes gerados": f"{m['bytes'] / 1e6:.2f} MB",
+            }
+            for m in sorted(medicoes['etapas'], key=lambda m: list(ETAPAS).index(m['etapa']))
+        ])
+
+with st.sidebar.expander("Cache de imagens dos PDFs"):
+    # O cache fica nos processos que geram: os números vêm das medições das últimas gerações.
+    stats_cache = fila.estatisticas_cache()
+    st.metric("Taxa de acerto", f"{stats_cache['taxa_acerto']:.0%}")
+    st.caption(f"Nas últimas {stats_cache['geracoes']} gerações" if stats_cache['geracoes']
+               else "Nenhuma geração medida ainda")
+    st.write(f"Acertos (memória/disco): {stats_cache['hits_memoria']} / {stats_cache['hits_disco']}")
+    st.write(f"Falhas: {stats_cache['misses']}")
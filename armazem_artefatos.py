@@ -0,0 +1,167 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+# Armazém em disco dos arquivos de cada sessão: uploads (PDFs, notas, carta)
+# e dossiês gerados.
+#
+# Sem ele, cada sessão do Streamlit segurava na memória do servidor os PDFs
+# enviados e os bytes do dossiê pronto, e a memória crescia com o número de
+# sessões abertas. Aqui o arquivo vai para o disco assim que chega, com o
+# sha256 do conteúdo como nome (o mesmo PDF enviado em várias sessões fica
+# uma vez só), e a sessão e a fila guardam só o hash. Downloads são lidos do
+# disco na hora do clique.
+#
+# Entradas não usadas há mais de TTL_ARTEFATOS saem na próxima limpeza; se o
+# total passar de LIMITE_ARTEFATOS, saem as usadas há mais tempo, exceto as
+# dos últimos IDADE_MINIMA segundos (pedidos ainda na fila).
+
+PASTA_ARTEFATOS = os.environ.get(
+    "DOSSIE_ARTEFATOS_DIR", os.path.join(tempfile.gettempdir(), "dossie_artefatos")
+)
+TTL_ARTEFATOS = float(os.environ.get("DOSSIE_ARTEFATOS_HORAS", "24")) * 3600
+LIMITE_ARTEFATOS = int(os.environ.get("DOSSIE_ARTEFATOS_MB", "2048")) * 1024 * 1024
+IDADE_MINIMA = 15 * 60
+# Intervalo mínimo entre varreduras da pasta para aplicar o TTL.
+INTERVALO_LIMPEZA = 5 * 60
+
+_BLOCO = 1024 * 1024
+
+
+class ArmazemArtefatos:
+    def __init__(self, pasta=PASTA_ARTEFATOS, ttl=TTL_ARTEFATOS, limite_bytes=LIMITE_ARTEFATOS):
+        self.pasta = pasta
+        self.ttl = ttl
+        self.limite_bytes = limite_bytes
+        self._bytes = None
+        self._ultima_limpeza = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(pasta, exist_ok=True)
+
+    def caminho(self, chave):
+        return os.path.join(self.pasta, chave[:2], chave)
+
+    def _entradas(self):
+        for raiz, _, arquivos in os.walk(self.pasta):
+            for nome in arquivos:
+                if nome.endswith(".tmp"):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    st = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield caminho, st.st_size, st.st_mtime
+
+    def guardar(self, origem):
+        """Grava bytes ou um arquivo aberto (lido em blocos) e retorna a chave (sha256)."""
+        os.makedirs(self.pasta, exist_ok=True)
+        h = hashlib.sha256()
+        tamanho = 0
+        fd, temporario = tempfile.mkstemp(dir=self.pasta, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(origem, (bytes, bytearray, memoryview)):
+                    h.update(origem)
+                    f.write(origem)
+                    tamanho = len(origem)
+                else:
+                    if hasattr(origem, 'seek'):
+                        origem.seek(0)
+                    while bloco := origem.read(_BLOCO):
+                        h.update(bloco)
+                        f.write(bloco)
+                        tamanho += len(bloco)
+            chave = h.hexdigest()
+            destino = self.caminho(chave)
+            if os.path.exists(destino):
+                try:
+                    os.utime(destino)
+                    return chave
+                except FileNotFoundError:
+                    pass  # removida por uma limpeza neste meio-tempo: grava de novo
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            # Escrita atômica: outro processo nunca lê um arquivo pela metade.
+            os.replace(temporario, destino)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += tamanho
+        self.limpar()
+        return chave
+
+    def contem(self, chave):
+        return bool(chave) and os.path.exists(self.caminho(chave))
+
+    def abrir(self, chave):
+        """Arquivo aberto para leitura (quem chama fecha), ou None se expirou."""
+        caminho = self.caminho(chave)
+        try:
+            arquivo = open(caminho, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return arquivo
+
+    def tocar(self, chave):
+        """Marca a entrada como usada agora (adia o TTL). False se ela já saiu."""
+        try:
+            os.utime(self.caminho(chave))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def limpar(self, forcar=False):
+        """Remove as entradas vencidas e, acima do limite, as usadas há mais tempo."""
+        agora = time.time()
+        with self._lock:
+            acima_do_limite = self._bytes is not None and self._bytes > self.limite_bytes
+            if not forcar and not acima_do_limite and agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+                return
+            self._ultima_limpeza = agora
+
+            # Recalcula pelo disco, pois outros processos (workers da fila) também escrevem na pasta.
+            entradas = sorted(self._entradas(), key=lambda e: e[2])
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for caminho, tamanho, mtime in entradas:
+                idade = agora - mtime
+                vencida = idade > self.ttl
+                excedente = total > self.limite_bytes and idade > IDADE_MINIMA
+                if not (vencida or excedente):
+                    continue
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                except FileNotFoundError:
+                    pass
+            self._bytes = total
+
+    def estatisticas(self):
+        entradas = list(self._entradas())
+        return {
+            'entradas': len(entradas),
+            'bytes': sum(tamanho for _, tamanho, _ in entradas),
+            'limite_bytes': self.limite_bytes,
+            'ttl_horas': self.ttl / 3600,
+        }
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem():
+    """Armazém do processo (configurado pelas variáveis DOSSIE_ARTEFATOS_*)."""
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            _armazem = ArmazemArtefatos()
+        return _armazem
@@ -0,0 +1,561 @@
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+
+from campos import cpfs_invalidos, digitos_cpf, ler_socios_csv, socios_em_linhas
+
+# Benchmarks do gerador de dossiês.
+#
+# Gera fixtures sintéticas de tamanhos crescentes (PDFs de balanço/DRE de 2 a
+# 200 páginas, notas explicativas de 10 a 2.000 parágrafos, 1 a 100 sócios) e
+# mede generate_document de ponta a ponta e cada etapa isolada
+# (pdf_to_images, extrair_tabelas, render do template,
+# insert_docx_at_placeholder). Para cada caso: latência p50/p90/p99, vazão,
+# pico de memória e tamanho da saída. Com o pacote websockets instalado, mede
+# também a latência de cada interação na interface (casos interface/*).
+#
+# Cada caso roda num processo novo (o pico de RSS não vaza de um caso para o
+# outro) e com o cache de raster desligado, para medir o trabalho real.
+#
+#   python benchmark_dossie.py --salvar-baseline     # grava a referência desta máquina
+#   python benchmark_dossie.py                       # compara; sai com 1 se houver regressão
+#
+# A baseline é por máquina: grave-a no mesmo host em que as comparações vão rodar.
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# Regressão = p50, pico de memória ou tamanho da saída acima da baseline além dessas margens.
+TOLERANCIAS_PADRAO = {'p50': 0.25, 'pico_rss_mb': 0.20, 'bytes_saida': 0.05}
+
+TAMANHOS_PDF = (2, 20, 200)
+TAMANHOS_NOTAS = (10, 200, 2000)
+TAMANHOS_SOCIOS = (1, 100, 1000, 5000)
+# (páginas da DRE, parágrafos das notas, sócios); o balanço tem sempre 2 páginas.
+CENARIOS = {
+    'pequeno': (2, 10, 1),
+    'medio': (20, 200, 10),
+    'grande': (200, 2000, 100),
+}
+
+
+# --- Fixtures sintéticas ---
+
+def _valor(i, j):
+    valor = ((i * 7919 + j * 104729) % 9_000_000) / 100 + 1000
+    return f"{valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def gerar_pdf(caminho, paginas):
+    """PDF com texto real no formato de um relatório contábil: conta, descrição e valores alinhados à direita."""
+    import fitz
+
+    doc = fitz.open()
+    for n in range(paginas):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((50, 50), f"DEMONSTRAÇÃO CONTÁBIL SINTÉTICA - PÁGINA {n + 1}", fontsize=11)
+        y = 80
+        for i in range(40):
+            page.insert_text((50, y), f"{n + 1}.{i // 10 + 1}.{i + 1:02d}", fontsize=8)
+            page.insert_text((110, y), f"Conta sintética número {i + 1}", fontsize=8)
+            for coluna, direita in enumerate((430, 530)):
+                texto = _valor(n * 40 + i, coluna)
+                page.insert_text((direita - fitz.get_text_length(texto, fontsize=8), y), texto, fontsize=8)
+            y += 18
+        page.draw_line((50, 72), (545, 72))
+    doc.save(caminho)
+    doc.close()
+
+
+def _imagem_png():
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (300, 120), "white")
+    ImageDraw.Draw(img).rectangle((10, 10, 290, 110), outline="navy", width=6)
+    saida = BytesIO()
+    img.save(saida, format="PNG")
+    return saida
+
+
+def gerar_notas(caminho, paragrafos):
+    """DOCX de notas explicativas: títulos, parágrafos, listas numeradas, tabelas e uma imagem."""
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    doc.add_picture(_imagem_png(), width=Inches(2))
+    for i in range(paragrafos):
+        if i % 50 == 0:
+            doc.add_heading(f"Nota {i // 50 + 1}", level=2)
+        if i % 50 == 25:
+            tabela = doc.add_table(rows=4, cols=3)
+            for r, linha in enumerate(tabela.rows):
+                for c, celula in enumerate(linha.cells):
+                    celula.text = _valor(i + r, c)
+        if i % 10 < 3:
+            doc.add_paragraph(f"Item {i} da política contábil adotada pela entidade.", style="List Number")
+        else:
+            doc.add_paragraph(
+                f"Parágrafo {i}: as demonstrações foram elaboradas de acordo com as práticas "
+                "contábeis adotadas no Brasil, aplicáveis às pequenas e médias empresas."
+            )
+    doc.save(caminho)
+
+
+def gerar_socios(quantidade):
+    from dossie import format_cpf
+
+    return [
+        {"nome": f"Sócio Sintético {i + 1}", "cpf": format_cpf(_cpf_sintetico(i + 1)), "cargo": "Administrador"}
+        for i in range(quantidade)
+    ]
+
+
+def _csv_socios(quantidade):
+    linhas = ["Nome;CPF;Cargo"] + [f"{s['nome']};{s['cpf'].replace('.', '')};{s['cargo']}" for s in gerar_socios(quantidade)]
+    return "\n".join(linhas)
+
+
+def _cpf_sintetico(n):
+    # CPF com dígitos verificadores válidos, para passar pela validação prévia.
+    base = f"{n:09d}"
+    return base + digitos_cpf(base)
+
+
+def preparar_fixtures(pasta, rapido=False):
+    """Gera (se ainda não existirem) as fixtures em `pasta`. Retorna {nome: caminho}."""
+    os.makedirs(pasta, exist_ok=True)
+    fixtures = {}
+    for paginas in _tamanhos(TAMANHOS_PDF, rapido):
+        fixtures[f"pdf_{paginas}p"] = os.path.join(pasta, f"demonstracao_{paginas}p.pdf")
+        if not os.path.exists(fixtures[f"pdf_{paginas}p"]):
+            gerar_pdf(fixtures[f"pdf_{paginas}p"], paginas)
+    for paragrafos in _tamanhos(TAMANHOS_NOTAS, rapido):
+        fixtures[f"notas_{paragrafos}"] = os.path.join(pasta, f"notas_{paragrafos}.docx")
+        if not os.path.exists(fixtures[f"notas_{paragrafos}"]):
+            gerar_notas(fixtures[f"notas_{paragrafos}"], paragrafos)
+    return fixtures
+
+
+def _tamanhos(tamanhos, rapido):
+    # O modo rápido deixa de fora o maior tamanho de cada série.
+    return tamanhos[:-1] if rapido else tamanhos
+
+
+# --- Interface: latência por interação ---
+#
+# Um servidor Streamlit de verdade com o app_gerador.py e uma sessão que fala
+# com ele pelo mesmo websocket do navegador: cada interação manda o novo valor
+# de um widget (BackMsg.rerun_script) e conta até o fim da execução
+# (script_finished). Com o fragmento do widget, como o navegador faz, roda só
+# a seção dele; sem o fragmento, o script inteiro.
+
+APP_INTERFACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_gerador.py")
+CAMPO_EMPRESA = "Nome Fantasia da Empresa"
+SOCIOS_INTERFACE = (1, 100, 1000)
+
+
+class SessaoInterface:
+    """Servidor Streamlit rodando `app` e uma sessão de navegador simulada."""
+
+    def __init__(self, app=APP_INTERFACE, espera=60):
+        import shutil
+        import socket
+        import subprocess
+        import urllib.request
+
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            porta = s.getsockname()[1]
+        self.widgets = {}   # rótulo -> (id, fragmento), da última execução
+        self._ws = None
+        self._pasta = tempfile.mkdtemp(prefix="dossie_bench_interface_")
+        self._apagar = lambda: shutil.rmtree(self._pasta, ignore_errors=True)
+        self.servidor = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", os.path.basename(app), "--server.headless", "true",
+             "--server.port", str(porta), "--browser.gatherUsageStats", "false"],
+            cwd=os.path.dirname(os.path.abspath(app)), env={**os.environ, "DOSSIE_FILA_DIR": self._pasta},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        limite = time.monotonic() + espera
+        while True:
+            try:
+                urllib.request.urlopen(f"http://localhost:{porta}/_stcore/health", timeout=1)
+                break
+            except OSError:
+                if self.servidor.poll() is not None or time.monotonic() > limite:
+                    self.fechar()
+                    raise RuntimeError(f"o servidor Streamlit não subiu na porta {porta}")
+                time.sleep(0.2)
+        self.url = f"ws://localhost:{porta}/_stcore/stream"
+
+    def nova_sessao(self):
+        from websockets.sync.client import connect
+
+        if self._ws:
+            self._ws.close()
+        self._ws = connect(self.url, subprotocols=["streamlit"], max_size=None)
+        self.widgets = {}
+
+    def executar(self, valores=None, fragmento=False):
+        """Uma execução com os widgets de `valores` ({rótulo: valor}; True aciona um botão).
+
+        fragmento=True roda só o fragmento do primeiro widget de `valores`.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensagem = BackMsg()
+        mensagem.rerun_script.query_string = ""
+        mensagem.rerun_script.page_script_hash = ""
+        for rotulo, valor in (valores or {}).items():
+            estado = mensagem.rerun_script.widget_states.widgets.add()
+            estado.id = self.widgets[rotulo][0]
+            if valor is True:
+                estado.trigger_value = True
+            else:
+                estado.string_value = valor
+        if fragmento:
+            mensagem.rerun_script.fragment_id = self.widgets[next(iter(valores))][1]
+        self._ws.send(mensagem.SerializeToString())
+        while True:
+            resposta = ForwardMsg()
+            resposta.ParseFromString(self._ws.recv())
+            tipo = resposta.WhichOneof('type')
+            if tipo == 'delta' and resposta.delta.WhichOneof('type') == 'new_element':
+                elemento = resposta.delta.new_element
+                widget = getattr(elemento, elemento.WhichOneof('type'))
+                if elemento.WhichOneof('type') == 'exception':
+                    raise RuntimeError(f"exceção na interface: {widget.message}")
+                if getattr(widget, 'id', "") and getattr(widget, 'label', ""):
+                    self.widgets[widget.label] = (widget.id, resposta.delta.fragment_id)
+            elif tipo == 'script_finished' and resposta.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    def importar_socios(self, quantidade):
+        self.executar({"Ou cole aqui as linhas da planilha": _csv_socios(quantidade), "Importar sócios": True},
+                      fragmento=True)
+
+    def pico_rss_mb(self):
+        # Pico de RSS do processo do servidor, onde o script roda.
+        with open(f"/proc/{self.servidor.pid}/status") as f:
+            return next(int(linha.split()[1]) / 1024 for linha in f if linha.startswith("VmHWM:"))
+
+    def fechar(self):
+        if self._ws:
+            self._ws.close()
+        self.servidor.terminate()
+        self.servidor.wait()
+        self._apagar()
+
+
+def _casos_interface(rapido):
+    sessao = {}
+
+    def servidor():
+        if 'servidor' not in sessao:
+            sessao['servidor'] = SessaoInterface()
+        return sessao['servidor']
+
+    def abrir():
+        servidor().nova_sessao()
+    casos = [Caso("interface/abrir_pagina", lambda _: servidor().executar(), preparar=abrir)]
+
+    for socios in _tamanhos(SOCIOS_INTERFACE, rapido):
+        for fragmento in (True, False):
+            def preparar(socios=socios):
+                # Uma sessão só por caso; a primeira repetição abre a página e importa os sócios.
+                if not sessao.get('aberta'):
+                    abrir()
+                    servidor().executar()
+                    servidor().importar_socios(socios)
+                    sessao['aberta'] = True
+                sessao['digitado'] = sessao.get('digitado', 0) + 1
+                return {CAMPO_EMPRESA: f"Empresa {sessao['digitado']}"}
+            casos.append(Caso(
+                f"interface/digitar/{socios}socios/{'fragmento' if fragmento else 'script'}",
+                lambda valores, fragmento=fragmento: servidor().executar(valores, fragmento),
+                preparar=preparar, unidade="interações",
+            ))
+
+    def encerrar():
+        if 'servidor' in sessao:
+            sessao.pop('servidor').fechar()
+
+    for caso in casos:
+        caso.pico_rss_mb = lambda: servidor().pico_rss_mb()
+        caso.encerrar = encerrar
+    return casos
+
+
+# --- Casos ---
+
+@dataclass
+class Caso:
+    nome: str
+    executar: object            # função(estado) -> resultado medido
+    preparar: object = None     # função() -> estado, fora da medição
+    unidades: int = 1           # para a vazão (páginas, parágrafos, sócios...)
+    unidade: str = "execuções"
+    max_repeticoes: int = None
+    pico_rss_mb: object = None  # função() -> MB, quando o trabalho roda em outro processo
+    encerrar: object = None     # função(), ao fim do caso
+
+
+def _input_data(socios, fixtures=None, paginas_dre=None, paragrafos=None, **extras):
+    import datetime
+    from dossie import periodos_from_datas
+
+    input_data = {
+        'nome_empresa': "Empresa Sintética",
+        'razao_social_empresa': "EMPRESA SINTÉTICA LTDA",
+        'cnpj_empresa': "11.222.333/0001-81",
+        'socios': gerar_socios(socios),
+        **extras,
+    }
+    input_data.update(periodos_from_datas(datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)))
+    if fixtures is not None:
+        input_data['uploads'] = {
+            'balanco_file': fixtures["pdf_2p"],
+            'demstr_result_file': fixtures[f"pdf_{paginas_dre}p"],
+            'explic_demonstr_file': fixtures[f"notas_{paragrafos}"],
+            'carta_responsb_file': fixtures["notas_10"],
+        }
+    return input_data
+
+
+def _template_renderizado(socios=1):
+    from dossie import MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2, montar_contexto
+    from registro_templates import obter_registro
+
+    doc = obter_registro().obter()
+    doc.render(montar_contexto(_input_data(socios), MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2))
+    return doc
+
+
+def _saida_docx(doc):
+    saida = BytesIO()
+    doc.save(saida)
+    return saida.getvalue()
+
+
+def montar_casos(fixtures, rapido=False):
+    import dossie
+    from registro_templates import obter_registro
+
+    casos = []
+    for paginas in _tamanhos(TAMANHOS_PDF, rapido):
+        pdf = fixtures[f"pdf_{paginas}p"]
+        casos.append(Caso(f"pdf_to_images/{paginas}p", lambda _, pdf=pdf: dossie.pdf_to_images(pdf),
+                          unidades=paginas, unidade="páginas", max_repeticoes=3 if paginas >= 200 else None))
+        casos.append(Caso(f"extrair_tabelas/{paginas}p", lambda _, pdf=pdf: dossie.extrair_tabelas(pdf),
+                          unidades=paginas, unidade="páginas", max_repeticoes=3 if paginas >= 200 else None))
+
+    for socios in _tamanhos(TAMANHOS_SOCIOS, rapido):
+        def render(_, socios=socios):
+            return _saida_docx(_template_renderizado(socios).docx)
+        casos.append(Caso(f"render_template/{socios}socios", render, unidades=socios, unidade="sócios"))
+
+        # O que a aba de sócios faz com um CSV colado: leitura, CPFs formatados e conferidos, linhas para a fila.
+        def importar(csv_socios):
+            colunas = ler_socios_csv(csv_socios)
+            cpfs_invalidos(colunas['cpf'])
+            return socios_em_linhas(colunas)
+        casos.append(Caso(f"importar_socios/{socios}socios", importar, preparar=lambda socios=socios: _csv_socios(socios),
+                          unidades=socios, unidade="sócios"))
+
+    for paragrafos in _tamanhos(TAMANHOS_NOTAS, rapido):
+        notas = fixtures[f"notas_{paragrafos}"]
+
+        def inserir(doc, notas=notas):
+            dossie.insert_docx_at_placeholder(doc, '[[EXP_DEMONSTR]]', notas)
+            return _saida_docx(doc)
+        casos.append(Caso(f"insert_docx/{paragrafos}par", inserir, preparar=lambda: _template_renderizado().docx,
+                          unidades=paragrafos, unidade="parágrafos"))
+
+    for nome, (paginas_dre, paragrafos, socios) in CENARIOS.items():
+        if f"pdf_{paginas_dre}p" not in fixtures or f"notas_{paragrafos}" not in fixtures:
+            continue
+        for modo in ('imagem', 'tabela'):
+            input_data = _input_data(socios, fixtures, paginas_dre, paragrafos, modo_demonstracoes=modo)
+
+            def gerar(_, input_data=input_data):
+                file_data, erro = dossie.generate_document(input_data)
+                if erro:
+                    raise RuntimeError(erro)
+                return file_data
+            casos.append(Caso(f"generate_document/{nome}/{modo}", gerar, unidades=1, unidade="dossiês",
+                              max_repeticoes=3 if paginas_dre >= 200 else None))
+
+    if importlib.util.find_spec("websockets"):
+        casos += _casos_interface(rapido)
+
+    # Aquece o registro de templates: o primeiro carregamento não entra nas medições.
+    obter_registro().obter()
+    return casos
+
+
+# --- Execução e estatísticas ---
+
+def percentil(valores, p):
+    """Percentil pelo método nearest-rank."""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, -(-p * len(ordenados) // 100) - 1))
+    return ordenados[int(indice)]
+
+
+def _rodar_caso(pasta_fixtures, rapido, nome, repeticoes):
+    # Executado num processo novo por caso.
+    from medicoes import pico_rss_mb
+
+    fixtures = preparar_fixtures(pasta_fixtures, rapido)
+    caso = next(c for c in montar_casos(fixtures, rapido) if c.nome == nome)
+    repeticoes = min(repeticoes, caso.max_repeticoes or repeticoes)
+
+    tempos, tamanho = [], 0
+    try:
+        for _ in range(repeticoes):
+            estado = caso.preparar() if caso.preparar else None
+            inicio = time.perf_counter()
+            resultado = caso.executar(estado)
+            tempos.append(time.perf_counter() - inicio)
+            tamanho = _tamanho(resultado)
+        pico = caso.pico_rss_mb() if caso.pico_rss_mb else pico_rss_mb()
+    finally:
+        if caso.encerrar:
+            caso.encerrar()
+
+    return {
+        'repeticoes': repeticoes,
+        'p50': percentil(tempos, 50),
+        'p90': percentil(tempos, 90),
+        'p99': percentil(tempos, 99),
+        'vazao': caso.unidades / percentil(tempos, 50),
+        'unidade': caso.unidade,
+        'pico_rss_mb': pico,
+        'bytes_saida': tamanho,
+    }
+
+
+def _tamanho(resultado):
+    from medicoes import tamanho_bytes
+
+    if isinstance(resultado, list) and resultado and isinstance(resultado[0], tuple):
+        # extrair_tabelas: conta as células extraídas e as imagens das páginas sem texto.
+        return sum(
+            tamanho_bytes(imagem) + (sum(len(c) for linha in tabela.linhas for c in linha) if tabela else 0)
+            for tabela, imagem in filter(None, resultado)
+        )
+    return tamanho_bytes(resultado)
+
+
+def rodar(pasta_fixtures, rapido=False, repeticoes=5, filtro=None, ao_concluir=None):
+    """Roda os casos (cujo nome contém `filtro`, se informado). Retorna {nome: estatísticas}."""
+    fixtures = preparar_fixtures(pasta_fixtures, rapido)
+    nomes = [c.nome for c in montar_casos(fixtures, rapido) if not filtro or filtro in c.nome]
+
+    # Caches desligados nos processos dos casos: cada repetição rasteriza e monta de verdade.
+    os.environ.update({
+        "DOSSIE_CACHE_MEMORIA_MB": "0", "DOSSIE_CACHE_DIR": "",
+        "DOSSIE_CACHE_ETAPAS_MB": "0", "DOSSIE_CACHE_ETAPAS_DIR": "",
+        "DOSSIE_CACHE_MARKDOWN_MB": "0", "DOSSIE_CACHE_MARKDOWN_DIR": "",
+        "DOSSIE_LOG_MEDICOES": "",
+    })
+    resultados = {}
+    contexto = multiprocessing.get_context("spawn")
+    for nome in nomes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+            resultados[nome] = executor.submit(_rodar_caso, pasta_fixtures, rapido, nome, repeticoes).result()
+        if ao_concluir:
+            ao_concluir(nome, resultados[nome])
+    return resultados
+
+
+def comparar(resultados, baseline, tolerancias=None):
+    """Lista de regressões (mensagens) de `resultados` em relação à `baseline`."""
+    tolerancias = tolerancias or TOLERANCIAS_PADRAO
+    regressoes = []
+    for nome, atual in resultados.items():
+        referencia = baseline.get('casos', {}).get(nome)
+        if referencia is None:
+            continue
+        for metrica, margem in tolerancias.items():
+            if atual.get(metrica) is None or not referencia.get(metrica):
+                continue
+            limite = referencia[metrica] * (1 + margem)
+            if atual[metrica] > limite:
+                regressoes.append(
+                    f"{nome}: {metrica} {atual[metrica]:.4g} > {referencia[metrica]:.4g} "
+                    f"(+{atual[metrica] / referencia[metrica] - 1:.0%}, margem {margem:.0%})"
+                )
+    return regressoes
+
+
+def _linha(nome, r):
+    return (f"{nome:<40} p50 {r['p50']:7.3f}s  p90 {r['p90']:7.3f}s  p99 {r['p99']:7.3f}s  "
+            f"{r['vazao']:8.1f} {r['unidade']}/s  RSS {r['pico_rss_mb'] or 0:6.0f} MB  "
+            f"saída {r['bytes_saida'] / 1e6:7.2f} MB  (n={r['repeticoes']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do gerador de dossiês com fixtures sintéticas.")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "dossie_bench_fixtures"),
+                        help="Pasta das fixtures (geradas na primeira execução e reaproveitadas)")
+    parser.add_argument("--rapido", action="store_true", help="Sem os maiores tamanhos (200 páginas, 2.000 parágrafos, 5.000 sócios)")
+    parser.add_argument("-n", "--repeticoes", type=int, default=5, help="Repetições por caso (padrão: 5)")
+    parser.add_argument("-k", "--filtro", default=None, help="Só os casos cujo nome contém este texto")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO, help="Arquivo JSON da baseline")
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava os resultados como nova baseline")
+    parser.add_argument("--json", default=None, help="Grava os resultados neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    resultados = rodar(args.fixtures, rapido=args.rapido, repeticoes=args.repeticoes, filtro=args.filtro,
+                       ao_concluir=lambda nome, r: print(_linha(nome, r), flush=True))
+
+    registro = {
+        'maquina': f"{platform.node()} {platform.machine()} {os.cpu_count()} CPUs, Python {platform.python_version()}",
+        'data': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'casos': resultados,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(registro, f, indent=2, ensure_ascii=False)
+
+    if args.salvar_baseline:
+        baseline = {'casos': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        # Atualiza só os casos medidos agora (permite gravar com --filtro).
+        baseline.update({k: v for k, v in registro.items() if k != 'casos'})
+        baseline.setdefault('casos', {}).update(resultados)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline gravada em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSem baseline em {args.baseline}: rode com --salvar-baseline para criar.")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressoes = comparar(resultados, baseline)
+    if regressoes:
+        print(f"\n❌ {len(regressoes)} REGRESSÕES em relação à baseline ({baseline.get('data')}, {baseline.get('maquina')}):")
+        for mensagem in regressoes:
+            print(f"   {mensagem}")
+        return 1
+    print(f"\n✅ Sem regressões em relação à baseline ({baseline.get('data')}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Cache endereçado por conteúdo das páginas rasterizadas dos PDFs.
+#
+# A chave é (hash do PDF, página, DPI, formato), então gerar de novo o mesmo
+# balanço/DRE (ex.: após corrigir a razão social) não passa pelo PyMuPDF.
+# Há duas camadas, cada uma com limite de tamanho e despejo LRU:
+#   - memória: OrderedDict no processo;
+#   - disco: um arquivo por entrada, compartilhado entre processos (lote);
+#     o mtime do arquivo marca o último uso.
+
+PASTA_CACHE_PADRAO = os.environ.get(
+    "DOSSIE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dossie_cache_raster")
+)
+LIMITE_MEMORIA_PADRAO = int(os.environ.get("DOSSIE_CACHE_MEMORIA_MB", "256")) * 1024 * 1024
+LIMITE_DISCO_PADRAO = int(os.environ.get("DOSSIE_CACHE_DISCO_MB", "2048")) * 1024 * 1024
+
+
+def hash_conteudo(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+
+def chave_pagina(pdf_hash, pagina, dpi, formato):
+    return f"{pdf_hash}_{pagina}_{dpi}_{formato}"
+
+
+def chave_tabela(pdf_hash, pagina):
+    # Tabela extraída do texto da página (dossie.iterar_tabelas).
+    return f"{pdf_hash}_{pagina}_tabela"
+
+
+def chave_contagem(pdf_hash):
+    # Número de páginas do PDF, para que um acerto completo dispense abrir o arquivo.
+    return f"{pdf_hash}_paginas"
+
+
+class CacheRaster:
+    def __init__(self, limite_memoria=LIMITE_MEMORIA_PADRAO, pasta=PASTA_CACHE_PADRAO,
+                 limite_disco=LIMITE_DISCO_PADRAO):
+        self.limite_memoria = limite_memoria
+        self.pasta = pasta
+        self.limite_disco = limite_disco if pasta else 0
+
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._bytes_disco = None
+        self._lock = threading.Lock()
+
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+    # --- camada de memória ---
+
+    def _guardar_memoria(self, chave, dados):
+        if len(dados) > self.limite_memoria:
+            return
+        antigo = self._memoria.pop(chave, None)
+        if antigo is not None:
+            self._bytes_memoria -= len(antigo)
+        self._memoria[chave] = dados
+        self._bytes_memoria += len(dados)
+
+        while self._bytes_memoria > self.limite_memoria:
+            _, removido = self._memoria.popitem(last=False)
+            self._bytes_memoria -= len(removido)
+
+    # --- camada de disco ---
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, chave[:2], chave)
+
+    def _entradas_disco(self):
+        for raiz, _, arquivos in os.walk(self.pasta):
+            for nome in arquivos:
+                if nome.endswith(".tmp"):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    st = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield caminho, st.st_size, st.st_mtime
+
+    def _calcular_bytes_disco(self):
+        if self._bytes_disco is None:
+            self._bytes_disco = sum(tamanho for _, tamanho, _ in self._entradas_disco())
+        return self._bytes_disco
+
+    def _ler_disco(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as f:
+                dados = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return dados
+
+    def _guardar_disco(self, chave, dados):
+        if len(dados) > self.limite_disco:
+            return
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        # Escrita atômica: outro processo nunca lê um arquivo pela metade.
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+
+        self._bytes_disco = self._calcular_bytes_disco() + len(dados)
+        if self._bytes_disco > self.limite_disco:
+            self._despejar_disco()
+
+    def _despejar_disco(self):
+        # Recalcula pelo disco, pois outros processos também escrevem na pasta.
+        entradas = sorted(self._entradas_disco(), key=lambda e: e[2])
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for caminho, tamanho, _ in entradas:
+            if total <= self.limite_disco:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except FileNotFoundError:
+                pass
+        self._bytes_disco = total
+
+    # --- API ---
+
+    def contem(self, chave):
+        """Se a chave está no cache, sem ler o conteúdo nem contar acerto/falha."""
+        with self._lock:
+            if chave in self._memoria:
+                return True
+            return bool(self.pasta) and os.path.exists(self._caminho(chave))
+
+    def get(self, chave, contar=True):
+        """Conteúdo da chave, ou None. Com contar=False a consulta não entra nos
+        acertos/falhas, que servem para dimensionar o cache das páginas (ex.: a
+        contagem de páginas de um PDF)."""
+        with self._lock:
+            dados = self._memoria.get(chave)
+            if dados is not None:
+                self._memoria.move_to_end(chave)
+                self.hits_memoria += contar
+                return dados
+
+        dados = self._ler_disco(chave) if self.pasta else None
+
+        with self._lock:
+            if dados is None:
+                self.misses += contar
+                return None
+            self.hits_disco += contar
+            self._guardar_memoria(chave, dados)
+            return dados
+
+    def put(self, chave, dados):
+        with self._lock:
+            self._guardar_memoria(chave, dados)
+            if self.pasta:
+                try:
+                    self._guardar_disco(chave, dados)
+                except OSError:
+                    # Disco cheio/sem permissão: o cache em disco é só uma otimização.
+                    pass
+
+    def limpar(self):
+        with self._lock:
+            self._memoria.clear()
+            self._bytes_memoria = 0
+            if self.pasta:
+                for caminho, _, _ in list(self._entradas_disco()):
+                    try:
+                        os.remove(caminho)
+                    except FileNotFoundError:
+                        pass
+                self._bytes_disco = 0
+
+    def contadores(self):
+        """Acertos e falhas até agora, sem o custo de medir o disco (para tirar a diferença)."""
+        with self._lock:
+            return {'hits_memoria': self.hits_memoria, 'hits_disco': self.hits_disco, 'misses': self.misses}
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits_memoria + self.hits_disco + self.misses
+            return {
+                'hits_memoria': self.hits_memoria,
+                'hits_disco': self.hits_disco,
+                'misses': self.misses,
+                'taxa_acerto': (self.hits_memoria + self.hits_disco) / consultas if consultas else 0.0,
+                'entradas_memoria': len(self._memoria),
+                'bytes_memoria': self._bytes_memoria,
+                'limite_memoria': self.limite_memoria,
+                'bytes_disco': self._calcular_bytes_disco() if self.pasta else 0,
+                'limite_disco': self.limite_disco,
+            }
+
+
+_cache_padrao = None
+
+
+def obter_cache():
+    """Cache compartilhado pelo processo (configurado pelas variáveis DOSSIE_CACHE_*)."""
+    global _cache_padrao
+    if _cache_padrao is None:
+        _cache_padrao = CacheRaster()
+    return _cache_padrao
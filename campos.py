@@ -0,0 +1,291 @@
+import csv
+import datetime
+import json
+import re
+
+# Campos, constantes, formatações e validação de CNPJ/CPF do dossiê, sem
+# dependências pesadas.
+#
+# A interface importa daqui, e não de dossie.py, para não carregar PyMuPDF,
+# python-docx e docxtpl na abertura da página: essas bibliotecas só entram
+# na primeira geração (nos processos da fila). dossie.py reexporta os nomes
+# que antes eram importados de lá.
+#
+# Na interface, os sócios ficam em colunas ({'nome': [...], 'cpf': [...],
+# 'cargo': [...]}), o formato da grade de edição: importar um CSV com
+# milhares de linhas ou formatar todos os CPFs é uma operação por coluna, e
+# não um widget por sócio. A fila, o lote e o template continuam recebendo a
+# lista de {nome, cpf, cargo} (socios_em_linhas).
+
+ARQUIVOS_OBRIGATORIOS = [
+    'balanco_file', 'demstr_result_file',
+    'explic_demonstr_file', 'carta_responsb_file'
+]
+
+# Notas e carta: DOCX ou Markdown (convertido em dossie.preparar_uploads).
+ARQUIVOS_TEXTO = ['explic_demonstr_file', 'carta_responsb_file']
+
+# 'imagem': páginas rasterizadas (padrão); 'tabela': tabelas nativas do Word
+# extraídas do texto do PDF, rasterizando só as páginas em que a extração falha.
+MODOS_DEMONSTRACOES = ('imagem', 'tabela')
+
+# Etapas informadas ao callback `progresso` de gerar_dossie. Template,
+# balanço, DRE, notas e carta rodam ao mesmo tempo; o progresso informa a
+# primeira etapa, nesta ordem, que ainda não terminou. 'otimizando' só
+# acontece com a opção otimizar_docx.
+ETAPAS = {
+    'uploads': "Lendo e validando os arquivos",
+    'template': "Preenchendo o template",
+    'balanco': "Balanço patrimonial",
+    'dre': "Demonstração do resultado",
+    'notas': "Notas explicativas",
+    'carta': "Carta de responsabilidade",
+    'finalizando': "Montando o dossiê",
+    'otimizando': "Otimizando o arquivo",
+}
+
+FORMATOS_SAIDA = {
+    'docx': "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    'pdf': "application/pdf",
+}
+
+# Barras, caracteres proibidos no Windows e de controle: a razão social vira nome de arquivo.
+_FORA_DO_NOME = re.compile(r'[\x00-\x1f<>:"/\\|?*]+')
+
+
+def nome_arquivo_dossie(nome_empresa, formato='docx'):
+    """Nome do arquivo do dossiê, sem nada do nome da empresa que saia da pasta de destino."""
+    nome = _FORA_DO_NOME.sub("_", str(nome_empresa or "")).strip(" .")
+    return f"Dossie_Contabil_{nome or 'empresa'}.{formato or 'docx'}"
+
+
+def nome_saida_empresa(input_data):
+    """Arquivo de saída de uma empresa do lote: o `arquivo_saida` do manifesto ou o nome padrão."""
+    if input_data.get('arquivo_saida'):
+        return input_data['arquivo_saida']
+    return nome_arquivo_dossie(input_data.get('nome_empresa'), input_data.get('formato_saida'))
+
+
+def clean_numbers(text):
+    return "".join(filter(str.isdigit, str(text)))
+
+def format_cnpj(cnpj):
+    cnpj = clean_numbers(cnpj)
+    if len(cnpj) == 14:
+        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+    return cnpj
+
+def format_cpf(cpf):
+    cpf = clean_numbers(cpf)
+    if len(cpf) == 11:
+        return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+    return cpf
+
+def _digito_verificador(numeros, pesos):
+    resto = sum(int(n) * p for n, p in zip(numeros, pesos)) % 11
+    return "0" if resto < 2 else str(11 - resto)
+
+def cnpj_valido(cnpj):
+    """14 dígitos com os dois dígitos verificadores corretos (pontuação ignorada)."""
+    cnpj = clean_numbers(cnpj)
+    if len(cnpj) != 14 or len(set(cnpj)) == 1:
+        return False
+    pesos = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    dv1 = _digito_verificador(cnpj[:12], pesos[1:])
+    dv2 = _digito_verificador(cnpj[:12] + dv1, pesos)
+    return cnpj[12:] == dv1 + dv2
+
+def digitos_cpf(base):
+    """Os dois dígitos verificadores dos 9 primeiros dígitos do CPF."""
+    dv1 = _digito_verificador(base, range(10, 1, -1))
+    return dv1 + _digito_verificador(base + dv1, range(11, 1, -1))
+
+def cpf_valido(cpf):
+    """11 dígitos com os dois dígitos verificadores corretos (pontuação ignorada)."""
+    cpf = clean_numbers(cpf)
+    if len(cpf) != 11 or len(set(cpf)) == 1:
+        return False
+    return cpf[9:] == digitos_cpf(cpf[:9])
+
+def _data(valor):
+    # datetime.date ou texto AAAA-MM-DD (manifesto, serviço HTTP); None se não for uma data.
+    if isinstance(valor, datetime.date):
+        return valor
+    try:
+        return datetime.date.fromisoformat(str(valor).strip())
+    except ValueError:
+        return None
+
+def validar_datas(input_data):
+    """Erros de data_inicio/data_fim, quando informadas: AAAA-MM-DD e início até o fim."""
+    erros, datas = [], {}
+    for chave, rotulo in (('data_inicio', "início"), ('data_fim', "fim")):
+        valor = input_data.get(chave)
+        if valor is None or valor == "":
+            continue
+        datas[chave] = _data(valor)
+        if datas[chave] is None:
+            erros.append(f"Data de {rotulo} inválida: '{valor}' (use AAAA-MM-DD).")
+    if datas.get('data_inicio') and datas.get('data_fim') and datas['data_inicio'] > datas['data_fim']:
+        erros.append(f"Período inválido: a data de início ({datas['data_inicio']:%d/%m/%Y}) "
+                     f"é posterior à de fim ({datas['data_fim']:%d/%m/%Y}).")
+    return erros
+
+def validar_campos(input_data):
+    """Erros de CNPJ, CPFs dos sócios (dígitos verificadores) e datas do período. CPF em branco é aceito."""
+    erros = validar_datas(input_data)
+    if not cnpj_valido(input_data.get('cnpj_empresa', '')):
+        erros.append(f"CNPJ inválido: '{input_data.get('cnpj_empresa', '')}'.")
+    for i, socio in enumerate(input_data.get('socios') or [], 1):
+        cpf = socio.get('cpf') or ''
+        if clean_numbers(cpf) and not cpf_valido(cpf):
+            erros.append(f"CPF do sócio {i} ({socio.get('nome') or 'sem nome'}) inválido: '{cpf}'.")
+    return erros
+
+meses_pt = {
+    1:"Janeiro", 2:"Fevereiro", 3:"Março", 4:"Abril",
+    5:"Maio", 6:"Junho", 7:"Julho", 8:"Agosto",
+    9:"Setembro", 10:"Outubro",11:"Novembro",12:"Dezembro"
+}
+
+def periodos_from_datas(data_inicio, data_fim):
+    """Calcula periodo_em_data, periodo_anual e data_dem_encerradas a partir das datas."""
+    mes_inicio_curto = str(data_inicio.month).zfill(2)
+    ano_inicio_curto = str(data_inicio.year)[-2:]
+    mes_fim_curto = str(data_fim.month).zfill(2)
+    ano_fim_curto = str(data_fim.year)[-2:]
+
+    if data_inicio.year != data_fim.year:
+        periodo_em_data = f"{mes_inicio_curto}/{ano_inicio_curto} a {mes_fim_curto}/{ano_fim_curto}"
+    else:
+        periodo_em_data = f"{mes_inicio_curto} a {mes_fim_curto}/{ano_fim_curto}"
+
+    mes_desc_inicio = meses_pt.get(data_inicio.month)
+    mes_desc_fim = meses_pt.get(data_fim.month)
+
+    if data_inicio.year == data_fim.year:
+        periodo_anual = f"{mes_desc_inicio} a {mes_desc_fim} de {data_inicio.year}"
+    else:
+        periodo_anual = f"{mes_desc_inicio} de {data_inicio.year} a {mes_desc_fim} de {data_fim.year}"
+
+    return {
+        'periodo_em_data': periodo_em_data,
+        'periodo_anual': periodo_anual,
+        'data_dem_encerradas': data_fim.strftime("%d/%m/%Y"),
+    }
+
+def data_atual_formatada():
+    data_e_hora_atual = datetime.datetime.now()
+    dia = data_e_hora_atual.day
+    mes = meses_pt[data_e_hora_atual.month]
+    ano = data_e_hora_atual.year
+    return f"{dia} de {mes} de {ano}"
+
+def parse_socios(valor):
+    """Sócios como lista de {nome, cpf, cargo}: lista, JSON ou "Nome;CPF;Cargo|Nome;CPF;Cargo"."""
+    if not valor:
+        return []
+    if isinstance(valor, list):
+        return valor
+    valor = valor.strip()
+    if valor.startswith("["):
+        return json.loads(valor)
+
+    socios = []
+    for item in valor.split("|"):
+        partes = [p.strip() for p in item.split(";")] + ["", "", ""]
+        socios.append({"nome": partes[0], "cpf": partes[1], "cargo": partes[2]})
+    return socios
+
+COLUNAS_SOCIOS = ('nome', 'cpf', 'cargo')
+
+# Cabeçalhos aceitos na importação de sócios, além dos próprios nomes das colunas.
+_CABECALHOS_SOCIOS = {
+    'nome': 'nome', 'socio': 'nome', 'sócio': 'nome', 'nome do socio': 'nome', 'nome do sócio': 'nome',
+    'cpf': 'cpf', 'cpf do socio': 'cpf', 'cpf do sócio': 'cpf',
+    'cargo': 'cargo', 'funcao': 'cargo', 'função': 'cargo', 'qualificacao': 'cargo', 'qualificação': 'cargo',
+}
+
+_NAO_DIGITO = re.compile(r"[^0-9\x00]")
+
+def socios_em_colunas(socios):
+    """Lista de {nome, cpf, cargo} -> {'nome': [...], 'cpf': [...], 'cargo': [...]}."""
+    return {c: [str(s.get(c) or '') for s in socios] for c in COLUNAS_SOCIOS}
+
+def socios_em_linhas(colunas):
+    """Colunas de sócios -> lista de {nome, cpf, cargo}, sem as linhas totalmente em branco."""
+    linhas = zip(*([str(v or '').strip() for v in colunas.get(c) or []] for c in COLUNAS_SOCIOS))
+    return [dict(zip(COLUNAS_SOCIOS, linha)) for linha in linhas if any(linha)]
+
+def normalizar_cpfs(cpfs):
+    """Formata uma coluna inteira de CPFs (uma passada de regex para todos)."""
+    cpfs = [str(c or '').replace("\x00", "") for c in cpfs]
+    if not cpfs:
+        return []
+    limpos = _NAO_DIGITO.sub("", "\x00".join(cpfs)).split("\x00")
+    return [f"{c[:3]}.{c[3:6]}.{c[6:9]}-{c[9:]}" if len(c) == 11 else c for c in limpos]
+
+def cpfs_invalidos(cpfs):
+    """Posições dos CPFs preenchidos com dígitos verificadores errados."""
+    return [i for i, cpf in enumerate(cpfs) if clean_numbers(cpf) and not cpf_valido(cpf)]
+
+def ler_socios_csv(conteudo):
+    """Sócios de um CSV ou de linhas coladas da planilha, em colunas com os CPFs formatados.
+
+    Uma linha por sócio (nome, CPF, cargo), separada por tabulação, ";", "|" ou ",".
+    Com cabeçalho (nome/cpf/cargo), as colunas podem vir em qualquer ordem.
+    """
+    if isinstance(conteudo, bytes):
+        try:
+            conteudo = conteudo.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            # CSV exportado pelo Excel em português.
+            conteudo = conteudo.decode("cp1252", errors="replace")
+    linhas = [linha for linha in conteudo.splitlines() if linha.strip()]
+    if not linhas:
+        return socios_em_colunas([])
+
+    separador = next((s for s in "\t;|" if s in linhas[0]), ",")
+    registros = list(csv.reader(linhas, delimiter=separador))
+    cabecalho = [_CABECALHOS_SOCIOS.get(c.strip().lower()) for c in registros[0]]
+    if 'nome' in cabecalho or 'cpf' in cabecalho:
+        posicoes = {c: cabecalho.index(c) if c in cabecalho else None for c in COLUNAS_SOCIOS}
+        registros = registros[1:]
+    else:
+        posicoes = {c: i for i, c in enumerate(COLUNAS_SOCIOS)}
+
+    colunas = {
+        c: [r[i].strip() if i is not None and i < len(r) else '' for r in registros]
+        for c, i in posicoes.items()
+    }
+    colunas['cpf'] = normalizar_cpfs(colunas['cpf'])
+    return colunas
+
+def marcado(valor):
+    """Opção sim/não vinda de CSV, JSON ou formulário ("1", "sim", "true", True...)."""
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("1", "s", "sim", "true", "yes", "on")
+    return bool(valor)
+
+def normalizar_campos(bruta):
+    """Formata CNPJ e CPFs e calcula os períodos a partir de data_inicio/data_fim (AAAA-MM-DD).
+
+    Usado pelo manifesto da geração em lote e pelo serviço HTTP. Os uploads ficam com quem chama.
+    """
+    empresa = dict(bruta)
+
+    empresa['cnpj_empresa'] = format_cnpj(empresa.get('cnpj_empresa', ''))
+    empresa['socios'] = [
+        {"nome": s.get("nome", ""), "cpf": format_cpf(s.get("cpf", "")), "cargo": s.get("cargo", "")}
+        for s in parse_socios(empresa.get('socios'))
+    ]
+
+    if 'otimizar_docx' in empresa:
+        empresa['otimizar_docx'] = marcado(empresa['otimizar_docx'])
+
+    # Datas inválidas não derrubam o manifesto inteiro: validar_campos as aponta na empresa.
+    if empresa.get('data_inicio') and empresa.get('data_fim') and not validar_datas(empresa):
+        periodos = periodos_from_datas(_data(empresa['data_inicio']), _data(empresa['data_fim']))
+        for chave, valor in periodos.items():
+            empresa.setdefault(chave, valor)
+    return empresa
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_dossie import percentil, preparar_fixtures
+
+# Teste de carga do servico_http.py: envia N pedidos de geração com C
+# conexões simultâneas e informa pedidos/s, latência p50/p95/p99 e quantos
+# voltaram 429 (backpressure).
+#
+#   python carga_servico.py --subir -n 40 -c 8        # sobe uma instância local e mede
+#   python carga_servico.py --url http://127.0.0.1:8765 -n 100 -c 16
+#
+# Usa as fixtures sintéticas do benchmark_dossie.py. Cada pedido tem um nome
+# de empresa diferente, para o serviço montar o dossiê de verdade; as páginas
+# rasterizadas e as notas convertidas continuam vindo dos caches do servidor
+# (desligue-os no processo do serviço, como no benchmark, para medir sem eles).
+
+
+def _multipart(campos, arquivos):
+    """Corpo multipart/form-data. Retorna (corpo, content_type)."""
+    fronteira = uuid.uuid4().hex
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+        )
+    for nome, caminho in arquivos.items():
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"; '
+            f'filename="{os.path.basename(caminho)}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+            + dados + b"\r\n"
+        )
+    partes.append(f"--{fronteira}--\r\n".encode())
+    return b"".join(partes), f"multipart/form-data; boundary={fronteira}"
+
+
+def _arquivos(fixtures, paginas_dre):
+    return {
+        'balanco_file': fixtures["pdf_2p"],
+        'demstr_result_file': fixtures[f"pdf_{paginas_dre}p"],
+        'explic_demonstr_file': fixtures["notas_10"],
+        'carta_responsb_file': fixtures["notas_10"],
+    }
+
+
+def _campos(i, variar):
+    return {
+        'nome_empresa': f"Empresa Carga {i}" if variar else "Empresa Carga",
+        'razao_social_empresa': "EMPRESA CARGA LTDA",
+        'cnpj_empresa': "11222333000181",
+        'data_inicio': "2024-01-01",
+        'data_fim': "2024-12-31",
+        'socios': "Sócio Sintético;11144477735;Administrador",
+    }
+
+
+def _enviar(url, corpo, content_type, timeout):
+    pedido = urllib.request.Request(f"{url}/dossies", data=corpo, method="POST",
+                                    headers={'Content-Type': content_type})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=timeout) as resposta:
+            status, tamanho = resposta.status, len(resposta.read())
+    except urllib.error.HTTPError as e:
+        status, tamanho = e.code, len(e.read())
+    except OSError:
+        status, tamanho = None, 0
+    return status, time.perf_counter() - inicio, tamanho
+
+
+def rodar_carga(url, fixtures, pedidos=20, concorrencia=4, paginas_dre=2, variar=True, timeout=600):
+    """Envia os pedidos e retorna as estatísticas (latências só dos pedidos com 200)."""
+    arquivos = _arquivos(fixtures, paginas_dre)
+    corpos = [_multipart(_campos(i, variar), arquivos) for i in range(pedidos)]
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(lambda c: _enviar(url, *c, timeout), corpos))
+    total = time.perf_counter() - inicio
+
+    latencias = [segundos for status, segundos, _ in resultados if status == 200]
+    codigos = {}
+    for status, _, _ in resultados:
+        codigos[str(status)] = codigos.get(str(status), 0) + 1
+    return {
+        'pedidos': pedidos,
+        'concorrencia': concorrencia,
+        'codigos': codigos,
+        'pedidos_por_segundo': len(latencias) / total if total else 0.0,
+        'p50': percentil(latencias, 50) if latencias else None,
+        'p95': percentil(latencias, 95) if latencias else None,
+        'p99': percentil(latencias, 99) if latencias else None,
+        'bytes_medio': sum(t for s, _, t in resultados if s == 200) / len(latencias) if latencias else 0,
+        'segundos': total,
+    }
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def subir_servico(workers=None, max_pedidos=None, espera=60):
+    """Sobe o servico_http.py num processo à parte. Retorna (processo, url) quando ele responde."""
+    porta = _porta_livre()
+    comando = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "servico_http.py"),
+               "--porta", str(porta)]
+    if workers:
+        comando += ["--workers", str(workers)]
+    if max_pedidos:
+        comando += ["--max-pedidos", str(max_pedidos)]
+    processo = subprocess.Popen(comando)
+    url = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O serviço terminou com código {processo.returncode}.")
+        try:
+            # Só responde depois do aquecimento dos workers.
+            with urllib.request.urlopen(f"{url}/saude", timeout=1):
+                return processo, url
+        except OSError:
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("O serviço não respondeu a tempo.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do serviço HTTP de dossiês.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="Instância já em execução")
+    parser.add_argument("--subir", action="store_true", help="Sobe uma instância local numa porta livre")
+    parser.add_argument("--workers", type=int, default=None, help="Workers da instância (--subir)")
+    parser.add_argument("--max-pedidos", type=int, default=None, help="Limite de pedidos da instância (--subir)")
+    parser.add_argument("-n", "--pedidos", type=int, default=20)
+    parser.add_argument("-c", "--concorrencia", type=int, default=4)
+    parser.add_argument("--paginas", type=int, choices=(2, 20, 200), default=2, help="Páginas da DRE")
+    parser.add_argument("--mesmo-nome", action="store_true",
+                        help="Todos os pedidos iguais (mede o caminho do cache de dossiês prontos)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "dossie_bench_fixtures"))
+    parser.add_argument("--json", default=None, help="Grava as estatísticas neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    fixtures = preparar_fixtures(args.fixtures, rapido=args.paginas != 200)
+    processo = None
+    url = args.url
+    if args.subir:
+        processo, url = subir_servico(args.workers, args.max_pedidos)
+    try:
+        r = rodar_carga(url, fixtures, args.pedidos, args.concorrencia, args.paginas, not args.mesmo_nome)
+    finally:
+        if processo:
+            processo.terminate()
+            processo.wait()
+
+    print(f"{r['pedidos']} pedidos, {r['concorrencia']} simultâneos, {r['segundos']:.1f} s  códigos {r['codigos']}")
+    if r['p50'] is not None:
+        print(f"{r['pedidos_por_segundo']:.2f} pedidos/s  p50 {r['p50']:.3f}s  p95 {r['p95']:.3f}s  "
+              f"p99 {r['p99']:.3f}s  saída média {r['bytes_medio'] / 1e6:.2f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(r, f, indent=2, ensure_ascii=False)
+    return 0 if r['codigos'].get('200') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,748 @@
+import copy
+import os
+import pickle
+import re
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from docx.shared import Inches, Pt
+from io import BytesIO
+from xml.sax.saxutils import escape
+import fitz
+
+from campos import (
+    ARQUIVOS_OBRIGATORIOS, ARQUIVOS_TEXTO, COLUNAS_SOCIOS, ETAPAS, FORMATOS_SAIDA, MODOS_DEMONSTRACOES,
+    clean_numbers, data_atual_formatada, format_cnpj, format_cpf, meses_pt, periodos_from_datas
+)
+from cache_raster import chave_contagem, chave_pagina, chave_tabela, hash_conteudo, obter_cache
+from etapas import Antecipador, executar_etapas, impressao, obter_cache_etapas
+from extracao_tabelas import extrair_tabela
+from markdown_docx import converter_uploads
+from medicoes import Medidor, gravar_log, tamanho_bytes
+from mesclar_docx import MescladorDocx
+from otimizar_docx import otimizar_docx
+from perfis_raster import (
+    LARGURA_IMAGEM_POL, TRAVA_FITZ, abrir_pdf, fechar_pdf, obter_perfil, pdf_aberto, renderizar_pagina_de
+)
+from registro_templates import CAMINHO_TEMPLETE, obter_registro
+from validacao import validar_entrada
+
+# Núcleo da geração do dossiê, sem dependência do Streamlit: usado pela
+# interface (app_gerador.py, pela fila) e pela geração em lote (gerar_lote.py).
+# Campos e constantes ficam em campos.py, mais leve, e são reexportados aqui.
+
+# Marcadores das duas páginas do balanço no template; o conteúdo (imagens
+# ou tabelas) entra depois do render, como o da DRE.
+MARCADOR_BALANCO_PT1 = '[[BALANCO_PT1]]'
+MARCADOR_BALANCO_PT2 = '[[BALANCO_PT2]]'
+
+ERRO_BALANCO_CURTO = "Erro: O arquivo 'Balanco Patrimonial' (PDF) deve ter pelo menos 2 páginas."
+
+def avisar_etapa(progresso, etapa):
+    if progresso is not None:
+        progresso(etapa)
+
+def _ler_pdf(pdf):
+    if isinstance(pdf, (bytes, bytearray)):
+        return bytes(pdf)
+    with open(pdf, "rb") as f:
+        return f.read()
+
+# Processos usados para rasterizar PDFs longos (padrão: núcleos da máquina).
+# Na geração em lote o paralelismo já é por empresa, então lá fica em 1.
+RASTER_WORKERS = int(os.environ.get("DOSSIE_RASTER_WORKERS", "0")) or os.cpu_count() or 1
+# Abaixo desse número de páginas a rasterizar, o custo de despachar para o
+# pool supera o ganho e a renderização é feita no próprio processo.
+MIN_PAGINAS_PARALELO = 4
+
+_pool_raster = None
+_pool_raster_workers = 0
+_pool_raster_lock = threading.Lock()
+
+def _obter_pool_raster(workers):
+    global _pool_raster, _pool_raster_workers
+    # Balanço e DRE rasterizam em threads paralelas: o pool é criado uma vez só.
+    with _pool_raster_lock:
+        if _pool_raster is None or _pool_raster_workers != workers:
+            if _pool_raster is not None:
+                _pool_raster.shutdown(wait=False)
+            # spawn: o processo do Streamlit tem várias threads, e fork nesse estado não é seguro.
+            _pool_raster = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_raster_workers = workers
+        return _pool_raster
+
+# Teto de memória do trabalho de rasterização: páginas já codificadas
+# esperando para entrar no documento mais as que estão sendo processadas no
+# pool. Não inclui as imagens que já entraram no documento (são a própria
+# saída) nem o cache de raster, que tem limite próprio.
+LIMITE_MEMORIA_RASTER = int(os.environ.get("DOSSIE_RASTER_MEMORIA_MB", "64")) * 1024 * 1024
+# Páginas por tarefa enviada ao pool: lotes pequenos mantêm o resultado em
+# trânsito pequeno, sem pagar o despacho por página.
+MAX_PAGINAS_LOTE = 8
+
+def _gerar_paginas(doc, paginas, perfil):
+    for i in paginas:
+        imagem = renderizar_pagina_de(doc, i, perfil)
+        # Libera o que o MuPDF guardou da página (imagens decodificadas, em PDFs digitalizados).
+        with TRAVA_FITZ:
+            fitz.TOOLS.store_shrink(100)
+        yield imagem
+
+def _renderizar_paginas(memoria, paginas, perfil):
+    # Executado em cada worker: lê o PDF da memória compartilhada (nome, tamanho)
+    # e renderiza o trecho.
+    nome, tamanho = memoria
+    bloco = shared_memory.SharedMemory(name=nome)
+    try:
+        dados = bytes(bloco.buf[:tamanho])
+    finally:
+        bloco.close()
+    with pdf_aberto(dados) as doc:
+        return list(_gerar_paginas(doc, paginas, perfil))
+
+def _dividir(itens, partes):
+    tamanho = -(-len(itens) // partes)
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+def _paginas_em_paralelo(memoria, faltando, perfil, workers, limite_memoria):
+    """Gera as páginas `faltando` em ordem, renderizadas no pool com poucos lotes em trânsito."""
+    tamanho_lote = max(1, min(-(-len(faltando) // workers), MAX_PAGINAS_LOTE))
+    lotes = [faltando[i:i + tamanho_lote] for i in range(0, len(faltando), tamanho_lote)]
+    pool = _obter_pool_raster(workers)
+
+    em_voo = []
+    proximo = 0
+    janela = workers
+    bytes_vistos = paginas_vistas = 0
+    try:
+        while proximo < len(lotes) or em_voo:
+            while proximo < len(lotes) and len(em_voo) < janela:
+                em_voo.append(pool.submit(_renderizar_paginas, memoria, lotes[proximo], perfil))
+                proximo += 1
+            imagens = em_voo.pop(0).result()
+
+            # Ajusta quantos lotes ficam em trânsito pelo tamanho médio das páginas já vistas.
+            bytes_vistos += sum(map(len, imagens))
+            paginas_vistas += len(imagens)
+            bytes_lote = bytes_vistos / paginas_vistas * tamanho_lote
+            janela = max(1, min(workers, int(limite_memoria // max(bytes_lote, 1))))
+
+            while imagens:
+                yield imagens.pop(0)
+    finally:
+        for futuro in em_voo:
+            futuro.cancel()
+        # Os lotes já em execução ainda leem a memória compartilhada: quem chama só a libera depois.
+        wait(em_voo)
+
+def iterar_paginas_raster(pdf, paginas=None, perfil=None, cache=None, workers=None, limite_memoria=None):
+    """Rasteriza as páginas indicadas (todas, se None), uma a uma, passando pelo cache.
+
+    Gerador: cada página é renderizada, codificada e entregue antes da
+    próxima, então quem insere no documento à medida que recebe nunca tem o
+    PDF inteiro em memória. `perfil` é um nome de perfis_raster.PERFIS
+    (padrão 'print') ou um PerfilRaster. Páginas inexistentes geram None.
+    Com muitas páginas faltando no cache, elas vão para `workers` processos
+    em lotes, com no máximo `limite_memoria` bytes (LIMITE_MEMORIA_RASTER)
+    de páginas em trânsito; os workers leem o PDF de um bloco de memória
+    compartilhada, sem arquivo temporário. O PDF é fechado ao fim, ou quando
+    o gerador é fechado antes disso.
+    """
+    cache = cache or obter_cache()
+    workers = workers or RASTER_WORKERS
+    limite_memoria = limite_memoria or LIMITE_MEMORIA_RASTER
+    perfil = obter_perfil(perfil)
+    # O DPI de cada página deriva do perfil, então o perfil identifica a resolução na chave.
+    dpi, formato = perfil.ppi or perfil.dpi_fixo, perfil.nome
+    dados = _ler_pdf(pdf)
+    pdf_hash = hash_conteudo(dados)
+
+    contagem = cache.get(chave_contagem(pdf_hash), contar=False)
+    if contagem is None:
+        with pdf_aberto(dados) as doc, TRAVA_FITZ:
+            num_paginas = len(doc)
+        cache.put(chave_contagem(pdf_hash), str(num_paginas).encode())
+    else:
+        num_paginas = int(contagem)
+
+    paginas = list(range(num_paginas) if paginas is None else paginas)
+    # Planeja o que renderizar sem ler o cache (ler traria todas as páginas para a memória).
+    # As faltantes ficam na ordem em que serão entregues.
+    faltando = []
+    for i in paginas:
+        if i < num_paginas and i not in faltando and not cache.contem(chave_pagina(pdf_hash, i, dpi, formato)):
+            faltando.append(i)
+    pendentes = set(faltando)
+
+    doc = memoria = renderizadas = None
+    try:
+        if workers > 1 and len(faltando) >= MIN_PAGINAS_PARALELO:
+            # O PDF vai uma vez para a memória compartilhada, e não pelo pipe
+            # do pool a cada lote nem por um arquivo temporário.
+            memoria = shared_memory.SharedMemory(create=True, size=len(dados))
+            memoria.buf[:len(dados)] = dados
+            renderizadas = _paginas_em_paralelo((memoria.name, len(dados)), faltando, perfil, workers, limite_memoria)
+        elif faltando:
+            doc = abrir_pdf(dados)
+            renderizadas = _gerar_paginas(doc, faltando, perfil)
+
+        for i in paginas:
+            if i >= num_paginas:
+                yield None
+                continue
+            chave = chave_pagina(pdf_hash, i, dpi, formato)
+            img_bytes = cache.get(chave)
+            if i in pendentes:
+                pendentes.discard(i)
+                renderizada = next(renderizadas)
+                if img_bytes is None:
+                    img_bytes = renderizada
+                    cache.put(chave, img_bytes)
+            elif img_bytes is None:
+                # Estava no cache no planejamento, mas foi despejada desde então.
+                doc = doc or abrir_pdf(dados)
+                img_bytes = renderizar_pagina_de(doc, i, perfil)
+                cache.put(chave, img_bytes)
+            yield img_bytes
+    finally:
+        if renderizadas is not None:
+            renderizadas.close()
+        if doc is not None:
+            fechar_pdf(doc)
+        if memoria is not None:
+            memoria.close()
+            memoria.unlink()
+
+def rasterizar_paginas(pdf, paginas=None, perfil=None, cache=None, workers=None):
+    """Como iterar_paginas_raster, mas retorna a lista com todas as páginas."""
+    return list(iterar_paginas_raster(pdf, paginas=paginas, perfil=perfil, cache=cache, workers=workers))
+
+def pdf_balanco_duas_paginas(pdf_path, perfil=None):
+    return rasterizar_paginas(pdf_path, paginas=range(2), perfil=perfil)
+
+def pdf_to_images(pdf_path, workers=None, perfil=None):
+    return rasterizar_paginas(pdf_path, perfil=perfil, workers=workers)
+
+# --- Marcadores [[...]] ---
+#
+# O documento renderizado é percorrido uma única vez (corpo, células de
+# tabela, cabeçalhos e rodapés) para montar o índice marcador -> parágrafos.
+# Todas as substituições são feitas em lote contra esse índice, em vez de
+# uma varredura de main_doc.paragraphs por marcador.
+
+_MARCADOR = re.compile(r"\[\[[A-Z0-9_]+\]\]")
+
+class _Origem:
+    # Pai mínimo para os Paragraph de cabeçalho/rodapé: o python-docx só
+    # precisa de .part para inserir imagens na parte certa.
+    def __init__(self, part):
+        self.part = part
+
+def _partes_cabecalho_rodape(main_doc):
+    vistas = set()
+    for rel in main_doc.part.rels.values():
+        if rel.is_external or rel.reltype not in (RT.HEADER, RT.FOOTER):
+            continue
+        if rel.target_part.partname not in vistas:
+            vistas.add(rel.target_part.partname)
+            yield rel.target_part
+
+def indexar_marcadores(main_doc):
+    """Retorna {marcador: [Paragraph, ...]} em uma única passada pelo documento."""
+    indice = {}
+    origens = [(main_doc.element.body, main_doc._body)]
+    origens += [(part.element, _Origem(part)) for part in _partes_cabecalho_rodape(main_doc)]
+
+    for raiz, pai in origens:
+        for p in raiz.iter(qn('w:p')):
+            if "[[" not in "".join(t.text or "" for t in p.iter(qn('w:t'))):
+                continue
+            # Só o texto do próprio parágrafo: o de uma caixa de texto dentro
+            # dele é indexado no parágrafo aninhado. Cada parágrafo entra uma
+            # vez por marcador, mesmo com o marcador repetido.
+            texto = "".join(t.text or "" for t in _textos_proprios(p))
+            for marcador in dict.fromkeys(_MARCADOR.findall(texto)):
+                indice.setdefault(marcador, []).append(Paragraph(p, pai))
+    return indice
+
+def _textos_proprios(p):
+    # w:t do parágrafo, sem os dos parágrafos aninhados (w:txbxContent).
+    return [t for t in p.iter(qn('w:t')) if next(t.iterancestors(qn('w:p'))) is p]
+
+def _remover_marcador(p, marcador):
+    # Tira o marcador só dos w:t em que ele está (pode estar partido entre
+    # runs), sem refazer os runs: formatação e o que ações anteriores já
+    # inseriram no parágrafo ficam onde estão.
+    nos = _textos_proprios(p)
+    texto = "".join(t.text or "" for t in nos)
+    inicios = [m.start() for m in re.finditer(re.escape(marcador), texto)]
+    for inicio in reversed(inicios):
+        fim, pos = inicio + len(marcador), 0
+        for t in nos:
+            conteudo = t.text or ""
+            a, b = max(inicio - pos, 0), min(fim - pos, len(conteudo))
+            if a < b:
+                t.text = conteudo[:a] + conteudo[b:]
+                t.set(qn('xml:space'), 'preserve')
+            pos += len(conteudo)
+
+def preencher_marcadores(main_doc, acoes, indice=None):
+    """Aplica `acoes` ({marcador: função(paragraph, ocorrencia)}) a todas as ocorrências.
+
+    O texto do marcador é removido do parágrafo antes da ação. Retorna os
+    marcadores de `acoes` que não foram encontrados.
+    """
+    indice = indexar_marcadores(main_doc) if indice is None else indice
+    for marcador, acao in acoes.items():
+        for ocorrencia, paragraph in enumerate(indice.get(marcador, [])):
+            _remover_marcador(paragraph._p, marcador)
+            acao(paragraph, ocorrencia)
+    return [m for m in acoes if m not in indice]
+
+def _copia_para(elemento, parte_origem, parte_destino):
+    # Cópia de um elemento já inserido; em outra parte (cabeçalho/rodapé), as
+    # imagens passam a ser referenciadas também a partir dela.
+    copia = copy.deepcopy(elemento)
+    if parte_destino is not parte_origem:
+        for blip in copia.iter(qn('a:blip')):
+            imagem = parte_origem.related_parts[blip.get(qn('r:embed'))]
+            blip.set(qn('r:embed'), parte_destino.relate_to(imagem, RT.IMAGE))
+    return copia
+
+def preencher_com_imagens(images):
+    """Ação que insere as imagens no parágrafo do marcador.
+
+    `images` pode ser um iterável consumido uma vez só (ex.: iterar_paginas_raster):
+    cada página entra no documento assim que chega. As demais ocorrências do
+    marcador recebem cópias das imagens já inseridas.
+    """
+    inseridos = []
+
+    def acao(paragraph, ocorrencia):
+        if inseridos:
+            parte_origem = inseridos[0][0]
+            for _, r in inseridos:
+                paragraph._p.append(_copia_para(r, parte_origem, paragraph.part))
+            return
+        for img in images:
+            run = paragraph.add_run()
+            run.add_picture(BytesIO(img), width=Inches(LARGURA_IMAGEM_POL))
+            inseridos.append((paragraph.part, run._r))
+    return acao
+
+def _tabela_docx(main_doc, tabela):
+    # add_table anexa ao fim do corpo; quem chama move o elemento para o lugar certo.
+    table = main_doc.add_table(rows=len(tabela.linhas), cols=len(tabela.numericas))
+    try:
+        table.style = 'Table Grid'
+    except KeyError:
+        pass
+
+    for row, valores in zip(table.rows, tabela.linhas):
+        for cell, valor, numerica in zip(row.cells, valores, tabela.numericas):
+            paragrafo = cell.paragraphs[0]
+            paragrafo.add_run(valor).font.size = Pt(8)
+            if numerica:
+                paragrafo.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    return table._tbl
+
+def _tabelas_com_cache(dados, paginas, cache):
+    # Tabelas já extraídas deste PDF vêm do cache (pickle; vazio = extração falhou).
+    pdf_hash = hash_conteudo(dados)
+    contagem = cache.get(chave_contagem(pdf_hash), contar=False)
+    num_paginas = int(contagem) if contagem is not None else None
+    indices = list(paginas) if paginas is not None else None
+    if indices is None and num_paginas is not None:
+        indices = list(range(num_paginas))
+
+    tabelas = {}
+    if num_paginas is not None:
+        for i in indices:
+            salvo = cache.get(chave_tabela(pdf_hash, i)) if i < num_paginas else None
+            if salvo is not None:
+                tabelas[i] = pickle.loads(salvo) if salvo else None
+
+    if num_paginas is None or len(tabelas) < sum(i < num_paginas for i in indices):
+        with pdf_aberto(dados) as pdf:
+            with TRAVA_FITZ:
+                num_paginas = len(pdf)
+            cache.put(chave_contagem(pdf_hash), str(num_paginas).encode())
+            indices = indices if indices is not None else list(range(num_paginas))
+            for i in indices:
+                if i < num_paginas and i not in tabelas:
+                    with TRAVA_FITZ:
+                        tabelas[i] = extrair_tabela(pdf[i])
+                    cache.put(chave_tabela(pdf_hash, i), pickle.dumps(tabelas[i]) if tabelas[i] is not None else b"")
+    return indices, tabelas
+
+def iterar_tabelas(pdf_path, paginas=None, perfil=None):
+    """Extrai as tabelas das páginas do PDF; só as páginas em que a extração
+    falha (sem texto, sem estrutura de tabela) são rasterizadas, com o perfil
+    informado. Gera (TabelaExtraida ou None, imagem ou None) por página, ou
+    None para páginas que não existem; as imagens são rasterizadas à medida
+    que são pedidas."""
+    dados = _ler_pdf(pdf_path)
+    indices, tabelas = _tabelas_com_cache(dados, paginas, obter_cache())
+
+    falhas = [i for i in indices if i in tabelas and tabelas[i] is None]
+    imagens = iterar_paginas_raster(dados, paginas=falhas, perfil=perfil) if falhas else None
+    try:
+        for i in indices:
+            if i not in tabelas:
+                yield None
+            elif tabelas[i] is not None:
+                yield tabelas[i], None
+            else:
+                yield None, next(imagens)
+    finally:
+        if imagens is not None:
+            imagens.close()
+
+def extrair_tabelas(pdf_path, paginas=None, perfil=None):
+    """Como iterar_tabelas, mas retorna a lista com todas as páginas."""
+    return list(iterar_tabelas(pdf_path, paginas=paginas, perfil=perfil))
+
+def preencher_com_tabelas(main_doc, pdf_path=None, paginas=None, perfil=None, extraidas=None):
+    """Ação que insere as tabelas extraídas do texto do PDF (ou as já `extraidas`,
+    lista ou iterável consumido uma vez, como em preencher_com_imagens)."""
+    if extraidas is None:
+        extraidas = iterar_tabelas(pdf_path, paginas=paginas, perfil=perfil)
+    inseridos = []
+
+    def acao(paragraph, ocorrencia):
+        ancora = paragraph._p
+        if inseridos:
+            parte_origem = inseridos[0][0]
+            for _, elemento in inseridos:
+                ancora.addnext(_copia_para(elemento, parte_origem, paragraph.part))
+                ancora = ancora.getnext()
+            return
+        for tabela, imagem in filter(None, extraidas):
+            if tabela is not None:
+                ancora.addnext(_tabela_docx(main_doc, tabela))
+                ancora = ancora.getnext()
+                inseridos.append((paragraph.part, ancora))
+            # Depois de uma tabela, parágrafo vazio: o Word funde tabelas adjacentes.
+            novo = _paragrafo_apos(ancora, paragraph)
+            if tabela is None:
+                novo.add_run().add_picture(BytesIO(imagem), width=Inches(LARGURA_IMAGEM_POL))
+            ancora = novo._p
+            inseridos.append((paragraph.part, ancora))
+    return acao
+
+def _paragrafo_apos(elemento, paragraph):
+    # Parágrafo novo logo depois de `elemento`, na parte do marcador: a imagem
+    # inserida nele é relacionada a partir do cabeçalho/rodapé, se for o caso.
+    elemento.addnext(OxmlElement('w:p'))
+    return Paragraph(elemento.getnext(), paragraph._parent)
+
+def _abrir_docx(docx):
+    if hasattr(docx, 'part'):
+        return docx  # já é um Document
+    if isinstance(docx, (bytes, bytearray)):
+        return Document(BytesIO(docx))
+    return Document(docx)
+
+def renderizar_template_medido(nome, contexto, medidor):
+    """Renderiza o template `nome` com `contexto` e retorna o documento python-docx."""
+    doc = obter_registro().obter(nome)
+    doc.render(contexto)
+    # O Document não tem tamanho em bytes: a etapa conta o XML do corpo renderizado.
+    medidor.somar_bytes('template', len(serialize_part_xml(doc.docx.part.element)))
+    # Após o render o docxtpl mantém o documento python-docx em doc.docx;
+    # como não há substituições de mídia pendentes, ele já é o documento final.
+    return doc.docx
+
+def abrir_docx_medido(etapa, docx, medidor):
+    # O Document aberto não tem tamanho em bytes: a etapa conta o DOCX lido.
+    medidor.somar_bytes(etapa, tamanho_bytes(docx))
+    return _abrir_docx(docx)
+
+def preencher_com_docx(main_doc, insert_doc_path, mesclador=None):
+    """Ação que insere o corpo do DOCX, com imagens, links, listas e estilos.
+
+    Aceita o caminho/bytes do DOCX ou um Document já aberto. Passe o mesmo
+    `mesclador` para todos os DOCX inseridos no documento: mídia repetida
+    entre eles (logo, assinatura) fica uma vez só no pacote.
+    """
+    mesclador = mesclador or MescladorDocx(main_doc)
+    elementos = mesclador.importar(_abrir_docx(insert_doc_path))
+
+    def acao(paragraph, ocorrencia):
+        # A primeira ocorrência recebe os próprios elementos; as demais, cópias.
+        for element in reversed(elementos):
+            paragraph._element.addnext(element if ocorrencia == 0 else copy.deepcopy(element))
+    return acao
+
+def insert_pdf_at_placeholder(main_doc, placeholder, pdf_path, perfil=None):
+    images = iterar_paginas_raster(pdf_path, perfil=perfil)
+    try:
+        return not preencher_marcadores(main_doc, {placeholder: preencher_com_imagens(images)})
+    finally:
+        images.close()
+
+def insert_pdf_tables_at_placeholder(main_doc, placeholder, pdf_path, paginas=None, perfil=None):
+    acao = preencher_com_tabelas(main_doc, pdf_path, paginas=paginas, perfil=perfil)
+    return not preencher_marcadores(main_doc, {placeholder: acao})
+
+def insert_docx_at_placeholder(main_doc: Document, placeholder: str, insert_doc_path):
+    return not preencher_marcadores(main_doc, {placeholder: preencher_com_docx(main_doc, insert_doc_path)})
+
+def _ler_upload(upload):
+    # Aceita tanto o UploadedFile do Streamlit (ou qualquer objeto com getvalue)
+    # quanto um caminho no disco (geração em lote). Retorna o conteúdo em bytes.
+    if isinstance(upload, (bytes, bytearray)):
+        return bytes(upload)
+    if isinstance(upload, (str, os.PathLike)):
+        with open(upload, "rb") as f:
+            return f.read()
+    return upload.getvalue()
+
+def ler_uploads(input_data):
+    """Lê todos os uploads obrigatórios em bytes. Retorna (uploads, erro)."""
+    uploads = {}
+    for key, uploaded_file in input_data['uploads'].items():
+        if uploaded_file is not None:
+            uploads[key] = _ler_upload(uploaded_file)
+        else:
+            return None, f"O arquivo {key} é obrigatório!"
+    return uploads, None
+
+def preparar_uploads(input_data):
+    """ler_uploads + validação prévia + conversão das notas/carta em Markdown para DOCX.
+    Retorna (uploads, erro)."""
+    uploads, erro = ler_uploads(input_data)
+    if erro:
+        return None, erro
+    erros = validar_entrada(input_data, uploads)
+    if erros:
+        return None, " ".join(erros)
+    try:
+        return converter_uploads(uploads, ARQUIVOS_TEXTO), None
+    except Exception as e:
+        return None, mensagem_erro(e)
+
+def montar_contexto(input_data, balanco_pt1, balanco_pt2):
+    # O docxtpl não escapa os valores: um "&" na razão social ou no nome de
+    # um sócio quebraria o XML e o parágrafo sumiria do dossiê.
+    return {
+        'nome_empresa': escape(input_data['nome_empresa']),
+        'data_atual': data_atual_formatada(),
+        'periodo_anual': input_data['periodo_anual'],
+        'cnpj_empresa': input_data['cnpj_empresa'],
+        'data_dem_encerradas': input_data['data_dem_encerradas'],
+        'razao_social_empresa': escape(input_data['razao_social_empresa']),
+        'periodo_em_data': input_data['periodo_em_data'],
+        'balanco_patrimonial_pt1': balanco_pt1,
+        'balanco_patrimonial_pt2': balanco_pt2,
+        'demontr_resultado': '[[DEMONSTR_RESULTADO]]',
+        'socios': [{c: escape(str(s.get(c) or '')) for c in COLUNAS_SOCIOS} for s in input_data['socios']],
+        'explic_demonstr': '[[EXP_DEMONSTR]]',
+        'carta_responsb': '[[CARTA_RESP]]'
+    }
+
+def mensagem_erro(e):
+    if str(e) == ERRO_BALANCO_CURTO:
+        return ERRO_BALANCO_CURTO
+
+    if "No such file or directory" in str(e) and CAMINHO_TEMPLETE in str(e):
+        return f"Erro: O template DOCX '{CAMINHO_TEMPLETE}' não foi encontrado no repositório. Certifique-se de que ele foi enviado ao GitHub."
+
+    if isinstance(e, KeyError) and "não registrado" in str(e):
+        return f"Erro: {e.args[0]}"
+
+    if "No pandoc was found" in str(e):
+         return f"Erro: O Pandoc é necessário para converter Markdown. Por favor, instale o Pandoc no ambiente ou use uma solução de deploy que o inclua. Erro detalhado: {e}"
+
+    return f"Erro durante a geração: {e}"
+
+# Mudar invalida os dossiês já guardados no cache de etapas (mudanças na
+# montagem que alteram a saída para as mesmas entradas).
+VERSAO_MONTAGEM = "1"
+
+def impressoes_etapas(input_data, uploads, contexto):
+    """Impressão digital das entradas de cada etapa: campos (contexto do template),
+    hash de cada upload, hash do template, perfil de imagem e modo."""
+    perfil = input_data.get('perfil_raster')
+    modo = input_data.get('modo_demonstracoes')
+    hashes = {chave: hash_conteudo(dados) for chave, dados in uploads.items()}
+    return {
+        'template': impressao(obter_registro().hash(input_data.get('template')), contexto),
+        'balanco': impressao(hashes['balanco_file'], perfil, modo),
+        'dre': impressao(hashes['demstr_result_file'], perfil, modo),
+        'notas': hashes['explic_demonstr_file'],
+        'carta': hashes['carta_responsb_file'],
+    }
+
+def dossie_em_cache(formato, impressoes, progresso=None, medidor=None):
+    """Dossiê já gerado com exatamente as mesmas entradas, ou None.
+
+    Retorna também a chave, para guardar_dossie depois de gerar.
+    """
+    chave = impressao(VERSAO_MONTAGEM, formato, impressoes)
+    dados = obter_cache_etapas().get(chave)
+    if dados is not None:
+        avisar_etapa(progresso, 'finalizando')
+        if medidor is not None:
+            medidor.medir('finalizando', lambda: dados)
+    return dados, chave
+
+def guardar_dossie(chave, dados):
+    cache = obter_cache_etapas()
+    # Dossiês enormes (DRE escaneada com centenas de páginas) não compensam a escrita.
+    if len(dados) <= cache.limite_memoria:
+        cache.put(chave, dados)
+
+def otimizar_dossie(dados, perfil=None, progresso=None, medidor=None):
+    """Passada opcional de otimizar_docx; o relatório vai para as medições ('otimizacao')."""
+    medidor = medidor or Medidor()
+    avisar_etapa(progresso, 'otimizando')
+    try:
+        otimizado, relatorio = medidor.medir('otimizando', otimizar_docx, dados, perfil)
+    except Exception as e:
+        # A otimização não derruba a geração: o dossiê sai como foi montado.
+        medidor.anotar('otimizacao', {'erro': str(e)})
+        return dados
+    medidor.anotar('otimizacao', relatorio)
+    return otimizado
+
+def generate_document(input_data, progresso=None, medidor=None):
+    medidor = medidor or Medidor()
+    avisar_etapa(progresso, 'uploads')
+    uploads, erro = medidor.medir('uploads', preparar_uploads, input_data)
+    if erro:
+        return None, erro
+
+    # Todo o pipeline roda em memória: uploads em bytes, template renderizado
+    # reaproveitado como objeto (sem salvar/reabrir) e saída em BytesIO. Sem
+    # arquivos temporários, gerações simultâneas não interferem entre si.
+    final_docx_buffer = BytesIO()
+    abertos = []
+
+    try:
+        perfil = input_data.get('perfil_raster')
+        modo_tabela = input_data.get('modo_demonstracoes') == 'tabela'
+        otimizar = bool(input_data.get('otimizar_docx'))
+        # O balanço entra pelos marcadores, como a DRE: o render não espera a rasterização.
+        contexto = montar_contexto(input_data, MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2)
+
+        # Mesmas entradas da última geração: nada a refazer. Se só um campo
+        # mudou, as páginas, tabelas e conversões vêm dos caches por conteúdo e
+        # só o template e a montagem são refeitos.
+        anterior, chave = dossie_em_cache('docx-otimizado' if otimizar else 'docx',
+                                          impressoes_etapas(input_data, uploads, contexto), progresso, medidor)
+        if anterior is not None:
+            return anterior, None
+
+        def balanco():
+            if modo_tabela:
+                paginas = extrair_tabelas(uploads['balanco_file'], paginas=[0, 1], perfil=perfil)
+            else:
+                paginas = pdf_balanco_duas_paginas(uploads['balanco_file'], perfil=perfil)
+            if None in paginas:
+                raise ValueError(ERRO_BALANCO_CURTO)
+            return paginas
+
+        def dre():
+            # A DRE pode ter centenas de páginas: elas são rasterizadas adiantadas, mas só
+            # até LIMITE_MEMORIA_RASTER à frente da montagem, que as insere uma a uma.
+            if modo_tabela:
+                paginas = iterar_tabelas(uploads['demstr_result_file'], perfil=perfil)
+            else:
+                paginas = iterar_paginas_raster(uploads['demstr_result_file'], perfil=perfil)
+            abertos.append(Antecipador(paginas, LIMITE_MEMORIA_RASTER))
+            return abertos[-1]
+
+        def montar(final_doc, balanco, dre, notas, carta):
+            mesclador = MescladorDocx(final_doc)
+            acoes = {
+                '[[EXP_DEMONSTR]]': preencher_com_docx(final_doc, notas, mesclador),
+                '[[CARTA_RESP]]': preencher_com_docx(final_doc, carta, mesclador),
+            }
+            if modo_tabela:
+                acoes[MARCADOR_BALANCO_PT1] = preencher_com_tabelas(final_doc, extraidas=balanco[:1])
+                acoes[MARCADOR_BALANCO_PT2] = preencher_com_tabelas(final_doc, extraidas=balanco[1:])
+                acoes['[[DEMONSTR_RESULTADO]]'] = preencher_com_tabelas(final_doc, extraidas=dre)
+            else:
+                acoes[MARCADOR_BALANCO_PT1] = preencher_com_imagens(balanco[:1])
+                acoes[MARCADOR_BALANCO_PT2] = preencher_com_imagens(balanco[1:])
+                acoes['[[DEMONSTR_RESULTADO]]'] = preencher_com_imagens(dre)
+            preencher_marcadores(final_doc, acoes)
+            final_doc.save(final_docx_buffer)
+            return final_docx_buffer
+
+        # Template, balanço, DRE, notas e carta são independentes e rodam ao
+        # mesmo tempo; só a montagem espera por todos.
+        executar_etapas({
+            'template': (lambda: renderizar_template_medido(input_data.get('template'), contexto, medidor), []),
+            'balanco': (balanco, []),
+            'dre': (dre, []),
+            'notas': (lambda: abrir_docx_medido('notas', uploads['explic_demonstr_file'], medidor), []),
+            'carta': (lambda: abrir_docx_medido('carta', uploads['carta_responsb_file'], medidor), []),
+            'finalizando': (montar, ['template', 'balanco', 'dre', 'notas', 'carta']),
+        }, progresso, medidor)
+        # As páginas da DRE só passam pelo Antecipador durante a montagem.
+        medidor.somar_bytes('dre', sum(antecipador.produzidos for antecipador in abertos))
+        # Só depois de soltar o documento montado: a cópia final não convive com ele na memória.
+        dados = final_docx_buffer.getvalue()
+        if otimizar:
+            dados = otimizar_dossie(dados, perfil, progresso, medidor)
+        guardar_dossie(chave, dados)
+        return dados, None
+
+    except Exception as e:
+        return None, mensagem_erro(e)
+
+    finally:
+        for antecipador in abertos:
+            antecipador.fechar()
+
+def _nome_arquivo(upload):
+    if isinstance(upload, (str, os.PathLike)):
+        return os.path.basename(upload)
+    return getattr(upload, 'name', None)
+
+def gerar_dossie(input_data, progresso=None, medidor=None):
+    """Gera o dossiê no formato de input_data['formato_saida'] ('docx' padrão ou 'pdf').
+
+    `progresso(etapa)` recebe a primeira etapa (chaves de ETAPAS) ainda não
+    concluída sempre que ela muda. As medições de cada etapa ficam em
+    `medidor` (medicoes.Medidor, se informado), com os acertos e falhas do
+    cache de páginas da geração, e são gravadas no log JSON.
+    """
+    medidor = medidor or Medidor()
+    cache = obter_cache()
+    antes = cache.contadores()
+    if input_data.get('formato_saida') == 'pdf':
+        # Import local: gerador_pdf depende deste módulo.
+        from gerador_pdf import generate_pdf
+        file_data, erro = generate_pdf(input_data, progresso, medidor)
+    else:
+        file_data, erro = generate_document(input_data, progresso, medidor)
+    # Acertos do cache desta geração: o cache é do processo que gera, e é por
+    # aqui que a interface e o log ficam sabendo deles.
+    depois = cache.contadores()
+    medidor.anotar('cache_raster', {chave: depois[chave] - antes[chave] for chave in depois})
+
+    gravar_log({
+        'nome_empresa': input_data.get('nome_empresa'),
+        'formato': input_data.get('formato_saida') or 'docx',
+        'modo_demonstracoes': input_data.get('modo_demonstracoes') or 'imagem',
+        'perfil_raster': input_data.get('perfil_raster'),
+        'template': input_data.get('template'),
+        'otimizar_docx': bool(input_data.get('otimizar_docx')),
+        'arquivos': {chave: _nome_arquivo(u) for chave, u in input_data.get('uploads', {}).items()},
+        'sucesso': bool(file_data),
+        'erro': erro,
+        'bytes_saida': len(file_data) if file_data else 0,
+        **medidor.resumo(),
+    })
+    return file_data, erro
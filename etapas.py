@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache_raster import CacheRaster
+from medicoes import tamanho_bytes
+
+# Execução das etapas da geração como um grafo de dependências.
+#
+# Cada etapa é uma função que recebe os resultados das etapas de que depende.
+# Etapas sem dependência pendente rodam ao mesmo tempo numa thread cada; a
+# montagem final só começa quando todas as entradas estão prontas. Em threads,
+# só se sobrepõe o trabalho que solta o GIL ou roda fora do processo: a
+# codificação das páginas (Pillow) e o pool de processos de
+# dossie.rasterizar_paginas, usado só com mais de um worker e pelo menos
+# MIN_PAGINAS_PARALELO páginas a rasterizar. O PyMuPDF não suporta threads
+# simultâneas e fica sob perfis_raster.TRAVA_FITZ: o balanço (2 páginas) e,
+# na geração em lote (raster_workers=1), também a DRE são rasterizados no
+# processo, alternando-se na trava, sem somar núcleos.
+#
+# Regeneração incremental: cada etapa tem uma impressão digital das suas
+# entradas (campos do formulário, hash de cada upload, hash do template,
+# perfil de imagem). Os artefatos intermediários ficam em caches por
+# conteúdo (páginas rasterizadas, tabelas extraídas, Markdown convertido) e
+# o resultado final fica em cache_etapas pela impressão de todas as etapas:
+# mudar um campo só refaz o template e a montagem.
+
+PASTA_CACHE_ETAPAS = os.environ.get(
+    "DOSSIE_CACHE_ETAPAS_DIR", os.path.join(tempfile.gettempdir(), "dossie_cache_etapas")
+)
+LIMITE_MEMORIA_ETAPAS = int(os.environ.get("DOSSIE_CACHE_ETAPAS_MB", "64")) * 1024 * 1024
+LIMITE_DISCO_ETAPAS = int(os.environ.get("DOSSIE_CACHE_ETAPAS_DISCO_MB", "512")) * 1024 * 1024
+
+
+def impressao(*partes):
+    """Impressão digital (sha256) de bytes e valores serializáveis em JSON."""
+    h = hashlib.sha256()
+    for parte in partes:
+        if not isinstance(parte, (bytes, bytearray)):
+            parte = json.dumps(parte, sort_keys=True, ensure_ascii=False, default=str).encode()
+        h.update(len(parte).to_bytes(8, "little"))
+        h.update(parte)
+    return h.hexdigest()
+
+
+_cache_etapas = None
+_cache_etapas_lock = threading.Lock()
+
+
+def obter_cache_etapas():
+    """Cache de resultados de etapas do processo (variáveis DOSSIE_CACHE_ETAPAS_*)."""
+    global _cache_etapas
+    with _cache_etapas_lock:
+        if _cache_etapas is None:
+            _cache_etapas = CacheRaster(
+                limite_memoria=LIMITE_MEMORIA_ETAPAS, pasta=PASTA_CACHE_ETAPAS, limite_disco=LIMITE_DISCO_ETAPAS
+            )
+        return _cache_etapas
+
+
+def executar_etapas(etapas, progresso=None, medidor=None):
+    """Executa `etapas` ({nome: (funcao, [dependências])}) e retorna {nome: resultado}.
+
+    A ordem do dicionário é a ordem "lógica" usada para o progresso:
+    `progresso(nome)` recebe a primeira etapa ainda não concluída sempre que
+    ela muda. Com um `medidor` (medicoes.Medidor), cada etapa é medida.
+    Se uma etapa falhar, as que ainda não começaram são canceladas e a
+    exceção é propagada.
+    """
+    for nome, (_, dependencias) in etapas.items():
+        for dep in dependencias:
+            if dep not in etapas:
+                raise ValueError(f"Etapa '{nome}' depende de '{dep}', que não existe.")
+
+    resultados = {}
+    em_execucao = {}
+    aguardando = dict(etapas)
+    atual = None
+
+    def avisar():
+        nonlocal atual
+        proxima = next((nome for nome in etapas if nome not in resultados), None)
+        if proxima != atual and proxima is not None and progresso is not None:
+            progresso(proxima)
+        atual = proxima
+
+    with ThreadPoolExecutor(max_workers=len(etapas) or 1) as executor:
+        avisar()
+        while aguardando or em_execucao:
+            for nome, (funcao, dependencias) in list(aguardando.items()):
+                if all(dep in resultados for dep in dependencias):
+                    del aguardando[nome]
+                    argumentos = [resultados[dep] for dep in dependencias]
+                    if medidor is not None:
+                        futuro = executor.submit(medidor.medir, nome, funcao, *argumentos)
+                    else:
+                        futuro = executor.submit(funcao, *argumentos)
+                    em_execucao[futuro] = nome
+            if not em_execucao:
+                raise ValueError(f"Dependência circular entre as etapas: {', '.join(aguardando)}")
+
+            prontos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                nome = em_execucao.pop(futuro)
+                try:
+                    resultados[nome] = futuro.result()
+                except BaseException:
+                    for pendente in em_execucao:
+                        pendente.cancel()
+                    raise
+            avisar()
+
+    return resultados
+
+
+class Antecipador:
+    """Consome um iterável numa thread própria, guardando no máximo `limite_bytes`
+    à frente de quem lê.
+
+    Permite que uma etapa comece a produzir (ex.: rasterizar a DRE) antes de
+    a etapa que consome (a montagem) estar pronta, sem acumular tudo em
+    memória: o produtor espera quando o buffer enche. Um item maior que o
+    limite ainda passa, sozinho. `fechar()` interrompe o produtor e deve ser
+    chamado se o consumo não chegar ao fim.
+    """
+
+    def __init__(self, iteravel, limite_bytes, tamanho=tamanho_bytes):
+        self._iteravel = iteravel
+        self._limite = limite_bytes
+        self._tamanho = tamanho
+        self._itens = deque()
+        self._bytes = 0
+        self.produzidos = 0         # bytes que já passaram pelo buffer
+        self._fim = False
+        self._parar = False
+        self._erro = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._produzir, daemon=True)
+        self._thread.start()
+
+    def _produzir(self):
+        try:
+            for item in self._iteravel:
+                tamanho = self._tamanho(item)
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._parar or not self._itens or self._bytes + tamanho <= self._limite
+                    )
+                    if self._parar:
+                        break
+                    self._itens.append((item, tamanho))
+                    self._bytes += tamanho
+                    self.produzidos += tamanho
+                    self._cond.notify_all()
+        except BaseException as e:
+            self._erro = e
+        finally:
+            if hasattr(self._iteravel, 'close'):
+                self._iteravel.close()
+            with self._cond:
+                self._fim = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._itens or self._fim)
+                    if not self._itens:
+                        if self._erro is not None:
+                            raise self._erro
+                        return
+                    item, tamanho = self._itens.popleft()
+                    self._bytes -= tamanho
+                    self._cond.notify_all()
+                yield item
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        with self._cond:
+            self._parar = True
+            self._itens.clear()
+            self._bytes = 0
+            self._cond.notify_all()
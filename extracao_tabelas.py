@@ -0,0 +1,156 @@
+import re
+from dataclasses import dataclass
+
+# Extração das tabelas do balanço/DRE a partir da camada de texto do PDF.
+#
+# Os relatórios do sistema contábil vêm com texto real, então em vez de
+# rasterizar a página dá para reconstruir a tabela: primeiro tenta o
+# find_tables do PyMuPDF (tabelas com linhas desenhadas); se não houver,
+# agrupa as palavras em linhas pela posição vertical e em colunas pelo
+# alinhamento (valores numéricos alinham pela direita, textos pela esquerda).
+# Páginas sem texto (digitalizadas) ou sem estrutura tabular retornam None,
+# e quem chama volta a rasterizar só essas páginas.
+
+MIN_LINHAS = 3
+# Cobertura mínima das palavras da página para aceitar a tabela do find_tables.
+MIN_COBERTURA_FIND_TABLES = 0.6
+TOLERANCIA_LINHA = 3      # pt entre centros verticais de palavras da mesma linha
+TOLERANCIA_COLUNA = 12    # pt entre âncoras de segmentos da mesma coluna
+
+_NUMERO = re.compile(r"^\(?-?[\d.]+(,\d+)?\)?[DC]?$")
+
+
+@dataclass
+class TabelaExtraida:
+    linhas: list
+    numericas: list     # por coluna: True se a coluna é de valores (alinhar à direita)
+
+
+def _eh_numero(texto):
+    return bool(_NUMERO.match(texto.replace(" ", "")))
+
+
+def _colunas_numericas(linhas):
+    num_colunas = len(linhas[0]) if linhas else 0
+    numericas = []
+    for c in range(num_colunas):
+        valores = [linha[c] for linha in linhas if linha[c]]
+        numericas.append(bool(valores) and sum(map(_eh_numero, valores)) >= len(valores) / 2)
+    return numericas
+
+
+def _tem_linhas(page):
+    # find_tables é caro (extrai cada caractere); só vale a pena com grade desenhada.
+    segmentos = 0
+    for desenho in page.get_cdrawings():
+        segmentos += sum(1 for item in desenho.get("items", ()) if item[0] in ("l", "re"))
+        if segmentos >= MIN_LINHAS:
+            return True
+    return False
+
+
+def _por_find_tables(page, palavras):
+    if not _tem_linhas(page):
+        return None
+    tabelas = page.find_tables().tables
+    if not tabelas:
+        return None
+
+    tabela = max(tabelas, key=lambda t: t.row_count * t.col_count)
+    bbox = tabela.bbox
+    dentro = sum(
+        1 for p in palavras
+        if bbox[0] <= (p[0] + p[2]) / 2 <= bbox[2] and bbox[1] <= (p[1] + p[3]) / 2 <= bbox[3]
+    )
+    if dentro < MIN_COBERTURA_FIND_TABLES * len(palavras):
+        return None
+
+    linhas = [
+        [" ".join((celula or "").split()) for celula in linha]
+        for linha in tabela.extract()
+    ]
+    linhas = [linha for linha in linhas if any(linha)]
+    return linhas if len(linhas) >= MIN_LINHAS else None
+
+
+def _agrupar_linhas(palavras):
+    linhas = []
+    for p in sorted(palavras, key=lambda p: ((p[1] + p[3]) / 2, p[0])):
+        centro = (p[1] + p[3]) / 2
+        if linhas and abs(linhas[-1][0] - centro) <= TOLERANCIA_LINHA:
+            linhas[-1][1].append(p)
+        else:
+            linhas.append([centro, [p]])
+    return [sorted(ps, key=lambda p: p[0]) for _, ps in linhas]
+
+
+def _segmentos(palavras_linha):
+    # Junta palavras próximas; um espaço maior que a altura da fonte separa células.
+    segmentos = []
+    for p in palavras_linha:
+        altura = p[3] - p[1]
+        if segmentos and p[0] - segmentos[-1][1] <= altura:
+            x0, _, texto = segmentos[-1]
+            segmentos[-1] = (x0, p[2], f"{texto} {p[4]}")
+        else:
+            segmentos.append((p[0], p[2], p[4]))
+    return segmentos
+
+
+def _por_layout(palavras):
+    linhas_seg = [_segmentos(ps) for ps in _agrupar_linhas(palavras)]
+    if len(linhas_seg) < MIN_LINHAS:
+        return None
+
+    # Âncora de cada segmento: borda direita para números, esquerda para textos.
+    ancoras = sorted(
+        {(_eh_numero(t), round(x1 if _eh_numero(t) else x0)) for seg in linhas_seg for x0, x1, t in seg}
+    )
+    colunas = []  # [numerica, menor âncora, maior âncora]
+    for numerica, ancora in ancoras:
+        if colunas and colunas[-1][0] == numerica and ancora - colunas[-1][2] <= TOLERANCIA_COLUNA:
+            colunas[-1][2] = ancora
+        else:
+            colunas.append([numerica, ancora, ancora])
+    if len(colunas) < 2:
+        return None
+
+    def coluna_de(x0, x1, texto):
+        numerica = _eh_numero(texto)
+        ancora = round(x1 if numerica else x0)
+        candidatas = [i for i, (n, _, _) in enumerate(colunas) if n == numerica]
+        return min(candidatas, key=lambda i: max(colunas[i][1] - ancora, ancora - colunas[i][2], 0))
+
+    # Ordena as colunas pela posição média dos segmentos atribuídos a cada uma.
+    centros = {}
+    for seg in linhas_seg:
+        for x0, x1, texto in seg:
+            centros.setdefault(coluna_de(x0, x1, texto), []).append((x0 + x1) / 2)
+    ordem = sorted(centros, key=lambda i: sum(centros[i]) / len(centros[i]))
+    posicao = {c: i for i, c in enumerate(ordem)}
+
+    linhas = []
+    for seg in linhas_seg:
+        linha = [""] * len(ordem)
+        for x0, x1, texto in seg:
+            i = posicao[coluna_de(x0, x1, texto)]
+            linha[i] = f"{linha[i]} {texto}".strip()
+        linhas.append(linha)
+    return linhas
+
+
+def extrair_tabela(page):
+    """Reconstrói a tabela da página a partir do texto. Retorna TabelaExtraida ou None."""
+    palavras = page.get_text("words")
+    if not palavras:
+        return None
+
+    texto = "".join(p[4] for p in palavras)
+    # Fontes sem mapeamento para Unicode geram caracteres de substituição: texto inutilizável.
+    if texto.count("�") > len(texto) * 0.1:
+        return None
+
+    linhas = _por_find_tables(page, palavras) or _por_layout(palavras)
+    if not linhas:
+        return None
+    return TabelaExtraida(linhas, _colunas_numericas(linhas))
@@ -0,0 +1,374 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from armazem_artefatos import obter_armazem
+from campos import ARQUIVOS_OBRIGATORIOS, ETAPAS, validar_campos
+from medicoes import Medidor
+
+# Fila de gerações em segundo plano para a interface.
+#
+# O clique em "GERAR" só grava o pedido (dados numa tabela SQLite, uploads no
+# armazém de artefatos) e volta; um pool de processos executa os pedidos, no máximo
+# MAX_SIMULTANEOS ao mesmo tempo, em ordem de chegada. O próprio worker grava
+# a etapa atual e o resultado no SQLite, então a interface só consulta a
+# tabela, e o dossiê pronto (também no armazém, lido do disco só no
+# download) continua disponível depois de recarregar a página.
+# Com MAX_PENDENTES pedidos na fila ou em execução, novos envios são recusados
+# (FilaCheia) em vez de acumular trabalho sem limite.
+#
+# Pedidos que estavam em execução quando o processo do servidor morreu voltam
+# para a fila na próxima inicialização.
+#
+# dossie (PyMuPDF, python-docx, docxtpl) só é importado nos workers: o
+# processo do Streamlit não carrega essas bibliotecas.
+
+PASTA_FILA = os.environ.get("DOSSIE_FILA_DIR", os.path.join(tempfile.gettempdir(), "dossie_fila"))
+MAX_SIMULTANEOS = int(os.environ.get("DOSSIE_JOBS_SIMULTANEOS", "2"))
+MAX_PENDENTES = int(os.environ.get("DOSSIE_JOBS_PENDENTES", "20"))
+# Processos de rasterização de cada pedido; 0 divide os núcleos entre os pedidos simultâneos.
+RASTER_WORKERS_POR_JOB = int(os.environ.get("DOSSIE_JOBS_RASTER_WORKERS", "0"))
+
+NA_FILA, EXECUTANDO, CONCLUIDO, ERRO = 'na_fila', 'executando', 'concluido', 'erro'
+ESTADOS_FINAIS = (CONCLUIDO, ERRO)
+
+_ORDEM_ETAPAS = list(ETAPAS)
+
+
+class FilaCheia(Exception):
+    pass
+
+
+@contextmanager
+def _conectar(caminho_db):
+    # Uma conexão por operação: usada da thread do Streamlit, do callback do pool e dos workers.
+    conexao = sqlite3.connect(caminho_db, timeout=30)
+    conexao.row_factory = sqlite3.Row
+    try:
+        with conexao:
+            yield conexao
+    finally:
+        conexao.close()
+
+
+def _atualizar(caminho_db, job_id, **campos):
+    colunas = ", ".join(f"{c} = ?" for c in campos)
+    with _conectar(caminho_db) as conexao:
+        conexao.execute(f"UPDATE jobs SET {colunas} WHERE id = ?", (*campos.values(), job_id))
+
+
+def raster_workers_por_job(max_simultaneos):
+    # Com a fila cheia, os pedidos simultâneos juntos usam no máximo os núcleos da máquina.
+    return RASTER_WORKERS_POR_JOB or max(1, (os.cpu_count() or 1) // max_simultaneos)
+
+
+def _iniciar_worker(raster_workers):
+    import dossie
+
+    dossie.RASTER_WORKERS = raster_workers
+
+    # Templates carregados já na subida do worker, e não no primeiro pedido.
+    from registro_templates import obter_registro
+
+    registro = obter_registro()
+    for nome in registro.nomes():
+        try:
+            registro.hash(nome)
+        except Exception:
+            pass  # template com problema: o erro aparece no pedido que o usar
+
+
+def _nada():
+    pass
+
+
+def _executar_job(caminho_db, job_id):
+    """Executado no worker: gera o dossiê do pedido e grava o resultado."""
+    from dossie import gerar_dossie
+
+    with _conectar(caminho_db) as conexao:
+        linha = conexao.execute("SELECT parametros FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    input_data = json.loads(linha['parametros'])
+    armazem = obter_armazem()
+    uploads = input_data.get('uploads') or {}
+    if set(uploads) != set(ARQUIVOS_OBRIGATORIOS) or not all(armazem.tocar(chave) for chave in uploads.values()):
+        _atualizar(caminho_db, job_id, estado=ERRO, concluido_em=time.time(),
+                   erro="Os arquivos enviados expiraram. Envie-os novamente.")
+        return
+    input_data['uploads'] = {nome: armazem.caminho(chave) for nome, chave in input_data['uploads'].items()}
+
+    def progresso(etapa):
+        _atualizar(caminho_db, job_id, etapa=etapa)
+
+    medidor = Medidor()
+    try:
+        file_data, erro = gerar_dossie(input_data, progresso, medidor)
+    except Exception as e:
+        file_data, erro = None, f"Erro durante a geração: {e}"
+    medicoes = json.dumps(medidor.resumo())
+
+    if not file_data:
+        _atualizar(caminho_db, job_id, estado=ERRO, erro=erro, medicoes=medicoes, concluido_em=time.time())
+        return
+
+    _atualizar(caminho_db, job_id, estado=CONCLUIDO, artefato=armazem.guardar(file_data), medicoes=medicoes,
+               concluido_em=time.time())
+
+
+def _guardar_upload(armazem, upload):
+    # Caminho no disco, bytes ou UploadedFile do Streamlit: copiado em blocos, sem juntar tudo na memória.
+    if isinstance(upload, (str, os.PathLike)):
+        with open(upload, "rb") as f:
+            return armazem.guardar(f)
+    return armazem.guardar(upload)
+
+
+class FilaJobs:
+    def __init__(self, pasta=PASTA_FILA, max_simultaneos=MAX_SIMULTANEOS, max_pendentes=MAX_PENDENTES,
+                 raster_workers=None):
+        self.pasta = pasta
+        self.max_simultaneos = max_simultaneos
+        self.max_pendentes = max_pendentes
+        self.raster_workers = raster_workers or raster_workers_por_job(max_simultaneos)
+        self.caminho_db = os.path.join(pasta, "jobs.sqlite")
+        self._lock = threading.RLock()
+        self._terminou = threading.Condition()
+        self._executor = None
+        self._encerrada = False
+        os.makedirs(pasta, exist_ok=True)
+
+        with _conectar(self.caminho_db) as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    etapa TEXT,
+                    nome_empresa TEXT,
+                    formato TEXT,
+                    parametros TEXT NOT NULL,
+                    artefato TEXT,
+                    erro TEXT,
+                    medicoes TEXT,
+                    criado_em REAL NOT NULL,
+                    iniciado_em REAL,
+                    concluido_em REAL
+                )
+            """)
+            colunas = {linha['name'] for linha in conexao.execute("PRAGMA table_info(jobs)")}
+            if 'medicoes' not in colunas:
+                conexao.execute("ALTER TABLE jobs ADD COLUMN medicoes TEXT")
+            conexao.execute("CREATE INDEX IF NOT EXISTS jobs_estado ON jobs (estado, criado_em)")
+            # Pedidos órfãos de uma execução anterior do servidor.
+            conexao.execute("UPDATE jobs SET estado = ?, etapa = NULL WHERE estado = ?", (NA_FILA, EXECUTANDO))
+        self._despachar()
+
+    def _obter_executor(self):
+        if self._executor is None:
+            # spawn: o processo do Streamlit tem várias threads, e fork nesse estado não é seguro.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_simultaneos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_worker,
+                initargs=(self.raster_workers,),
+            )
+        return self._executor
+
+    def aquecer(self):
+        """Sobe agora os max_simultaneos workers (imports e templates carregados),
+        para o primeiro pedido não pagar a inicialização."""
+        with self._lock:
+            executor = self._obter_executor()
+            futuros = [executor.submit(_nada) for _ in range(self.max_simultaneos)]
+        for futuro in futuros:
+            futuro.result()
+
+    def encerrar(self):
+        """Encerra os workers, esperando os pedidos em execução terminarem."""
+        with self._lock:
+            self._encerrada = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def enviar(self, input_data):
+        """Grava o pedido e o coloca na fila. Retorna o id do job.
+
+        Levanta FilaCheia se já houver max_pendentes pedidos aguardando ou em execução,
+        e ValueError se faltar arquivo ou o CNPJ/CPF for inválido.
+        """
+        for chave in ARQUIVOS_OBRIGATORIOS:
+            if input_data['uploads'].get(chave) is None:
+                raise ValueError(f"O arquivo {chave} é obrigatório!")
+        # Os arquivos são validados no início do job (validacao.py): conferir PDFs
+        # aqui carregaria o PyMuPDF no processo da interface.
+        erros = validar_campos(input_data)
+        if erros:
+            raise ValueError(" ".join(erros))
+
+        armazem = obter_armazem()
+        parametros = {k: v for k, v in input_data.items() if k != 'uploads'}
+        parametros['uploads'] = {
+            chave: _guardar_upload(armazem, input_data['uploads'][chave]) for chave in ARQUIVOS_OBRIGATORIOS
+        }
+
+        with self._lock, _conectar(self.caminho_db) as conexao:
+            pendentes = conexao.execute(
+                "SELECT COUNT(*) FROM jobs WHERE estado IN (?, ?)", (NA_FILA, EXECUTANDO)
+            ).fetchone()[0]
+            if pendentes >= self.max_pendentes:
+                raise FilaCheia(f"Há {pendentes} dossiês na fila. Tente novamente em alguns minutos.")
+
+            job_id = uuid.uuid4().hex
+            conexao.execute(
+                "INSERT INTO jobs (id, estado, nome_empresa, formato, parametros, criado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, NA_FILA, input_data.get('nome_empresa'), input_data.get('formato_saida') or 'docx',
+                 json.dumps(parametros, default=str), time.time()),
+            )
+
+        self._despachar()
+        return job_id
+
+    def _despachar(self):
+        # Completa as vagas livres com os pedidos mais antigos da fila.
+        with self._lock:
+            if self._encerrada:
+                return
+            with _conectar(self.caminho_db) as conexao:
+                em_execucao = conexao.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE estado = ?", (EXECUTANDO,)
+                ).fetchone()[0]
+                vagas = self.max_simultaneos - em_execucao
+                proximos = [
+                    linha['id'] for linha in conexao.execute(
+                        "SELECT id FROM jobs WHERE estado = ? ORDER BY criado_em LIMIT ?", (NA_FILA, max(vagas, 0))
+                    )
+                ]
+                for job_id in proximos:
+                    conexao.execute(
+                        "UPDATE jobs SET estado = ?, iniciado_em = ? WHERE id = ?", (EXECUTANDO, time.time(), job_id)
+                    )
+
+            for job_id in proximos:
+                futuro = self._obter_executor().submit(_executar_job, self.caminho_db, job_id)
+                futuro.add_done_callback(lambda f, job_id=job_id: self._ao_terminar(job_id, f))
+
+    def _ao_terminar(self, job_id, futuro):
+        if futuro.cancelled():
+            return  # fila encerrada antes de o pedido começar: volta para a fila na próxima inicialização
+        if futuro.exception() is not None:
+            # O worker morreu sem gravar o resultado (ex.: falta de memória).
+            _atualizar(self.caminho_db, job_id, estado=ERRO, erro=f"Falha no processo de geração: {futuro.exception()}",
+                       concluido_em=time.time())
+            if isinstance(futuro.exception(), BrokenProcessPool):
+                # Na thread do callback: _obter_executor e encerrar trocam o executor sob a mesma trava.
+                with self._lock:
+                    self._executor = None
+        with self._terminou:
+            self._terminou.notify_all()
+        self._despachar()
+
+    def aguardar(self, job_id, timeout=None):
+        """Espera o job terminar (ou `timeout` segundos) e retorna o status."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._terminou:
+            while True:
+                status = self.status(job_id)
+                if status is None or status['estado'] in ESTADOS_FINAIS:
+                    return status
+                restante = 1.0 if limite is None else limite - time.monotonic()
+                if restante <= 0:
+                    return status
+                # Acordado por _ao_terminar; o teto de 1 s cobre jobs terminados por outro processo.
+                self._terminou.wait(min(restante, 1.0))
+
+    def status(self, job_id):
+        """Estado do job: dict com estado, etapa, progresso (0 a 1), posição na fila, erro e
+        medições por etapa (medicoes.Medidor.resumo). None se não existir."""
+        with _conectar(self.caminho_db) as conexao:
+            linha = conexao.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if linha is None:
+                return None
+            posicao = None
+            if linha['estado'] == NA_FILA:
+                posicao = conexao.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE estado = ? AND criado_em <= ?", (NA_FILA, linha['criado_em'])
+                ).fetchone()[0]
+
+        if linha['estado'] == CONCLUIDO:
+            progresso = 1.0
+        elif linha['etapa'] in ETAPAS:
+            progresso = _ORDEM_ETAPAS.index(linha['etapa']) / len(_ORDEM_ETAPAS)
+        else:
+            progresso = 0.0
+
+        return {
+            'id': linha['id'],
+            'estado': linha['estado'],
+            'etapa': linha['etapa'],
+            'descricao_etapa': ETAPAS.get(linha['etapa']),
+            'progresso': progresso,
+            'posicao_fila': posicao,
+            'nome_empresa': linha['nome_empresa'],
+            'formato': linha['formato'],
+            'erro': linha['erro'],
+            'medicoes': json.loads(linha['medicoes']) if linha['medicoes'] else None,
+            'criado_em': linha['criado_em'],
+            'segundos': (linha['concluido_em'] or time.time()) - (linha['iniciado_em'] or linha['criado_em']),
+        }
+
+    def estatisticas_cache(self, ultimos=200):
+        """Acertos e falhas do cache de páginas somados nas últimas `ultimos` gerações.
+
+        O cache fica nos workers; cada job grava os contadores da sua geração
+        nas medições.
+        """
+        with _conectar(self.caminho_db) as conexao:
+            linhas = conexao.execute(
+                "SELECT medicoes FROM jobs WHERE medicoes IS NOT NULL ORDER BY concluido_em DESC LIMIT ?", (ultimos,)
+            ).fetchall()
+        total = {'geracoes': 0, 'hits_memoria': 0, 'hits_disco': 0, 'misses': 0}
+        for linha in linhas:
+            contadores = json.loads(linha['medicoes']).get('cache_raster')
+            if contadores:
+                total['geracoes'] += 1
+                for chave in ('hits_memoria', 'hits_disco', 'misses'):
+                    total[chave] += contadores.get(chave, 0)
+        consultas = total['hits_memoria'] + total['hits_disco'] + total['misses']
+        total['taxa_acerto'] = (total['hits_memoria'] + total['hits_disco']) / consultas if consultas else 0.0
+        return total
+
+    def abrir_artefato(self, job_id):
+        """Dossiê gerado, aberto para leitura do disco (quem chama fecha), ou None se o
+        job não terminou com sucesso ou o arquivo já saiu do armazém."""
+        with _conectar(self.caminho_db) as conexao:
+            linha = conexao.execute("SELECT artefato FROM jobs WHERE id = ? AND estado = ?", (job_id, CONCLUIDO)).fetchone()
+        if linha is None or not linha['artefato']:
+            return None
+        return obter_armazem().abrir(linha['artefato'])
+
+    def artefato_disponivel(self, job_id):
+        with _conectar(self.caminho_db) as conexao:
+            linha = conexao.execute("SELECT artefato FROM jobs WHERE id = ? AND estado = ?", (job_id, CONCLUIDO)).fetchone()
+        return linha is not None and obter_armazem().contem(linha['artefato'])
+
+
+_fila = None
+_fila_lock = threading.Lock()
+
+
+def obter_fila():
+    """Fila do processo (compartilhada entre as sessões do Streamlit)."""
+    global _fila
+    with _fila_lock:
+        if _fila is None:
+            _fila = FilaJobs()
+        return _fila
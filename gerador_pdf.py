@@ -0,0 +1,303 @@
+import html
+from io import BytesIO
+
+import fitz
+from docx.oxml.ns import qn
+
+from etapas import executar_etapas
+from medicoes import Medidor
+from mesclar_docx import MescladorDocx
+from perfis_raster import TRAVA_FITZ, abrir_pdf, fechar_pdf
+from dossie import (
+    ERRO_BALANCO_CURTO, MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2, abrir_docx_medido,
+    avisar_etapa, dossie_em_cache, guardar_dossie, impressoes_etapas, preencher_com_docx, mensagem_erro,
+    preparar_uploads, montar_contexto, preencher_marcadores, renderizar_template_medido
+)
+
+# Saída do dossiê direto em PDF, montada com o PyMuPDF.
+#
+# As seções de texto (template renderizado + notas + carta) são convertidas
+# para HTML simples e diagramadas com fitz.Story; nos marcadores do balanço e
+# da DRE, as páginas dos PDFs originais entram inteiras com insert_pdf, como
+# páginas vetoriais. Nada é rasterizado: o resultado fica menor, nítido e
+# pesquisável. Cabeçalhos/rodapés e o campo de sumário do Word não são
+# reproduzidos.
+
+MARCADOR_DRE = '[[DEMONSTR_RESULTADO]]'
+
+CSS = """
+body { font-family: sans-serif; font-size: 11pt; }
+p { margin: 0 0 4pt 0; }
+h1 { font-size: 14pt; margin: 6pt 0 8pt 0; }
+h2 { font-size: 13pt; margin: 6pt 0 6pt 0; }
+h3 { font-size: 11pt; margin: 4pt 0 2pt 0; }
+table { border-collapse: collapse; margin: 4pt 0; }
+td { border: 1px solid black; padding: 2pt; font-size: 9pt; }
+"""
+
+EMU_POR_PONTO = 12700
+_TAGS_TITULO = {'Heading1': 'h1', 'Heading2': 'h2', 'Heading3': 'h3', 'Title': 'h1'}
+_ALINHAMENTOS = {'center': 'center', 'right': 'right', 'end': 'right', 'both': 'justify'}
+
+
+class _ConversorHtml:
+    """Percorre o corpo do DOCX e o divide em segmentos: HTML, quebra de página ou marcador."""
+
+    def __init__(self, document, marcadores):
+        self.document = document
+        self.marcadores = marcadores
+        with TRAVA_FITZ:
+            self.arquivo = fitz.Archive()
+        self._num_imagens = 0
+        self.segmentos = []
+        self._html = []
+
+    def _fechar_html(self):
+        if self._html:
+            self.segmentos.append(('html', "".join(self._html)))
+            self._html = []
+
+    def _imagem(self, drawing):
+        blip = next(drawing.iter(qn('a:blip')), None)
+        extent = next(drawing.iter(qn('wp:extent')), None)
+        if blip is None:
+            return ""
+        part = self.document.part.related_parts.get(blip.get(qn('r:embed')))
+        if part is None:
+            return ""
+
+        self._num_imagens += 1
+        nome = f"img{self._num_imagens}{part.partname.ext and '.' + part.partname.ext}"
+        with TRAVA_FITZ:
+            self.arquivo.add(part.blob, nome)
+        largura = f' width="{int(extent.get("cx")) / EMU_POR_PONTO:.0f}"' if extent is not None else ""
+        return f'<img src="{nome}"{largura}/>'
+
+    def _runs(self, p):
+        partes = []
+        for r in p.iter(qn('w:r')):
+            texto = "".join(t.text or "" for t in r.iter(qn('w:t')))
+            rpr = r.find(qn('w:rPr'))
+            trecho = html.escape(texto)
+            if trecho and rpr is not None:
+                if rpr.find(qn('w:b')) is not None:
+                    trecho = f"<b>{trecho}</b>"
+                if rpr.find(qn('w:i')) is not None:
+                    trecho = f"<i>{trecho}</i>"
+                if rpr.find(qn('w:u')) is not None:
+                    trecho = f"<u>{trecho}</u>"
+            for drawing in r.iter(qn('w:drawing')):
+                trecho += self._imagem(drawing)
+            partes.append(trecho)
+        return "".join(partes)
+
+    def _paragrafo(self, p):
+        texto = "".join(t.text or "" for t in p.iter(qn('w:t')))
+        for marcador in self.marcadores:
+            if marcador in texto:
+                self._fechar_html()
+                self.segmentos.append(('marcador', marcador))
+                return
+
+        ppr = p.find(qn('w:pPr'))
+        estilo, alinhamento, lista = None, None, False
+        if ppr is not None:
+            if ppr.find(qn('w:pStyle')) is not None:
+                estilo = ppr.find(qn('w:pStyle')).get(qn('w:val'))
+            if ppr.find(qn('w:jc')) is not None:
+                alinhamento = _ALINHAMENTOS.get(ppr.find(qn('w:jc')).get(qn('w:val')))
+            lista = ppr.find(qn('w:numPr')) is not None
+            if ppr.find(qn('w:pageBreakBefore')) is not None:
+                self._quebra()
+
+        conteudo = self._runs(p) or "&nbsp;"
+        if lista:
+            conteudo = "• " + conteudo
+        tag = _TAGS_TITULO.get(estilo, 'p')
+        css = f' style="text-align:{alinhamento}"' if alinhamento else ""
+        self._html.append(f"<{tag}{css}>{conteudo}</{tag}>")
+
+        if any(br.get(qn('w:type')) == 'page' for br in p.iter(qn('w:br'))):
+            self._quebra()
+
+    def _tabela(self, tbl):
+        linhas = []
+        for tr in tbl.iter(qn('w:tr')):
+            celulas = []
+            for tc in tr.iter(qn('w:tc')):
+                texto = " ".join(
+                    "".join(t.text or "" for t in p.iter(qn('w:t'))) for p in tc.iter(qn('w:p'))
+                )
+                celulas.append(f"<td>{html.escape(texto.strip())}</td>")
+            linhas.append(f"<tr>{''.join(celulas)}</tr>")
+        self._html.append(f"<table>{''.join(linhas)}</table>")
+
+    def _quebra(self):
+        self._fechar_html()
+        self.segmentos.append(('quebra', None))
+
+    def converter(self, elementos=None, max_elementos=None):
+        corpo = self.document.element.body if elementos is None else elementos
+        if max_elementos is not None:
+            corpo = list(corpo)[:max_elementos]
+        for el in corpo:
+            if el.tag == qn('w:p'):
+                self._paragrafo(el)
+            elif el.tag == qn('w:tbl'):
+                self._tabela(el)
+            elif el.tag == qn('w:sdt'):
+                conteudo = el.find(qn('w:sdtContent'))
+                if conteudo is not None:
+                    self.converter(conteudo)
+        if elementos is None:
+            self._fechar_html()
+        return self.segmentos
+
+
+def _texto_visivel(trecho_html):
+    dentro_tag = False
+    for c in trecho_html:
+        if c == "<":
+            dentro_tag = True
+        elif c == ">":
+            dentro_tag = False
+        elif not dentro_tag and not c.isspace():
+            return True
+    return False
+
+
+def _tem_conteudo(trecho_html):
+    # Segmentos só com parágrafos vazios (entre quebras de página) não geram página.
+    return "<img" in trecho_html or "<td>" in trecho_html or _texto_visivel(trecho_html.replace("&nbsp;", ""))
+
+
+def _diagramar_html(trecho_html, arquivo, pagina, margens):
+    area = fitz.Rect(pagina.x0 + margens[0], pagina.y0 + margens[1],
+                     pagina.x1 - margens[2], pagina.y1 - margens[3])
+    saida = BytesIO()
+    with TRAVA_FITZ:
+        story = fitz.Story(trecho_html, user_css=CSS, archive=arquivo)
+        writer = fitz.DocumentWriter(saida)
+        mais = 1
+        while mais:
+            dispositivo = writer.begin_page(pagina)
+            mais, _ = story.place(area)
+            story.draw(dispositivo)
+            writer.end_page()
+        writer.close()
+        del story, writer, dispositivo
+        return fitz.open(stream=saida.getvalue(), filetype="pdf")
+
+
+def _pagina_e_margens(document):
+    secao = document.sections[0]
+    pagina = fitz.Rect(0, 0, secao.page_width.pt, secao.page_height.pt)
+    margens = (secao.left_margin.pt, secao.top_margin.pt, secao.right_margin.pt, secao.bottom_margin.pt)
+    return pagina, margens
+
+
+def diagramar(document, marcadores, max_elementos=None, modelo=None):
+    """Diagrama o documento python-docx na ordem do corpo, aos poucos.
+
+    Gerador de ('paginas', documento fitz com as páginas de um trecho de
+    texto) e ('marcador', marcador) onde algum dos `marcadores` aparece. O
+    documento fitz só vale até o próximo item. `max_elementos` limita a
+    diagramação aos primeiros elementos do corpo (prévias); o tamanho da
+    página e as margens vêm de `modelo` (padrão: o próprio documento).
+    """
+    conversor = _ConversorHtml(document, marcadores)
+    segmentos = conversor.converter(max_elementos=max_elementos)
+    pagina, margens = _pagina_e_margens(modelo or document)
+
+    try:
+        for tipo, valor in segmentos:
+            if tipo == 'html' and _tem_conteudo(valor):
+                parcial = _diagramar_html(valor, conversor.arquivo, pagina, margens)
+                try:
+                    yield 'paginas', parcial
+                finally:
+                    fechar_pdf(parcial)
+            elif tipo == 'marcador':
+                yield 'marcador', valor
+    finally:
+        with TRAVA_FITZ:
+            del conversor.arquivo
+
+
+def docx_para_pdf(document, paginas_por_marcador):
+    """Converte o documento python-docx em PDF, inserindo as páginas de PDF de cada marcador.
+
+    `paginas_por_marcador` mapeia o marcador para (documento fitz, lista de
+    índices de página ou None para todas).
+    """
+    with TRAVA_FITZ:
+        final = fitz.open()
+    try:
+        for tipo, valor in diagramar(document, paginas_por_marcador):
+            with TRAVA_FITZ:
+                if tipo == 'paginas':
+                    final.insert_pdf(valor)
+                else:
+                    origem, paginas = paginas_por_marcador[valor]
+                    for i in (paginas if paginas is not None else range(len(origem))):
+                        final.insert_pdf(origem, from_page=i, to_page=i)
+        with TRAVA_FITZ:
+            return final.tobytes(garbage=2, deflate=True)
+    finally:
+        fechar_pdf(final)
+
+
+def generate_pdf(input_data, progresso=None, medidor=None):
+    """Equivalente ao generate_document, mas retorna o dossiê em PDF. Retorna (bytes, erro)."""
+    medidor = medidor or Medidor()
+    avisar_etapa(progresso, 'uploads')
+    uploads, erro = medidor.medir('uploads', preparar_uploads, input_data)
+    if erro:
+        return None, erro
+
+    balanco = dre = None
+    try:
+        contexto = montar_contexto(input_data, MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2)
+        # O PDF não depende do perfil de imagem nem do modo: as páginas são copiadas.
+        impressoes = impressoes_etapas({**input_data, 'perfil_raster': None, 'modo_demonstracoes': None},
+                                       uploads, contexto)
+        anterior, chave = dossie_em_cache('pdf', impressoes, progresso, medidor)
+        if anterior is not None:
+            return anterior, None
+
+        balanco = abrir_pdf(uploads['balanco_file'])
+        dre = abrir_pdf(uploads['demstr_result_file'])
+        with TRAVA_FITZ:
+            paginas_balanco = len(balanco)
+        if paginas_balanco < 2:
+            return None, ERRO_BALANCO_CURTO
+
+        def montar(final_doc, notas, carta):
+            mesclador = MescladorDocx(final_doc)
+            preencher_marcadores(final_doc, {
+                '[[EXP_DEMONSTR]]': preencher_com_docx(final_doc, notas, mesclador),
+                '[[CARTA_RESP]]': preencher_com_docx(final_doc, carta, mesclador),
+            })
+            # Diagramação e cópia das páginas do balanço/DRE acontecem juntas.
+            return docx_para_pdf(final_doc, {
+                MARCADOR_BALANCO_PT1: (balanco, [0]),
+                MARCADOR_BALANCO_PT2: (balanco, [1]),
+                MARCADOR_DRE: (dre, None),
+            })
+
+        pdf = executar_etapas({
+            'template': (lambda: renderizar_template_medido(input_data.get('template'), contexto, medidor), []),
+            'notas': (lambda: abrir_docx_medido('notas', uploads['explic_demonstr_file'], medidor), []),
+            'carta': (lambda: abrir_docx_medido('carta', uploads['carta_responsb_file'], medidor), []),
+            'finalizando': (montar, ['template', 'notas', 'carta']),
+        }, progresso, medidor)['finalizando']
+        guardar_dossie(chave, pdf)
+        return pdf, None
+
+    except Exception as e:
+        return None, mensagem_erro(e)
+
+    finally:
+        for pdf_aberto in (balanco, dre):
+            if pdf_aberto is not None:
+                fechar_pdf(pdf_aberto)
@@ -0,0 +1,217 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import dossie
+import markdown_docx
+from campos import nome_saida_empresa, normalizar_campos
+from dossie import ARQUIVOS_OBRIGATORIOS, ARQUIVOS_TEXTO, gerar_dossie
+from validacao import validar_manifesto
+
+# Geração de dossiês em lote, sem interface: lê um manifesto (CSV ou JSON) com
+# uma empresa por linha/objeto e distribui as gerações em um pool de processos.
+#
+# Campos do manifesto:
+#   nome_empresa, razao_social_empresa, cnpj_empresa
+#   data_inicio, data_fim (AAAA-MM-DD) ou periodo_em_data/periodo_anual/data_dem_encerradas
+#   socios: lista de {nome, cpf, cargo} (JSON) ou "Nome;CPF;Cargo|Nome;CPF;Cargo" (CSV)
+#   balanco_file, demstr_result_file, explic_demonstr_file, carta_responsb_file
+#   arquivo_saida, perfil_raster, formato_saida ('docx' ou 'pdf'),
+#   modo_demonstracoes ('imagem' ou 'tabela'), template (nome no registro),
+#   otimizar_docx (1/sim: passada de otimizar_docx.py no DOCX final) (opcionais)
+# Caminhos relativos são resolvidos a partir da pasta do manifesto.
+
+
+@dataclass
+class ResultadoEmpresa:
+    nome_empresa: str
+    sucesso: bool
+    arquivo_saida: str = None
+    erro: str = None
+    segundos: float = 0.0
+
+
+def _normalizar_empresa(bruta, pasta_base):
+    empresa = normalizar_campos(bruta)
+
+    empresa['uploads'] = {}
+    for chave in ARQUIVOS_OBRIGATORIOS:
+        caminho = empresa.pop(chave, None)
+        empresa['uploads'][chave] = os.path.join(pasta_base, caminho) if caminho else None
+
+    return empresa
+
+
+def carregar_manifesto(caminho_manifesto):
+    """Lê o manifesto (.json ou .csv) e retorna a lista de input_data prontos para generate_document."""
+    pasta_base = os.path.dirname(os.path.abspath(caminho_manifesto))
+
+    if caminho_manifesto.lower().endswith(".json"):
+        with open(caminho_manifesto, encoding="utf-8") as f:
+            dados = json.load(f)
+        if isinstance(dados, dict):
+            dados = dados.get("empresas", [])
+    else:
+        with open(caminho_manifesto, encoding="utf-8-sig", newline="") as f:
+            dados = list(csv.DictReader(f))
+
+    return [_normalizar_empresa(empresa, pasta_base) for empresa in dados]
+
+
+def _nome_saida(input_data, pasta_saida):
+    return os.path.join(pasta_saida, nome_saida_empresa(input_data))
+
+
+def gerar_empresa(input_data, pasta_saida):
+    inicio = time.perf_counter()
+    nome = input_data.get('nome_empresa', '')
+
+    try:
+        file_data, error = gerar_dossie(input_data)
+    except Exception as e:
+        file_data, error = None, f"Erro durante a geração: {e}"
+
+    if not file_data:
+        return ResultadoEmpresa(nome, False, erro=error, segundos=time.perf_counter() - inicio)
+
+    arquivo_saida = _nome_saida(input_data, pasta_saida)
+    with open(arquivo_saida, "wb") as f:
+        f.write(file_data)
+
+    return ResultadoEmpresa(nome, True, arquivo_saida=arquivo_saida, segundos=time.perf_counter() - inicio)
+
+
+def preconverter_markdown(empresas):
+    """Converte de uma vez, numa chamada ao pandoc, as notas/cartas em Markdown do lote.
+
+    As conversões ficam no cache em disco, então os workers só as leem.
+    Falhas ficam para a geração de cada empresa relatar.
+    """
+    caminhos = {
+        empresa['uploads'][chave] for empresa in empresas for chave in ARQUIVOS_TEXTO
+        if empresa['uploads'].get(chave)
+    }
+    arquivos = []
+    for caminho in sorted(caminhos):
+        try:
+            with open(caminho, "rb") as f:
+                dados = f.read()
+        except OSError:
+            continue
+        if not markdown_docx.eh_docx(dados):
+            arquivos.append(dados)
+    if arquivos:
+        try:
+            markdown_docx.converter_markdown(arquivos)
+        except Exception:
+            pass
+
+
+def _iniciar_worker(raster_workers):
+    dossie.RASTER_WORKERS = raster_workers
+
+
+def gerar_lote(empresas, pasta_saida, workers=None, ao_concluir=None, raster_workers=1, validar=True,
+               invalidas=None):
+    """Gera os dossiês de todas as empresas em um pool de processos.
+
+    `workers` padrão é o número de núcleos; `ao_concluir(resultado)` é chamado
+    a cada empresa finalizada. Retorna os resultados na ordem do manifesto.
+    `raster_workers` é o pool de rasterização dentro de cada empresa: o padrão
+    1 evita competir com o paralelismo entre empresas. Com `validar`, o
+    manifesto inteiro passa pela validação prévia antes de tudo e as empresas
+    com problema falham na hora, sem ocupar o pool; quem já validou passa o
+    resultado de validar_manifesto em `invalidas`.
+    """
+    os.makedirs(pasta_saida, exist_ok=True)
+    resultados = [None] * len(empresas)
+    if invalidas is None:
+        invalidas = validar_manifesto(empresas) if validar else {}
+    for i, erros in invalidas.items():
+        resultados[i] = ResultadoEmpresa(empresas[i].get('nome_empresa', ''), False, erro=" ".join(erros))
+        if ao_concluir:
+            ao_concluir(resultados[i])
+    validas = [i for i in range(len(empresas)) if i not in invalidas]
+    preconverter_markdown([empresas[i] for i in validas])
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(raster_workers,)) as executor:
+        futuros = {
+            executor.submit(gerar_empresa, empresas[i], pasta_saida): i
+            for i in validas
+        }
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                resultado = ResultadoEmpresa(empresas[i].get('nome_empresa', ''), False, erro=str(e))
+            resultados[i] = resultado
+            if ao_concluir:
+                ao_concluir(resultado)
+
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dossiês contábeis em lote a partir de um manifesto CSV/JSON.")
+    parser.add_argument("manifesto", help="Arquivo .csv ou .json com uma empresa por linha/objeto")
+    parser.add_argument("-o", "--saida", default="dossies", help="Pasta onde os DOCX serão gravados")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Processos em paralelo (padrão: núcleos da máquina)")
+    parser.add_argument("--perfil", default=None,
+                        help="Perfil de imagem padrão (screen, print, archive, original) para quem não define perfil_raster")
+    parser.add_argument("--formato", choices=["docx", "pdf"], default=None,
+                        help="Formato de saída para quem não define formato_saida (padrão: docx)")
+    parser.add_argument("--modo", choices=["imagem", "tabela"], default=None,
+                        help="Balanço/DRE como imagens ou tabelas do Word, para quem não define modo_demonstracoes")
+    parser.add_argument("--otimizar", action="store_true",
+                        help="Otimiza o DOCX final (otimizar_docx.py) de quem não define otimizar_docx")
+    parser.add_argument("--raster-workers", type=int, default=1,
+                        help="Processos de rasterização por empresa (padrão: 1)")
+    parser.add_argument("--ignorar-invalidas", action="store_true",
+                        help="Gera as empresas válidas mesmo que outras falhem na validação prévia")
+    args = parser.parse_args(argv)
+
+    empresas = carregar_manifesto(args.manifesto)
+    # Opções da linha de comando valem para as empresas que não definem o campo no manifesto.
+    padroes = {'perfil_raster': args.perfil, 'formato_saida': args.formato, 'modo_demonstracoes': args.modo,
+               'otimizar_docx': args.otimizar}
+    for empresa in empresas:
+        for chave, valor in padroes.items():
+            if valor and not empresa.get(chave):
+                empresa[chave] = valor
+
+    inicio = time.perf_counter()
+    invalidas = validar_manifesto(empresas)
+    print(f"Validação prévia: {len(empresas)} empresas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    for i, erros in invalidas.items():
+        print(f"⚠️  {empresas[i].get('nome_empresa', '')}: {' '.join(erros)}")
+    if invalidas and not args.ignorar_invalidas:
+        print(f"\n{len(invalidas)} empresa(s) com problemas: nada foi gerado. "
+              "Corrija o manifesto ou use --ignorar-invalidas para gerar as demais.")
+        return 2
+
+    def relatar(resultado):
+        if resultado.sucesso:
+            print(f"✅ {resultado.nome_empresa} ({resultado.segundos:.1f}s) -> {resultado.arquivo_saida}")
+        else:
+            print(f"❌ {resultado.nome_empresa} ({resultado.segundos:.1f}s): {resultado.erro}")
+
+    inicio = time.perf_counter()
+    resultados = gerar_lote(empresas, args.saida, workers=args.workers, ao_concluir=relatar,
+                            raster_workers=args.raster_workers, invalidas=invalidas)
+    total = time.perf_counter() - inicio
+
+    sucessos = sum(1 for r in resultados if r.sucesso)
+    vazao = len(resultados) / total * 60 if total else 0
+    print(f"\n{sucessos}/{len(resultados)} dossiês gerados em {total:.1f}s ({vazao:.1f} empresas/min)")
+
+    return 0 if sucessos == len(resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
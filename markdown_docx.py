@@ -0,0 +1,172 @@
+import os
+import re
+import tempfile
+import threading
+from io import BytesIO
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from cache_raster import CacheRaster, hash_conteudo
+
+# Conversão das notas explicativas e da carta em Markdown para DOCX.
+#
+# Cada conversão pelo pypandoc abre um processo do pandoc e passa por um
+# arquivo temporário. Como as notas costumam ser o mesmo modelo para muitas
+# empresas, o DOCX convertido fica num cache endereçado pelo conteúdo do
+# Markdown (memória + disco, compartilhado entre processos): gerar de novo, ou
+# gerar outra empresa com o mesmo modelo, não chama o pandoc.
+#
+# Quando há vários arquivos a converter, vão todos numa única chamada: os
+# textos são concatenados com um parágrafo separador e o DOCX resultante é
+# cortado de volta em um DOCX por arquivo. Arquivos com notas de rodapé,
+# definições de link por referência (`[id]: url`, que valem para o texto
+# inteiro), bloco de metadados YAML ou bloco de código aberto interferem nos
+# vizinhos e são convertidos sozinhos.
+
+# Mudar a versão invalida o cache (ex.: outros argumentos do pandoc).
+VERSAO_CONVERSAO = "2"
+
+PASTA_CACHE_MARKDOWN = os.environ.get(
+    "DOSSIE_CACHE_MARKDOWN_DIR", os.path.join(tempfile.gettempdir(), "dossie_cache_markdown")
+)
+LIMITE_MEMORIA_MARKDOWN = int(os.environ.get("DOSSIE_CACHE_MARKDOWN_MB", "32")) * 1024 * 1024
+
+_SEPARADOR = "DOSSIE-SEPARADOR-DE-ARQUIVO-5f1c9a"
+_DEFINICAO_LINK = re.compile(r"^ {0,3}\[[^\]\n]+\]:", re.MULTILINE)
+_CERCA = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$", re.MULTILINE)
+
+
+def eh_docx(dados):
+    # DOCX é um zip; o resto é tratado como Markdown.
+    return dados[:4] == b"PK\x03\x04"
+
+
+def chave_markdown(dados):
+    return f"md_{VERSAO_CONVERSAO}_{hash_conteudo(dados)}"
+
+
+def _texto(dados):
+    try:
+        return dados.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("Os arquivos de texto devem ser DOCX ou Markdown (UTF-8).")
+
+
+def _cercas_fechadas(texto):
+    # Um bloco de código (``` ou ~~~) aberto até o fim do arquivo engoliria o
+    # separador do lote. Fecha com o mesmo caractere, pelo menos do mesmo
+    # tamanho e sem nada depois, como no CommonMark.
+    aberta = None
+    for m in _CERCA.finditer(texto):
+        cerca, resto = m.groups()
+        if aberta is None:
+            aberta = cerca
+        elif cerca[0] == aberta[0] and len(cerca) >= len(aberta) and not resto.strip():
+            aberta = None
+    return aberta is None
+
+
+def _pode_agrupar(texto):
+    return (
+        "[^" not in texto and not _DEFINICAO_LINK.search(texto)
+        and not texto.lstrip().startswith("---") and _cercas_fechadas(texto)
+    )
+
+
+def _pandoc(texto):
+    import pypandoc  # só quando há o que converter: cache quente não precisa do pandoc
+
+    with tempfile.TemporaryDirectory() as pasta:
+        saida = os.path.join(pasta, "convertido.docx")
+        pypandoc.convert_text(texto, "docx", format="markdown", outputfile=saida)
+        with open(saida, "rb") as f:
+            return f.read()
+
+
+def _separar(docx, partes):
+    """Corta o DOCX do lote nos parágrafos separadores. None se o corte não bater."""
+    corpo = Document(BytesIO(docx)).element.body
+    filhos = [el for el in corpo if el.tag != qn('w:sectPr')]
+    cortes = [
+        i for i, el in enumerate(filhos)
+        if el.tag == qn('w:p') and "".join(t.text or "" for t in el.iter(qn('w:t'))).strip() == _SEPARADOR
+    ]
+    if len(cortes) != partes - 1:
+        return None
+
+    limites = list(zip([-1] + cortes, cortes + [len(filhos)]))
+    convertidos = []
+    for inicio, fim in limites:
+        # Cada parte parte do DOCX inteiro (estilos, numeração, mídia) e fica só com o seu trecho.
+        documento = Document(BytesIO(docx))
+        for i, el in enumerate(el for el in list(documento.element.body) if el.tag != qn('w:sectPr')):
+            if not inicio < i < fim:
+                el.getparent().remove(el)
+        buffer = BytesIO()
+        documento.save(buffer)
+        convertidos.append(buffer.getvalue())
+    return convertidos
+
+
+def _converter_lote(textos):
+    if len(textos) == 1:
+        return [_pandoc(textos[0])]
+    juntos = f"\n\n{_SEPARADOR}\n\n".join(texto.rstrip() for texto in textos)
+    convertidos = _separar(_pandoc(juntos), len(textos))
+    if convertidos is None:
+        return [_pandoc(texto) for texto in textos]
+    return convertidos
+
+
+def converter_markdown(arquivos, cache=None):
+    """Converte uma lista de Markdown (bytes) em DOCX (bytes), na mesma ordem.
+
+    Usa o cache por conteúdo; o que falta é convertido numa única chamada
+    ao pandoc (mais uma por arquivo que não pode ser agrupado).
+    """
+    cache = cache or obter_cache_markdown()
+    chaves = [chave_markdown(dados) for dados in arquivos]
+    resultado = {}
+    faltando = {}
+    for chave, dados in zip(chaves, arquivos):
+        if chave in resultado or chave in faltando:
+            continue
+        convertido = cache.get(chave)
+        if convertido is not None:
+            resultado[chave] = convertido
+        else:
+            faltando[chave] = _texto(dados)
+
+    if faltando:
+        agrupaveis = [chave for chave, texto in faltando.items() if _pode_agrupar(texto)]
+        sozinhos = [chave for chave in faltando if chave not in agrupaveis]
+        lotes = ([agrupaveis] if agrupaveis else []) + [[chave] for chave in sozinhos]
+        for lote in lotes:
+            for chave, convertido in zip(lote, _converter_lote([faltando[chave] for chave in lote])):
+                cache.put(chave, convertido)
+                resultado[chave] = convertido
+
+    return [resultado[chave] for chave in chaves]
+
+
+def converter_uploads(uploads, chaves):
+    """Cópia de `uploads` com os arquivos Markdown de `chaves` já convertidos para DOCX."""
+    markdown = [chave for chave in chaves if chave in uploads and not eh_docx(uploads[chave])]
+    if not markdown:
+        return uploads
+    convertidos = converter_markdown([uploads[chave] for chave in markdown])
+    return {**uploads, **dict(zip(markdown, convertidos))}
+
+
+_cache_markdown = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache_markdown():
+    """Cache de conversões do processo (variáveis DOSSIE_CACHE_MARKDOWN_*)."""
+    global _cache_markdown
+    with _cache_lock:
+        if _cache_markdown is None:
+            _cache_markdown = CacheRaster(limite_memoria=LIMITE_MEMORIA_MARKDOWN, pasta=PASTA_CACHE_MARKDOWN)
+        return _cache_markdown
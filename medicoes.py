@@ -0,0 +1,198 @@
+import dataclasses
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Medições por etapa da geração: tempo de relógio, tempo de CPU da thread
+# que executou a etapa, memória (RSS) do processo e bytes produzidos. Cada
+# geração vira uma linha JSON em ARQUIVO_LOG, para acompanhar regressões e
+# achar arquivos de clientes que deixam tudo lento.
+#
+# A memória é o RSS atual do processo (/proc/self/statm), amostrado a cada
+# INTERVALO_AMOSTRAGEM_RSS enquanto alguma etapa roda: cada etapa informa o
+# pico do processo durante ela e a variação do início ao fim, e o resumo, o
+# pico da geração e quanto ele ficou acima do RSS inicial. O máximo do
+# getrusage é o da vida inteira do processo e, num worker que já gerou
+# outros dossiês, não diz nada sobre esta geração. As etapas rodam em
+# paralelo: o pico de uma etapa inclui o que as outras ocupavam ao mesmo
+# tempo. Fora do Linux não há RSS atual e os campos ficam vazios. A CPU e a
+# memória dos processos do pool de rasterização não entram.
+
+ARQUIVO_LOG = os.environ.get(
+    "DOSSIE_LOG_MEDICOES", os.path.join(tempfile.gettempdir(), "dossie_medicoes.jsonl")
+)
+
+INTERVALO_AMOSTRAGEM_RSS = float(os.environ.get("DOSSIE_AMOSTRAGEM_RSS_S", "0.02"))
+
+_log_lock = threading.Lock()
+_TAMANHO_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def pico_rss_mb():
+    """Pico de RSS da vida inteira do processo (ex.: um caso do benchmark, num processo novo)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes.
+    return pico / 1e6 if sys.platform == "darwin" else pico / 1e3
+
+
+def rss_atual_mb():
+    """RSS atual do processo, ou None onde não há /proc."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _TAMANHO_PAGINA / 1e6
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(valor):
+    return round(valor, 1) if valor is not None else None
+
+
+def tamanho_bytes(resultado):
+    """Bytes "produzidos" por uma etapa: soma dos bytes dentro de listas/tuplas/dicts."""
+    if isinstance(resultado, (bytes, bytearray)):
+        return len(resultado)
+    if isinstance(resultado, BytesIO):
+        return resultado.getbuffer().nbytes
+    if isinstance(resultado, str):
+        return len(resultado.encode())
+    if isinstance(resultado, (list, tuple)):
+        return sum(tamanho_bytes(item) for item in resultado)
+    if isinstance(resultado, dict):
+        return sum(tamanho_bytes(item) for item in resultado.values())
+    if dataclasses.is_dataclass(resultado) and not isinstance(resultado, type):
+        # Ex.: TabelaExtraida, contada pelo texto das células.
+        return sum(tamanho_bytes(getattr(resultado, campo.name)) for campo in dataclasses.fields(resultado))
+    return 0
+
+
+class _Etapa:
+    def __init__(self, nome, rss):
+        self.nome = nome
+        self.bytes = 0
+        self.rss_inicio = self.pico = rss
+
+
+class Medidor:
+    """Acumula as medições das etapas de uma geração (seguro entre threads)."""
+
+    def __init__(self):
+        self.etapas = []
+        self.anotacoes = {}
+        self._inicio = time.perf_counter()
+        self._lock = threading.Lock()
+        self._rss_inicial = self._pico = rss_atual_mb()
+        self._abertas = []          # _Etapa em andamento
+        self._amostrador = None
+
+    def _amostrar(self):
+        rss = rss_atual_mb()
+        if rss is None:
+            return None
+        with self._lock:
+            self._pico = max(self._pico, rss)
+            for medida in self._abertas:
+                medida.pico = max(medida.pico, rss)
+        return rss
+
+    def _amostrar_em_fundo(self):
+        # Roda enquanto houver etapa aberta; a próxima etapa sobe outra thread.
+        while True:
+            with self._lock:
+                if not self._abertas:
+                    self._amostrador = None
+                    return
+            self._amostrar()
+            time.sleep(INTERVALO_AMOSTRAGEM_RSS)
+
+    @contextmanager
+    def etapa(self, nome):
+        medida = _Etapa(nome, rss_atual_mb())
+        with self._lock:
+            self._abertas.append(medida)
+            if medida.rss_inicio is not None and self._amostrador is None:
+                self._amostrador = threading.Thread(target=self._amostrar_em_fundo, daemon=True)
+                self._amostrador.start()
+        inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield medida
+        finally:
+            rss = self._amostrar()
+            registro = {
+                'etapa': nome,
+                'segundos': round(time.perf_counter() - inicio, 4),
+                'cpu_segundos': round(time.thread_time() - inicio_cpu, 4),
+                'pico_rss_mb': _mb(medida.pico),
+                'delta_rss_mb': _mb(rss - medida.rss_inicio) if rss is not None else None,
+                'bytes': medida.bytes,
+            }
+            with self._lock:
+                self._abertas.remove(medida)
+                self.etapas.append(registro)
+
+    def medir(self, nome, funcao, *args):
+        with self.etapa(nome) as medida:
+            resultado = funcao(*args)
+            medida.bytes += tamanho_bytes(resultado)
+        return resultado
+
+    def somar_bytes(self, nome, quantidade):
+        """Bytes de uma etapa que o resultado não mostra (ex.: páginas que ela só
+        entrega depois de terminar); vale durante ou depois da etapa."""
+        with self._lock:
+            for medida in self._abertas:
+                if medida.nome == nome:
+                    medida.bytes += quantidade
+                    return
+            for registro in self.etapas:
+                if registro['etapa'] == nome:
+                    registro['bytes'] += quantidade
+                    return
+
+    def anotar(self, chave, valor):
+        """Informação extra da geração (ex.: relatório da otimização), incluída no resumo."""
+        with self._lock:
+            self.anotacoes[chave] = valor
+
+    def resumo(self):
+        self._amostrar()
+        with self._lock:
+            etapas = list(self.etapas)
+            anotacoes = dict(self.anotacoes)
+            pico, inicial = self._pico, self._rss_inicial
+        return {
+            'segundos': round(time.perf_counter() - self._inicio, 4),
+            'pico_rss_mb': _mb(pico),
+            'acrescimo_rss_mb': _mb(pico - inicial) if pico is not None else None,
+            'etapas': etapas,
+            **anotacoes,
+        }
+
+
+def gravar_log(registro, arquivo=None):
+    """Acrescenta `registro` como uma linha JSON ao log de medições (desligado se o caminho for vazio)."""
+    arquivo = ARQUIVO_LOG if arquivo is None else arquivo
+    if not arquivo:
+        return
+    linha = json.dumps(
+        {'data': datetime.datetime.now().isoformat(timespec="seconds"), **registro},
+        ensure_ascii=False, default=str,
+    )
+    try:
+        with _log_lock, open(arquivo, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+    except OSError:
+        pass  # medição nunca derruba a geração
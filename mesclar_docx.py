@@ -0,0 +1,351 @@
+import copy
+import hashlib
+import re
+from io import BytesIO
+
+from docx.image.exceptions import UnrecognizedImageError
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part, PartFactory, XmlPart
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from docx.parts.numbering import NumberingPart
+
+# Mescla do corpo de um DOCX (notas explicativas, carta de responsabilidade)
+# dentro do documento principal.
+#
+# Mover só o XML do corpo quebra tudo o que ele referencia por relacionamento:
+# imagens (logos, assinaturas), hyperlinks, objetos incorporados, além das
+# listas numeradas (numbering.xml) e dos estilos próprios do arquivo. Aqui,
+# numa única passada por elemento, cada r:id/r:embed é refeito no documento
+# principal, as definições de numeração são copiadas com ids novos e os
+# estilos que faltam no template são trazidos junto.
+#
+# Imagens passam pelo get_or_add_image do python-docx, que identifica a mídia
+# pelo SHA1 do conteúdo: a mesma logo no template, nas notas e na carta fica
+# uma vez só no pacote. Outras partes (gráficos, OLE, imagens em formatos que
+# o python-docx não reconhece) são copiadas com hash do conteúdo, também sem
+# duplicar. Cabeçalhos/rodapés do arquivo inserido não entram: vale o papel
+# timbrado do template.
+#
+# Notas de rodapé, notas de fim e comentários (o pandoc gera notas a partir de
+# `[^1]`) moram em partes próprias: cada entrada referenciada é copiada para
+# a parte do documento principal, criada se ainda não existir, com w:id novo,
+# e as referências do corpo importado são renumeradas. Referência sem entrada
+# na origem é removida: o Word trata o arquivo como corrompido.
+
+_NS_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_TAGS_ESTILO = {qn('w:pStyle'), qn('w:rStyle'), qn('w:tblStyle')}
+_REFS_SECAO = {qn('w:headerReference'), qn('w:footerReference')}
+# reltype -> (content type, nome da parte, tag da entrada, tags que a referenciam pelo w:id)
+_NOTAS = {
+    RT.FOOTNOTES: (CT.WML_FOOTNOTES, '/word/footnotes.xml', 'w:footnote', ('w:footnoteReference',)),
+    RT.ENDNOTES: (CT.WML_ENDNOTES, '/word/endnotes.xml', 'w:endnote', ('w:endnoteReference',)),
+    RT.COMMENTS: (CT.WML_COMMENTS, '/word/comments.xml', 'w:comment',
+                  ('w:commentReference', 'w:commentRangeStart', 'w:commentRangeEnd')),
+}
+_REFS_NOTA = {qn(tag): reltype for reltype, (*_, tags) in _NOTAS.items() for tag in tags}
+_XML_NUMERACAO = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'
+)
+
+
+def _parte_relacionada(part, reltype):
+    try:
+        return part.part_related_by(reltype)
+    except KeyError:
+        return None
+
+
+def _modelo_nome(partname):
+    # /word/charts/chart3.xml -> /word/charts/chart%d.xml
+    return re.sub(r"\d*(\.\w+)$", r"%d\1", partname)
+
+
+class _Varredura:
+    """Referências encontradas numa passada pelos elementos importados."""
+
+    def __init__(self):
+        self.estilos = set()
+        self.nums = []          # nós w:numId
+        self.rels = []          # (nó, atributo r:*)
+        self.secao = []         # w:headerReference/w:footerReference
+        self.notas = {}         # reltype -> nós que referenciam notas/comentários
+
+    def varrer(self, raiz):
+        for no in raiz.iter():
+            tag = no.tag
+            if tag in _REFS_SECAO:
+                self.secao.append(no)
+                continue
+            if tag in _REFS_NOTA:
+                self.notas.setdefault(_REFS_NOTA[tag], []).append(no)
+                continue
+            if tag in _TAGS_ESTILO:
+                self.estilos.add(no.get(qn('w:val')))
+            elif tag == qn('w:numId') and no.get(qn('w:val')) not in (None, "0"):
+                self.nums.append(no)
+            for atributo in no.attrib:
+                if atributo.startswith(_NS_R):
+                    self.rels.append((no, atributo))
+
+
+class MescladorDocx:
+    """Importa o corpo de outros DOCX para `main_doc`, refazendo relacionamentos,
+    numeração e estilos. Uma instância por documento principal: as partes já
+    copiadas são reaproveitadas entre as notas e a carta."""
+
+    def __init__(self, main_doc):
+        self.main_doc = main_doc
+        self.part = main_doc.part
+        self.package = self.part.package
+        self._partes = {}           # hash do conteúdo -> parte copiada para o pacote
+        self._nomes_reservados = set()
+        self._numeracao = None
+        self._proximo_abstract = 0
+        self._proximo_num = 1
+        self._notas = {}            # reltype -> [elemento raiz da parte, próximo w:id]
+
+    def importar(self, origem):
+        """Prepara os elementos do corpo de `origem` (Document) para entrar em main_doc.
+
+        Retorna a lista de elementos do corpo (sem o w:sectPr final), já com
+        as referências apontando para o documento principal.
+        """
+        elementos = [el for el in origem.element.body if el.tag != qn('w:sectPr')]
+
+        varredura = _Varredura()
+        for elemento in elementos:
+            varredura.varrer(elemento)
+        # Entradas de notas/comentários: varridas junto (estilos, numeração), mas
+        # com relacionamentos próprios, relativos à parte de notas.
+        notas = [self._copiar_notas(origem.part, reltype, nos, varredura)
+                 for reltype, nos in varredura.notas.items()]
+        # Estilos copiados podem trazer numeração própria (ex.: "Lista com marcadores").
+        for estilo in self._copiar_estilos(origem, varredura.estilos):
+            varredura.varrer(estilo)
+
+        # Quebras de seção internas: cabeçalho/rodapé continuam os do template.
+        for no in varredura.secao:
+            no.getparent().remove(no)
+
+        self._refazer_relacionamentos(varredura.rels, origem.part, self.part)
+        for parte_origem, parte_destino, rels in notas:
+            self._refazer_relacionamentos(rels, parte_origem, parte_destino)
+
+        mapa_nums = self._copiar_numeracao(origem.part, {no.get(qn('w:val')) for no in varredura.nums})
+        for no in varredura.nums:
+            novo = mapa_nums.get(no.get(qn('w:val')))
+            if novo is not None:
+                no.set(qn('w:val'), novo)
+        return elementos
+
+    def _refazer_relacionamentos(self, rels, parte_origem, parte_destino):
+        mapa_rels = {}
+        for no, atributo in rels:
+            rid = no.get(atributo)
+            if rid not in mapa_rels:
+                mapa_rels[rid] = self._copiar_relacionamento(parte_origem, rid, parte_destino)
+            if mapa_rels[rid] is not None:
+                no.set(atributo, mapa_rels[rid])
+
+    def _copiar_notas(self, parte_origem, reltype, refs, varredura):
+        """Copia as entradas referenciadas por `refs` para a parte de notas do
+        documento principal e renumera as referências.
+
+        Retorna (parte de origem, parte de destino, relacionamentos das
+        entradas copiadas); as referências sem entrada são removidas.
+        """
+        _, _, tag, _ = _NOTAS[reltype]
+        fonte = _parte_relacionada(parte_origem, reltype)
+        raiz = None
+        if fonte is not None:
+            raiz = fonte.element if isinstance(fonte, XmlPart) else parse_xml(fonte.blob)
+        entradas = {e.get(qn('w:id')): e for e in raiz.iter(qn(tag))} if raiz is not None else {}
+
+        destino, rels = None, []
+        mapa = {}
+        for no in refs:
+            id_origem = no.get(qn('w:id'))
+            if id_origem not in mapa and id_origem in entradas:
+                if destino is None:
+                    destino = self._obter_notas(reltype, raiz)
+                elemento, proximo = self._notas[reltype]
+                nova = copy.deepcopy(entradas[id_origem])
+                nova.set(qn('w:id'), str(proximo))
+                self._notas[reltype][1] = proximo + 1
+                elemento.append(nova)
+                mapa[id_origem] = str(proximo)
+
+                da_nota = _Varredura()
+                da_nota.varrer(nova)
+                varredura.estilos |= da_nota.estilos
+                varredura.nums += da_nota.nums
+                rels += da_nota.rels
+            if id_origem in mapa:
+                no.set(qn('w:id'), mapa[id_origem])
+            else:
+                no.getparent().remove(no)
+        return fonte, destino, rels
+
+    def _obter_notas(self, reltype, raiz_origem):
+        # Parte de notas do documento principal; se não existir, nasce com as
+        # entradas especiais da origem (separadores, w:type), que não são referenciadas.
+        parte = _parte_relacionada(self.part, reltype)
+        if reltype not in self._notas:
+            content_type, nome, tag, _ = _NOTAS[reltype]
+            if parte is None:
+                raiz = copy.deepcopy(raiz_origem)
+                for entrada in raiz.findall(qn(tag)):
+                    if entrada.get(qn('w:type')) in (None, 'normal'):
+                        raiz.remove(entrada)
+                classe = PartFactory.part_type_for.get(content_type, XmlPart)
+                parte = classe.load(self._nome_livre(nome), content_type, serialize_part_xml(raiz), self.package)
+                self.part.relate_to(parte, reltype)
+            elif not isinstance(parte, XmlPart):
+                parte = self._parte_xml(parte)
+            proximo = 1 + max((int(e.get(qn('w:id'))) for e in parte.element.iter(qn(tag))), default=0)
+            self._notas[reltype] = [parte.element, max(proximo, 1)]
+        return parte
+
+    def _parte_xml(self, parte):
+        # O python-docx carrega notas de rodapé/fim como partes binárias, que
+        # gravam o blob lido. Só a parte deste documento vira XmlPart (mesmo
+        # nome e relacionamentos), para que as entradas acrescentadas sejam
+        # serializadas ao salvar; a PartFactory do processo fica como está.
+        nova = XmlPart.load(parte.partname, parte.content_type, parte.blob, self.package)
+        for rel in parte.rels.values():
+            nova.load_rel(rel.reltype, rel.target_ref if rel.is_external else rel.target_part, rel.rId, rel.is_external)
+        for rid, rel in list(self.part.rels.items()):
+            if not rel.is_external and rel.target_part is parte:
+                del self.part.rels[rid]
+                self.part.load_rel(rel.reltype, nova, rid)
+        return nova
+
+    def _copiar_estilos(self, origem, ids):
+        destino = self.main_doc.styles.element
+        fonte = origem.styles.element
+        copiados = []
+        pendentes = list(ids)
+        while pendentes:
+            style_id = pendentes.pop()
+            # Estilo que o template já tem prevalece: o dossiê fica com a formatação dele.
+            if style_id is None or destino.get_by_id(style_id) is not None:
+                continue
+            estilo = fonte.get_by_id(style_id)
+            if estilo is None:
+                continue
+            novo = copy.deepcopy(estilo)
+            destino.append(novo)
+            copiados.append(novo)
+            for tag in ('w:basedOn', 'w:next', 'w:link'):
+                ref = novo.find(qn(tag))
+                if ref is not None:
+                    pendentes.append(ref.get(qn('w:val')))
+        return copiados
+
+    def _copiar_relacionamento(self, parte_origem, rid, parte_destino):
+        rel = parte_origem.rels.get(rid)
+        if rel is None:
+            return None
+        if rel.is_external:
+            return parte_destino.relate_to(rel.target_ref, rel.reltype, is_external=True)
+
+        alvo = rel.target_part
+        if rel.reltype == RT.IMAGE:
+            try:
+                return parte_destino.relate_to(self.package.get_or_add_image_part(BytesIO(alvo.blob)), RT.IMAGE)
+            except UnrecognizedImageError:
+                pass  # EMF/WMF e afins: copiados como parte genérica
+        return parte_destino.relate_to(self._copiar_parte(alvo), rel.reltype)
+
+    def _nome_livre(self, partname):
+        usados = {p.partname for p in self.package.iter_parts()} | self._nomes_reservados
+        if partname not in usados:
+            self._nomes_reservados.add(PackURI(partname))
+            return PackURI(partname)
+        modelo = _modelo_nome(partname)
+        i = 1
+        while PackURI(modelo % i) in usados:
+            i += 1
+        nome = PackURI(modelo % i)
+        self._nomes_reservados.add(nome)
+        return nome
+
+    def _copiar_parte(self, parte):
+        blob = parte.blob
+        chave = hashlib.sha256(parte.content_type.encode() + b"\0" + blob).hexdigest()
+        copia = self._partes.get(chave)
+        if copia is not None:
+            return copia
+
+        copia = Part(self._nome_livre(parte.partname), parte.content_type, blob, self.package)
+        self._partes[chave] = copia
+        # Mantém os mesmos rIds: o XML da parte copiada continua válido sem reescrita.
+        for rel in parte.rels.values():
+            if rel.is_external:
+                copia.rels.add_relationship(rel.reltype, rel.target_ref, rel.rId, is_external=True)
+            else:
+                copia.rels.add_relationship(rel.reltype, self._copiar_parte(rel.target_part), rel.rId)
+        return copia
+
+    def _obter_numeracao(self):
+        if self._numeracao is None:
+            parte = _parte_relacionada(self.part, RT.NUMBERING)
+            if parte is None:
+                parte = NumberingPart.load(
+                    self._nome_livre('/word/numbering.xml'), CT.WML_NUMBERING, _XML_NUMERACAO, self.package
+                )
+                self.part.relate_to(parte, RT.NUMBERING)
+            self._numeracao = parte.element
+            self._proximo_abstract = 1 + max(
+                (int(a.get(qn('w:abstractNumId'))) for a in self._numeracao.findall(qn('w:abstractNum'))),
+                default=-1,
+            )
+            self._proximo_num = 1 + max(
+                (int(n.get(qn('w:numId'))) for n in self._numeracao.findall(qn('w:num'))),
+                default=0,
+            )
+        return self._numeracao
+
+    def _copiar_numeracao(self, parte_origem, nums):
+        fonte = _parte_relacionada(parte_origem, RT.NUMBERING) if nums else None
+        if fonte is None:
+            return {}
+
+        destino = self._obter_numeracao()
+        abstratos = {a.get(qn('w:abstractNumId')): a for a in fonte.element.findall(qn('w:abstractNum'))}
+        definicoes = {n.get(qn('w:numId')): n for n in fonte.element.findall(qn('w:num'))}
+        # No numbering.xml todos os w:abstractNum vêm antes dos w:num.
+        primeiro_num = destino.find(qn('w:num'))
+
+        mapa, mapa_abstratos = {}, {}
+        for num_id in sorted(nums):
+            num = definicoes.get(num_id)
+            if num is None:
+                continue
+            ref = num.find(qn('w:abstractNumId'))
+            abstrato_id = ref.get(qn('w:val')) if ref is not None else None
+            if abstrato_id in abstratos and abstrato_id not in mapa_abstratos:
+                novo_abstrato = copy.deepcopy(abstratos[abstrato_id])
+                mapa_abstratos[abstrato_id] = str(self._proximo_abstract)
+                self._proximo_abstract += 1
+                novo_abstrato.set(qn('w:abstractNumId'), mapa_abstratos[abstrato_id])
+                if primeiro_num is not None:
+                    primeiro_num.addprevious(novo_abstrato)
+                else:
+                    destino.append(novo_abstrato)
+
+            novo = copy.deepcopy(num)
+            mapa[num_id] = str(self._proximo_num)
+            self._proximo_num += 1
+            novo.set(qn('w:numId'), mapa[num_id])
+            if abstrato_id in mapa_abstratos:
+                novo.find(qn('w:abstractNumId')).set(qn('w:val'), mapa_abstratos[abstrato_id])
+            destino.append(novo)
+            if primeiro_num is None:
+                primeiro_num = novo
+        return mapa
@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import math
+import posixpath
+import sys
+import zipfile
+import zlib
+from io import BytesIO
+
+from lxml import etree
+
+from perfis_raster import obter_perfil
+
+# Otimização opcional do pacote DOCX já montado, direto no zip.
+#
+# O python-docx grava o que estiver no pacote: relacionamentos e partes que
+# vieram das notas/carta e não são mais usados, estilos que ninguém aplica,
+# a mesma mídia em duas partes e tudo com deflate, inclusive PNG/JPEG, que
+# não encolhem. Aqui, numa passada:
+#   - relacionamentos por r:id (imagens, hyperlinks, gráficos, cabeçalhos...)
+#     sem referência no XML de origem saem, e com eles as partes que ficam
+#     inalcançáveis a partir de _rels/.rels;
+#   - mídias idênticas (sha256) passam a ser uma parte só;
+#   - estilos que nenhum parágrafo, run, tabela ou numeração usa (nem por
+#     basedOn/next/link) saem do styles.xml;
+#   - imagens com resolução acima do perfil de imagem na largura em que são
+#     exibidas (logos e fotos das notas/carta) são reduzidas;
+#   - a compressão é escolhida por entrada: XML com deflate; PNG/JPEG/GIF
+#     só com deflate se ele de fato reduzir (páginas rasterizadas, com muito
+#     branco, ainda encolhem uns 15%), senão sem compressão.
+# Retorna também um relatório com os bytes economizados.
+
+_NS_CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_NS_WP = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+_NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_RT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+
+# Relacionamentos que só existem para ser referenciados por id no XML da parte de origem.
+_POR_ID = {_RT + tipo for tipo in (
+    "image", "hyperlink", "chart", "oleObject", "package", "header", "footer",
+    "diagramData", "diagramLayout", "diagramQuickStyle", "diagramColors", "video", "audio",
+)}
+_TIPO_ESTILOS = _RT + "styles"
+_TAGS_USO_ESTILO = {f"{{{_NS_W}}}{tag}" for tag in (
+    "pStyle", "rStyle", "tblStyle", "numStyleLink", "styleLink", "clickAndTypeStyle", "defaultTableStyle",
+)}
+_TAGS_LIGACAO_ESTILO = ("basedOn", "next", "link")
+
+_JA_COMPRIMIDAS = (".png", ".jpg", ".jpeg", ".jpe", ".gif")
+# Mídia já comprimida só vai com deflate se ele reduzir pelo menos isso.
+_GANHO_MINIMO_DEFLATE = 0.05
+_EMU_POR_POL = 914400
+# Só reduz imagens com pelo menos 25% de pixels além do necessário.
+_MARGEM_RESOLUCAO = 1.25
+
+
+def _rels_de(parte):
+    """Nome do .rels de uma parte ('' é o pacote)."""
+    pasta, nome = posixpath.split(parte)
+    return posixpath.join(pasta, "_rels", nome + ".rels")
+
+
+def _origem_de(rels):
+    pasta_rels, nome = posixpath.split(rels)
+    return posixpath.join(posixpath.dirname(pasta_rels), nome[:-len(".rels")])
+
+
+def _resolver(origem, alvo):
+    if alvo.startswith("/"):
+        return alvo.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(origem), alvo))
+
+
+def _eh_xml(nome):
+    return nome.endswith((".xml", ".rels"))
+
+
+class _Pacote:
+    def __init__(self, dados):
+        with zipfile.ZipFile(BytesIO(dados)) as z:
+            self.ordem = z.namelist()
+            self.partes = {nome: z.read(nome) for nome in self.ordem}
+        self.rels = {
+            nome: etree.fromstring(self.partes[nome]) for nome in self.partes if nome.endswith(".rels")
+        }
+        self.tipos = etree.fromstring(self.partes["[Content_Types].xml"])
+        self._xml = {}
+        self.alterados = set()
+
+    def xml(self, nome):
+        if nome not in self._xml:
+            self._xml[nome] = etree.fromstring(self.partes[nome])
+        return self._xml[nome]
+
+    def relacionamentos(self, rels):
+        """(elemento, tipo, parte alvo ou None se externo) de um .rels."""
+        origem = _origem_de(rels)
+        for rel in self.rels[rels]:
+            externo = rel.get("TargetMode") == "External"
+            yield rel, rel.get("Type"), None if externo else _resolver(origem, rel.get("Target"))
+
+    def gravar(self):
+        for nome, raiz in self.rels.items():
+            self.partes[nome] = etree.tostring(raiz, xml_declaration=True, encoding="UTF-8", standalone=True)
+        for nome in self.alterados & set(self.partes):
+            self.partes[nome] = etree.tostring(self._xml[nome], xml_declaration=True, encoding="UTF-8", standalone=True)
+        self.partes["[Content_Types].xml"] = etree.tostring(
+            self.tipos, xml_declaration=True, encoding="UTF-8", standalone=True
+        )
+
+        saida = BytesIO()
+        with zipfile.ZipFile(saida, "w") as z:
+            for nome in ["[Content_Types].xml"] + [n for n in self.ordem if n != "[Content_Types].xml"]:
+                if nome not in self.partes:
+                    continue
+                z.writestr(nome, self.partes[nome], compress_type=_compressao(nome, self.partes[nome]))
+        return saida.getvalue()
+
+
+def _compressao(nome, dados):
+    if not nome.lower().endswith(_JA_COMPRIMIDAS):
+        return zipfile.ZIP_DEFLATED
+    # Estimativa com o nível mais rápido do zlib: barata e suficiente para decidir.
+    if len(zlib.compress(dados, 1)) <= len(dados) * (1 - _GANHO_MINIMO_DEFLATE):
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def _podar_relacionamentos(pacote):
+    removidos = 0
+    for rels in list(pacote.rels):
+        origem = _origem_de(rels)
+        if origem not in pacote.partes or not _eh_xml(origem):
+            continue
+        xml = pacote.partes[origem]
+        for rel, tipo, _ in list(pacote.relacionamentos(rels)):
+            rid = rel.get("Id")
+            if tipo in _POR_ID and f'"{rid}"'.encode() not in xml and f"'{rid}'".encode() not in xml:
+                pacote.rels[rels].remove(rel)
+                removidos += 1
+    return removidos
+
+
+def _deduplicar_midias(pacote):
+    canonica = {}
+    por_hash = {}
+    for nome in sorted(pacote.partes):
+        if _eh_xml(nome) or nome == "[Content_Types].xml":
+            continue
+        h = hashlib.sha256(pacote.partes[nome]).digest()
+        if h in por_hash:
+            canonica[nome] = por_hash[h]
+        else:
+            por_hash[h] = nome
+    if not canonica:
+        return 0
+
+    for rels in pacote.rels:
+        origem = _origem_de(rels)
+        for rel, _, alvo in pacote.relacionamentos(rels):
+            if alvo in canonica:
+                novo = canonica[alvo]
+                if rel.get("Target").startswith("/"):
+                    rel.set("Target", "/" + novo)
+                else:
+                    rel.set("Target", posixpath.relpath(novo, posixpath.dirname(origem) or "."))
+    return len(canonica)
+
+
+def _remover_inalcancaveis(pacote):
+    alcancadas = set()
+    pendentes = [""]
+    while pendentes:
+        rels = _rels_de(pendentes.pop())
+        if rels not in pacote.rels:
+            continue
+        for _, _, alvo in pacote.relacionamentos(rels):
+            if alvo and alvo in pacote.partes and alvo not in alcancadas:
+                alcancadas.add(alvo)
+                pendentes.append(alvo)
+
+    manter = {"[Content_Types].xml", _rels_de("")}
+    manter |= alcancadas | {_rels_de(parte) for parte in alcancadas}
+    removidas = [nome for nome in pacote.partes if nome not in manter]
+    for nome in removidas:
+        del pacote.partes[nome]
+        pacote.rels.pop(nome, None)
+    for override in pacote.tipos.findall(f"{{{_NS_CT}}}Override"):
+        if override.get("PartName").lstrip("/") not in pacote.partes:
+            pacote.tipos.remove(override)
+    return len([nome for nome in removidas if not nome.endswith(".rels")])
+
+
+def _podar_estilos(pacote):
+    estilos = next(
+        (alvo for rels in pacote.rels for _, tipo, alvo in pacote.relacionamentos(rels) if tipo == _TIPO_ESTILOS),
+        None,
+    )
+    if estilos not in pacote.partes:
+        return 0
+
+    usados = set()
+    for nome in pacote.partes:
+        if nome.endswith(".xml") and nome != estilos and nome != "[Content_Types].xml" and b"Style" in pacote.partes[nome]:
+            for el in pacote.xml(nome).iter(*_TAGS_USO_ESTILO):
+                usados.add(el.get(f"{{{_NS_W}}}val"))
+
+    raiz = pacote.xml(estilos)
+    definicoes = {st.get(f"{{{_NS_W}}}styleId"): st for st in raiz.findall(f"{{{_NS_W}}}style")}
+    usados |= {sid for sid, st in definicoes.items() if st.get(f"{{{_NS_W}}}default") in ("1", "true", "on")}
+    pendentes = list(usados)
+    while pendentes:
+        st = definicoes.get(pendentes.pop())
+        if st is None:
+            continue
+        for tag in _TAGS_LIGACAO_ESTILO:
+            ligado = st.find(f"{{{_NS_W}}}{tag}")
+            if ligado is not None and ligado.get(f"{{{_NS_W}}}val") not in usados:
+                usados.add(ligado.get(f"{{{_NS_W}}}val"))
+                pendentes.append(ligado.get(f"{{{_NS_W}}}val"))
+
+    removidos = [st for sid, st in definicoes.items() if sid not in usados]
+    for st in removidos:
+        raiz.remove(st)
+    if removidos:
+        pacote.alterados.add(estilos)
+    return len(removidos)
+
+
+def _larguras_exibidas(pacote):
+    """{parte de imagem: maior largura exibida em polegadas}; None se há uso sem tamanho conhecido."""
+    larguras = {}
+    for rels in pacote.rels:
+        origem = _origem_de(rels)
+        imagens = {rel.get("Id"): alvo for rel, tipo, alvo in pacote.relacionamentos(rels)
+                   if tipo == _RT + "image" and alvo in pacote.partes}
+        if not imagens or not origem.endswith(".xml"):
+            continue
+        xml = pacote.partes[origem]
+        raiz = pacote.xml(origem)
+        no_desenho = {rid: 0 for rid in imagens}
+        for desenho in raiz.iter(f"{{{_NS_WP}}}inline", f"{{{_NS_WP}}}anchor"):
+            extensao = desenho.find(f"{{{_NS_WP}}}extent")
+            if extensao is None:
+                continue
+            polegadas = int(extensao.get("cx")) / _EMU_POR_POL
+            for blip in desenho.iter(f"{{{_NS_A}}}blip"):
+                rid = blip.get(f"{{{_NS_R}}}embed")
+                if rid in imagens:
+                    no_desenho[rid] += 1
+                    alvo = imagens[rid]
+                    if larguras.get(alvo, 0) is not None:
+                        larguras[alvo] = max(larguras.get(alvo, 0), polegadas)
+        for rid, alvo in imagens.items():
+            # Referências fora de wp:inline/wp:anchor (VML, preenchimentos): tamanho desconhecido.
+            if xml.count(f'"{rid}"'.encode()) > no_desenho[rid]:
+                larguras[alvo] = None
+    return larguras
+
+
+def _reduzir_imagens(pacote, perfil):
+    if perfil.ppi is None:
+        return 0
+    from PIL import Image
+
+    reduzidas = 0
+    for nome, polegadas in _larguras_exibidas(pacote).items():
+        if not polegadas or not nome.lower().endswith((".png", ".jpg", ".jpeg", ".jpe")):
+            continue
+        try:
+            img = Image.open(BytesIO(pacote.partes[nome]))
+            formato = img.format
+            largura_alvo = math.ceil(perfil.ppi * polegadas)
+            if formato not in ("PNG", "JPEG") or img.width <= largura_alvo * _MARGEM_RESOLUCAO:
+                continue
+            if formato == "JPEG" and img.getexif().get(0x0112, 1) != 1:
+                continue  # orientação EXIF: a cópia reduzida sairia girada
+            if img.mode == "P":
+                img = img.convert("RGBA")
+            img = img.resize((largura_alvo, max(1, round(img.height * largura_alvo / img.width))), Image.LANCZOS)
+            saida = BytesIO()
+            if formato == "JPEG":
+                img.save(saida, format="JPEG", quality=perfil.jpeg_qualidade or 90, optimize=True)
+            else:
+                img.save(saida, format="PNG", optimize=True)
+        except Exception:
+            continue  # imagem que o Pillow não lê fica como está
+        if saida.tell() < len(pacote.partes[nome]):
+            pacote.partes[nome] = saida.getvalue()
+            reduzidas += 1
+    return reduzidas
+
+
+def otimizar_docx(dados, perfil=None):
+    """Otimiza o pacote DOCX `dados`. Retorna (bytes otimizados, relatório).
+
+    `perfil` (perfis_raster) define a resolução-alvo das imagens. Se o
+    resultado não ficar menor, devolve os bytes originais.
+    """
+    pacote = _Pacote(dados)
+    relatorio = {'relacionamentos_removidos': _podar_relacionamentos(pacote)}
+    relatorio['midias_duplicadas'] = _deduplicar_midias(pacote)
+    relatorio['partes_removidas'] = _remover_inalcancaveis(pacote)
+    relatorio['estilos_removidos'] = _podar_estilos(pacote)
+    relatorio['imagens_reduzidas'] = _reduzir_imagens(pacote, obter_perfil(perfil))
+    otimizado = pacote.gravar()
+    if len(otimizado) >= len(dados):
+        otimizado = dados
+    relatorio.update({
+        'bytes_antes': len(dados),
+        'bytes_depois': len(otimizado),
+        'economia_bytes': len(dados) - len(otimizado),
+        'economia': 1 - len(otimizado) / len(dados) if dados else 0.0,
+    })
+    return otimizado, relatorio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Otimiza dossiês DOCX já gerados e informa a economia.")
+    parser.add_argument("arquivos", nargs="+", help="Arquivos .docx (sobrescritos, a menos que use --sufixo)")
+    parser.add_argument("--perfil", default=None, help="Perfil de imagem (screen, print, archive, original)")
+    parser.add_argument("--sufixo", default=None, help="Grava em <nome><sufixo>.docx em vez de sobrescrever")
+    args = parser.parse_args(argv)
+
+    total_antes = total_depois = 0
+    for caminho in args.arquivos:
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        otimizado, r = otimizar_docx(dados, args.perfil)
+        destino = caminho if not args.sufixo else caminho[:-len(".docx")] + args.sufixo + ".docx"
+        with open(destino, "wb") as f:
+            f.write(otimizado)
+        total_antes += r['bytes_antes']
+        total_depois += r['bytes_depois']
+        print(f"{caminho}: {r['bytes_antes'] / 1e6:.2f} -> {r['bytes_depois'] / 1e6:.2f} MB ({r['economia']:.0%})"
+              f"  partes -{r['partes_removidas']}, mídias duplicadas {r['midias_duplicadas']},"
+              f" estilos -{r['estilos_removidos']}, imagens reduzidas {r['imagens_reduzidas']}")
+    if len(args.arquivos) > 1 and total_antes:
+        print(f"Total: {total_antes / 1e6:.2f} -> {total_depois / 1e6:.2f} MB ({1 - total_depois / total_antes:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+
+# Perfis de rasterização das páginas de PDF inseridas no dossiê.
+#
+# Em vez de um DPI fixo, cada perfil define a resolução desejada na largura
+# em que a imagem é exibida no DOCX (LARGURA_IMAGEM_POL). O DPI de cada página
+# sai daí: uma página A4 em retrato exibida com 6" a 150 ppi é renderizada a
+# ~109 DPI, e não a 200. A codificação também é escolhida por página:
+#   - até 256 cores: PNG com paleta (ou tons de cinza), sem perda;
+#   - mais cores, se o perfil permitir: JPEG com a qualidade do perfil;
+#   - caso contrário: PNG (em tons de cinza quando a página não tem cor).
+#
+# PyMuPDF e Pillow são importados dentro das funções: a interface usa os
+# perfis (PERFIS) sem pagar o carregamento dessas bibliotecas na abertura.
+#
+# O PyMuPDF não suporta ser usado por várias threads ao mesmo tempo, e no
+# mesmo processo rodam várias: as etapas da geração (balanço, DRE e o
+# Antecipador que adianta a DRE) e as sessões da interface. Toda chamada ao
+# fitz passa por TRAVA_FITZ. Ela não tira paralelismo: o fitz não solta o GIL
+# enquanto trabalha. A codificação da imagem (Pillow, que solta o GIL) fica
+# fora da trava.
+
+TRAVA_FITZ = threading.RLock()
+
+LARGURA_IMAGEM_POL = 6
+
+
+@dataclass(frozen=True)
+class PerfilRaster:
+    nome: str
+    ppi: int = None                 # resolução na largura exibida; None usa dpi_fixo
+    dpi_fixo: int = 200
+    jpeg_qualidade: int = None      # None: nunca usa JPEG
+    adaptativo: bool = True         # escolhe cinza/paleta conforme o conteúdo
+
+    def dpi_para(self, page):
+        if self.ppi is None:
+            return self.dpi_fixo
+        largura_pol = page.rect.width / 72
+        return max(36, round(self.ppi * LARGURA_IMAGEM_POL / largura_pol))
+
+
+PERFIS = {
+    # Comportamento anterior: 200 DPI fixos, PNG colorido. Mantido para comparação.
+    'original': PerfilRaster('original', dpi_fixo=200, adaptativo=False),
+    'screen': PerfilRaster('screen', ppi=110, jpeg_qualidade=70),
+    'print': PerfilRaster('print', ppi=200, jpeg_qualidade=88),
+    'archive': PerfilRaster('archive', ppi=300),
+}
+PERFIL_PADRAO = 'print'
+# Páginas renderizadas na comparação pedida pela interface: a economia de um
+# perfil quase não muda entre páginas do mesmo PDF, e a DRE pode ter centenas.
+PAGINAS_AMOSTRA = 3
+# Miniaturas da prévia (previa.py): ~300 px de largura numa página A4. Fica
+# fora de PERFIS porque não é opção de saída do dossiê.
+PERFIL_PREVIA = PerfilRaster('previa', ppi=50, jpeg_qualidade=60)
+
+
+def obter_perfil(perfil=None):
+    if isinstance(perfil, PerfilRaster):
+        return perfil
+    nome = perfil or PERFIL_PADRAO
+    if nome not in PERFIS:
+        raise ValueError(f"Perfil de imagem desconhecido: '{nome}'. Opções: {', '.join(PERFIS)}")
+    return PERFIS[nome]
+
+
+def _sem_cor(img):
+    from PIL import ImageChops
+
+    # Compara os canais numa miniatura: basta para distinguir página P&B de colorida.
+    amostra = img.copy()
+    amostra.thumbnail((256, 256))
+    r, g, b = amostra.split()
+    return max(ImageChops.difference(r, g).getextrema()[1], ImageChops.difference(g, b).getextrema()[1]) <= 8
+
+
+def abrir_pdf(pdf):
+    """Documento fitz do PDF (caminho ou bytes, sem passar pelo disco), aberto sob TRAVA_FITZ."""
+    import fitz
+
+    with TRAVA_FITZ:
+        if isinstance(pdf, (bytes, bytearray)):
+            return fitz.open(stream=pdf, filetype="pdf")
+        return fitz.open(pdf)
+
+
+def fechar_pdf(doc):
+    with TRAVA_FITZ:
+        doc.close()
+
+
+@contextmanager
+def pdf_aberto(pdf):
+    doc = abrir_pdf(pdf)
+    try:
+        yield doc
+    finally:
+        fechar_pdf(doc)
+
+
+def _pixels(page, perfil):
+    # Sob TRAVA_FITZ: renderiza e tira os pixels do pixmap, que não sai daqui.
+    pix = page.get_pixmap(dpi=perfil.dpi_para(page), alpha=False)
+    if not perfil.adaptativo:
+        return pix.tobytes("png")
+
+    from PIL import Image
+
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _codificar(img, perfil):
+    if isinstance(img, bytes):
+        return img
+
+    from PIL import Image
+
+    if _sem_cor(img):
+        img = img.convert("L")
+
+    saida = BytesIO()
+    if img.getcolors(maxcolors=256) is not None:
+        if img.mode == "RGB":
+            img = img.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        img.save(saida, format="PNG")
+    elif perfil.jpeg_qualidade:
+        img.save(saida, format="JPEG", quality=perfil.jpeg_qualidade, optimize=True)
+    else:
+        img.save(saida, format="PNG")
+    return saida.getvalue()
+
+
+def renderizar_pagina(page, perfil):
+    with TRAVA_FITZ:
+        img = _pixels(page, perfil)
+    return _codificar(img, perfil)
+
+
+def renderizar_pagina_de(doc, i, perfil):
+    """Como renderizar_pagina, para a página `i` do documento fitz `doc`."""
+    with TRAVA_FITZ:
+        page = doc[i]
+        img = _pixels(page, perfil)
+        # A página é solta ainda sob a trava.
+        del page
+    return _codificar(img, perfil)
+
+
+def paginas_amostra(total, quantidade=PAGINAS_AMOSTRA):
+    """Até `quantidade` páginas espalhadas pelo documento, da primeira à última."""
+    if total <= quantidade:
+        return list(range(total))
+    if quantidade <= 1:
+        return [0]
+    return sorted({round(i * (total - 1) / (quantidade - 1)) for i in range(quantidade)})
+
+
+def comparar_perfis(pdf, perfis=None, amostra=None):
+    """Renderiza o PDF em cada perfil (sem cache) e compara tamanho/tempo com o 'original'.
+
+    Com `amostra`, só essa quantidade de páginas (paginas_amostra) entra na
+    comparação; o número de páginas usado fica em 'paginas' de cada resultado.
+    """
+    resultados = {}
+    with pdf_aberto(pdf) as doc:
+        with TRAVA_FITZ:
+            total = len(doc)
+        indices = paginas_amostra(total, amostra) if amostra else range(total)
+        for nome in ['original'] + [p for p in (perfis or PERFIS) if p != 'original']:
+            perfil = obter_perfil(nome)
+            inicio = time.perf_counter()
+            tamanho = sum(len(renderizar_pagina_de(doc, i, perfil)) for i in indices)
+            resultados[nome] = {'bytes': tamanho, 'segundos': time.perf_counter() - inicio, 'paginas': len(indices)}
+
+    base = resultados['original']
+    for r in resultados.values():
+        r['economia_bytes'] = 1 - r['bytes'] / base['bytes'] if base['bytes'] else 0.0
+        r['economia_tempo'] = 1 - r['segundos'] / base['segundos'] if base['segundos'] else 0.0
+    return resultados
+
+
+if __name__ == "__main__":
+    for caminho in sys.argv[1:]:
+        print(caminho)
+        for nome, r in comparar_perfis(caminho).items():
+            print(f"  {nome:<9} {r['bytes'] / 1e6:8.2f} MB (economia {r['economia_bytes']:.0%})"
+                  f"  {r['segundos']:6.2f} s (economia {r['economia_tempo']:.0%})")
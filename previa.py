@@ -0,0 +1,103 @@
+import os
+from dataclasses import dataclass
+from io import BytesIO
+
+from docx import Document
+
+from dossie import (
+    MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2, iterar_paginas_raster, montar_contexto,
+    pdf_balanco_duas_paginas, preparar_uploads,
+)
+from gerador_pdf import MARCADOR_DRE, diagramar
+from perfis_raster import PERFIL_PREVIA, TRAVA_FITZ, renderizar_pagina_de
+from registro_templates import obter_registro
+from validacao import contar_paginas
+
+# Prévia rápida do dossiê montado, em miniaturas de baixa resolução.
+#
+# Para conferir se as páginas certas do balanço e da DRE caíram no lugar
+# certo não é preciso gerar o dossiê em qualidade de impressão e abri-lo no
+# Word: o template é preenchido e diagramado como na saída em PDF
+# (gerador_pdf.diagramar) e, em cada marcador, entram as páginas do balanço e
+# da DRE rasterizadas pelo mesmo caminho da geração (pdf_balanco_duas_paginas,
+# iterar_paginas_raster), no perfil PERFIL_PREVIA. As miniaturas saem uma a
+# uma, na ordem do dossiê, e a interface mostra cada uma assim que fica
+# pronta. Da DRE entram as primeiras PAGINAS_DRE_PREVIA páginas; das notas e
+# da carta, só a primeira.
+#
+# Este módulo carrega PyMuPDF, python-docx e docxtpl: a interface só o
+# importa quando a prévia é pedida.
+
+PAGINAS_DRE_PREVIA = int(os.environ.get("DOSSIE_PREVIA_PAGINAS_DRE", "6"))
+# Elementos do corpo das notas/carta diagramados para a primeira página.
+ELEMENTOS_TEXTO_PREVIA = 60
+
+MARCADOR_NOTAS = '[[EXP_DEMONSTR]]'
+MARCADOR_CARTA = '[[CARTA_RESP]]'
+
+
+@dataclass
+class PaginaPrevia:
+    secao: str              # 'template', 'balanco', 'dre', 'notas' ou 'carta'
+    rotulo: str
+    imagem: bytes = None    # None: resumo das páginas que ficaram de fora
+
+
+def gerar_previa(input_data):
+    """Prévia do dossiê. Retorna (gerador de PaginaPrevia, erro).
+
+    Os uploads são lidos e validados aqui, então um arquivo com problema
+    aparece antes de qualquer miniatura. O gerador diagrama e rasteriza à
+    medida que é consumido.
+    """
+    uploads, erro = preparar_uploads(input_data)
+    if erro:
+        return None, erro
+    return _paginas(input_data, uploads), None
+
+
+def _paginas(input_data, uploads):
+    template = obter_registro().obter(input_data.get('template'))
+    template.render(montar_contexto(input_data, MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2))
+    marcadores = (MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2, MARCADOR_DRE, MARCADOR_NOTAS, MARCADOR_CARTA)
+
+    balanco = None
+    for tipo, valor in diagramar(template.docx, marcadores):
+        if tipo == 'paginas':
+            with TRAVA_FITZ:
+                total = len(valor)
+            for i in range(total):
+                yield PaginaPrevia('template', "Template", renderizar_pagina_de(valor, i, PERFIL_PREVIA))
+        elif valor in (MARCADOR_BALANCO_PT1, MARCADOR_BALANCO_PT2):
+            if balanco is None:
+                balanco = pdf_balanco_duas_paginas(uploads['balanco_file'], perfil=PERFIL_PREVIA)
+            i = 0 if valor == MARCADOR_BALANCO_PT1 else 1
+            yield PaginaPrevia('balanco', f"Balanço patrimonial, página {i + 1}", balanco[i])
+        elif valor == MARCADOR_DRE:
+            yield from _paginas_dre(uploads['demstr_result_file'])
+        elif valor == MARCADOR_NOTAS:
+            yield PaginaPrevia('notas', "Notas explicativas (início)",
+                               _primeira_pagina(uploads['explic_demonstr_file'], template.docx))
+        else:
+            yield PaginaPrevia('carta', "Carta de responsabilidade (início)",
+                               _primeira_pagina(uploads['carta_responsb_file'], template.docx))
+
+
+def _paginas_dre(pdf):
+    total = contar_paginas(pdf)
+    # Poucas páginas pequenas: um processo só, sem subir o pool de rasterização.
+    paginas = iterar_paginas_raster(pdf, paginas=range(min(total, PAGINAS_DRE_PREVIA)), perfil=PERFIL_PREVIA,
+                                    workers=1)
+    for i, imagem in enumerate(paginas):
+        yield PaginaPrevia('dre', f"DRE, página {i + 1} de {total}", imagem)
+    if total > PAGINAS_DRE_PREVIA:
+        yield PaginaPrevia('dre', f"+ {total - PAGINAS_DRE_PREVIA} páginas da DRE")
+
+
+def _primeira_pagina(docx, modelo):
+    # Os uploads já vêm em bytes de preparar_uploads, com o Markdown convertido.
+    # A página é a do template, onde o texto vai entrar (o DOCX do pandoc nem tem tamanho de página).
+    for tipo, parcial in diagramar(Document(BytesIO(docx)), (), ELEMENTOS_TEXTO_PREVIA, modelo):
+        if tipo == 'paginas':
+            return renderizar_pagina_de(parcial, 0, PERFIL_PREVIA)
+    return None
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+# Registro de templates pré-carregados, um por processo.
+#
+# Antes, cada geração fazia DocxTemplate("templete_base_ofc.docx"): abria o
+# zip, fazia o parse do XML e compilava o Jinja do corpo do zero. Aqui cada
+# template é carregado uma vez; cada pedido recebe uma cópia isolada
+# (deepcopy do documento já parseado) e reaproveita o XML do corpo já
+# corrigido pelo patch_xml e os templates Jinja já compilados.
+#
+# Se o arquivo mudar (mtime/tamanho e, então, hash do conteúdo), ele é
+# recarregado no próximo pedido. Vários templates nomeados (papéis timbrados
+# de escritórios diferentes) podem ficar carregados ao mesmo tempo: além do
+# 'padrao', cada .docx da pasta templates/ é registrado pelo nome do arquivo.
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_TEMPLETE = os.path.join(PASTA_PROJETO, "templete_base_ofc.docx")
+PASTA_TEMPLATES = os.environ.get("DOSSIE_TEMPLATES_DIR", os.path.join(PASTA_PROJETO, "templates"))
+TEMPLATE_PADRAO = 'padrao'
+
+
+class _TemplateCarregado:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.assinatura = None
+        self.hash = None
+        self.docx = None
+        self.corpo_xml = None
+        self.jinja = {}
+
+    def carregar(self, assinatura, dados, hash_dados):
+        from docx import Document
+        from docxtpl import DocxTemplate
+
+        tpl = DocxTemplate(BytesIO(dados))
+        docx = Document(BytesIO(dados))
+        self.corpo_xml = tpl.patch_xml(tpl.xml_to_string(docx._element.body))
+        self.docx = docx
+        self.assinatura = assinatura
+        self.hash = hash_dados
+        self.jinja = {}
+
+
+class RegistroTemplates:
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nome, caminho):
+        with self._lock:
+            atual = self._templates.get(nome)
+            if atual is None or atual.caminho != caminho:
+                self._templates[nome] = _TemplateCarregado(caminho)
+
+    def registrar_pasta(self, pasta):
+        if not os.path.isdir(pasta):
+            return
+        for arquivo in sorted(os.listdir(pasta)):
+            if arquivo.lower().endswith(".docx") and not arquivo.startswith("~$"):
+                self.registrar(os.path.splitext(arquivo)[0], os.path.join(pasta, arquivo))
+
+    def nomes(self):
+        with self._lock:
+            return list(self._templates)
+
+    def _atualizar(self, carregado):
+        st = os.stat(carregado.caminho)
+        assinatura = (st.st_mtime_ns, st.st_size)
+        if assinatura == carregado.assinatura:
+            return
+
+        with open(carregado.caminho, "rb") as f:
+            dados = f.read()
+        hash_dados = hashlib.sha256(dados).hexdigest()
+        if hash_dados == carregado.hash:
+            # Só o mtime mudou (ex.: arquivo copiado de novo): nada a recarregar.
+            carregado.assinatura = assinatura
+            return
+        carregado.carregar(assinatura, dados, hash_dados)
+
+    def _carregado(self, nome):
+        carregado = self._templates.get(nome)
+        if carregado is None:
+            raise KeyError(f"Template '{nome}' não registrado. Disponíveis: {', '.join(self._templates)}")
+        self._atualizar(carregado)
+        return carregado
+
+    def hash(self, nome=None):
+        """Hash do conteúdo atual do template `nome`."""
+        with self._lock:
+            return self._carregado(nome or TEMPLATE_PADRAO).hash
+
+    def obter(self, nome=None):
+        """Retorna uma cópia isolada e pronta para render do template `nome`."""
+        nome = nome or TEMPLATE_PADRAO
+        with self._lock:
+            carregado = self._carregado(nome)
+            estado = (carregado.caminho, carregado.docx, carregado.corpo_xml, carregado.jinja)
+        # A cópia é feita fora do lock: pedidos simultâneos não esperam uns pelos outros.
+        from template_precompilado import TemplatePreCompilado
+        return TemplatePreCompilado(*estado)
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obter_registro():
+    """Registro do processo, com o template padrão e os da pasta templates/."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroTemplates()
+            _registro.registrar(TEMPLATE_PADRAO, CAMINHO_TEMPLETE)
+            _registro.registrar_pasta(PASTA_TEMPLATES)
+        return _registro
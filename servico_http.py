@@ -0,0 +1,217 @@
+import argparse
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from campos import ARQUIVOS_OBRIGATORIOS, FORMATOS_SAIDA, nome_arquivo_dossie, normalizar_campos, validar_datas
+from fila_jobs import CONCLUIDO, ERRO, FilaCheia, FilaJobs
+
+# Serviço HTTP de geração, para integração com o ERP sem passar pelo Streamlit.
+#
+#   POST /dossies                 multipart: campos do manifesto (ver gerar_lote.py)
+#                                 + os quatro arquivos; responde com o dossiê
+#   POST /dossies?assincrono=1    responde 202 com o id; o ERP consulta depois
+#   GET  /dossies/{id}            estado do pedido (JSON)
+#   GET  /dossies/{id}/arquivo    dossiê pronto
+#   GET  /saude
+#
+# O trabalho é feito por uma FilaJobs própria, com os workers subidos e
+# aquecidos (dossie importado, templates carregados) na inicialização. Os
+# uploads são lidos do corpo em partes pelo parser multipart (acima de 1 MB
+# vão para arquivo temporário) e copiados em blocos para o armazém de
+# artefatos; o worker lê do disco. O dossiê volta em streaming, lido do
+# armazém em blocos.
+#
+# Com MAX_PEDIDOS pedidos em andamento (ou a fila cheia), novos pedidos
+# recebem 429 com Retry-After antes de o corpo ser lido.
+#
+#   python servico_http.py --porta 8765 --workers 4
+
+PASTA_FILA_SERVICO = os.environ.get(
+    "DOSSIE_SERVICO_FILA_DIR", os.path.join(tempfile.gettempdir(), "dossie_servico_fila")
+)
+WORKERS_SERVICO = int(os.environ.get("DOSSIE_SERVICO_WORKERS", str(os.cpu_count() or 2)))
+MAX_PEDIDOS = int(os.environ.get("DOSSIE_SERVICO_PEDIDOS", str(4 * WORKERS_SERVICO)))
+# Quanto o POST síncrono espera pelo dossiê antes de responder 202 com o id.
+ESPERA_MAXIMA = float(os.environ.get("DOSSIE_SERVICO_ESPERA", "300"))
+LIMITE_CORPO = int(os.environ.get("DOSSIE_SERVICO_MB", "200")) * 1024 * 1024
+RETRY_AFTER = 5
+
+CAMPOS = (
+    'nome_empresa', 'razao_social_empresa', 'cnpj_empresa',
+    'data_inicio', 'data_fim', 'periodo_em_data', 'periodo_anual', 'data_dem_encerradas',
+    'socios', 'perfil_raster', 'formato_saida', 'modo_demonstracoes', 'template', 'otimizar_docx',
+)
+CAMPOS_OBRIGATORIOS = (
+    'nome_empresa', 'razao_social_empresa', 'cnpj_empresa',
+    'periodo_em_data', 'periodo_anual', 'data_dem_encerradas',
+)
+
+_BLOCO = 256 * 1024
+
+
+def _erro(mensagem, status, **headers):
+    return JSONResponse({'erro': mensagem}, status_code=status, headers=headers or None)
+
+
+def _ocupado(mensagem="Serviço ocupado. Tente novamente em alguns segundos."):
+    return _erro(mensagem, 429, **{'Retry-After': str(RETRY_AFTER)})
+
+
+def _input_data(form):
+    """input_data para a fila a partir do formulário. Retorna (input_data, erro)."""
+    brutos = {campo: form[campo] for campo in CAMPOS if isinstance(form.get(campo), str) and form[campo]}
+    try:
+        input_data = normalizar_campos(brutos)
+    except ValueError as e:
+        return None, f"Campos inválidos: {e}"
+    erros = validar_datas(input_data)
+    if erros:
+        return None, " ".join(erros)
+
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not input_data.get(campo)]
+    if faltando:
+        return None, f"Campos obrigatórios ausentes: {', '.join(faltando)} (ou data_inicio/data_fim)."
+
+    input_data['uploads'] = {}
+    for chave in ARQUIVOS_OBRIGATORIOS:
+        arquivo = form.get(chave)
+        if not isinstance(arquivo, UploadFile):
+            return None, f"O arquivo {chave} é obrigatório!"
+        # O arquivo temporário do parser: a fila o copia em blocos para o armazém.
+        input_data['uploads'][chave] = arquivo.file
+    return input_data, None
+
+
+def _blocos(arquivo):
+    try:
+        while bloco := arquivo.read(_BLOCO):
+            yield bloco
+    finally:
+        arquivo.close()
+
+
+class Servico:
+    def __init__(self, fila, max_pedidos=MAX_PEDIDOS, espera=ESPERA_MAXIMA):
+        self.fila = fila
+        self.max_pedidos = max_pedidos
+        self.espera = espera
+        self.em_andamento = 0
+
+    def _resposta(self, job_id, status):
+        if status is None:
+            return _erro("Pedido não encontrado.", 404)
+        if status['estado'] == ERRO:
+            return _erro(status['erro'], 422)
+        if status['estado'] != CONCLUIDO:
+            return JSONResponse(status, status_code=202, headers={'Location': f"/dossies/{job_id}"})
+
+        arquivo = self.fila.abrir_artefato(job_id)
+        if arquivo is None:
+            return _erro("O dossiê expirou. Envie o pedido novamente.", 410)
+        formato = status['formato'] or 'docx'
+        nome = nome_arquivo_dossie(status['nome_empresa'], formato)
+        return StreamingResponse(
+            _blocos(arquivo),
+            media_type=FORMATOS_SAIDA.get(formato),
+            headers={
+                'Content-Length': str(os.fstat(arquivo.fileno()).st_size),
+                'Content-Disposition': f"attachment; filename*=UTF-8''{quote(nome)}",
+                'X-Dossie-Job': job_id,
+            },
+        )
+
+    async def gerar(self, request):
+        # Recusa antes de ler o corpo: sob carga, o upload nem chega a ser gravado.
+        if self.em_andamento >= self.max_pedidos:
+            return _ocupado()
+        if int(request.headers.get('content-length') or 0) > LIMITE_CORPO:
+            return _erro(f"Pedido acima de {LIMITE_CORPO // (1024 * 1024)} MB.", 413)
+
+        self.em_andamento += 1
+        try:
+            async with request.form(max_files=len(ARQUIVOS_OBRIGATORIOS), max_fields=len(CAMPOS)) as form:
+                input_data, erro = _input_data(form)
+                if erro:
+                    return _erro(erro, 400)
+                try:
+                    job_id = await run_in_threadpool(self.fila.enviar, input_data)
+                except FilaCheia as e:
+                    return _ocupado(str(e))
+                except ValueError as e:
+                    return _erro(str(e), 400)
+
+            if request.query_params.get('assincrono') in ('1', 'true'):
+                return JSONResponse({'id': job_id}, status_code=202, headers={'Location': f"/dossies/{job_id}"})
+            status = await run_in_threadpool(self.fila.aguardar, job_id, self.espera)
+            return self._resposta(job_id, status)
+        finally:
+            self.em_andamento -= 1
+
+    async def status(self, request):
+        status = await run_in_threadpool(self.fila.status, request.path_params['job_id'])
+        if status is None:
+            return _erro("Pedido não encontrado.", 404)
+        return JSONResponse(status)
+
+    async def arquivo(self, request):
+        job_id = request.path_params['job_id']
+        return self._resposta(job_id, await run_in_threadpool(self.fila.status, job_id))
+
+    async def saude(self, request):
+        return JSONResponse({
+            'em_andamento': self.em_andamento,
+            'max_pedidos': self.max_pedidos,
+            'workers': self.fila.max_simultaneos,
+        })
+
+
+def criar_app(fila=None, max_pedidos=MAX_PEDIDOS, espera=ESPERA_MAXIMA, aquecer=True):
+    """App ASGI do serviço. Sem `fila`, cria uma em PASTA_FILA_SERVICO com WORKERS_SERVICO workers."""
+    fila = fila or FilaJobs(pasta=PASTA_FILA_SERVICO, max_simultaneos=WORKERS_SERVICO, max_pendentes=max_pedidos)
+    servico = Servico(fila, max_pedidos, espera)
+
+    @asynccontextmanager
+    async def ciclo_de_vida(app):
+        if aquecer:
+            await run_in_threadpool(fila.aquecer)
+        yield
+        await run_in_threadpool(fila.encerrar)
+
+    return Starlette(
+        routes=[
+            Route("/dossies", servico.gerar, methods=["POST"]),
+            Route("/dossies/{job_id}", servico.status),
+            Route("/dossies/{job_id}/arquivo", servico.arquivo),
+            Route("/saude", servico.saude),
+        ],
+        lifespan=ciclo_de_vida,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP de geração de dossiês.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS_SERVICO,
+                        help="Gerações simultâneas (processos aquecidos)")
+    parser.add_argument("--max-pedidos", type=int, default=None,
+                        help="Pedidos em andamento antes de responder 429 (padrão: 4 por worker)")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    max_pedidos = args.max_pedidos or 4 * args.workers
+    fila = FilaJobs(pasta=PASTA_FILA_SERVICO, max_simultaneos=args.workers, max_pendentes=max_pedidos)
+    uvicorn.run(criar_app(fila, max_pedidos), host=args.host, port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import copy
+import re
+
+from docxtpl import DocxTemplate
+from jinja2 import Template, TemplateError
+
+# DocxTemplate que reaproveita o que o registro de templates já preparou
+# (registro_templates.py). Fica num módulo à parte para que listar os
+# templates não carregue o docxtpl: ele só é importado na primeira geração.
+#
+# Com centenas ou milhares de sócios, o laço do template vira dezenas de
+# milhares de parágrafos, e o pós-processamento do docxtpl passa a custar mais
+# que o próprio Jinja. Dois trechos são trocados por equivalentes baratos:
+# resolve_listing só percorre parágrafo a parágrafo quando algum texto tem
+# \t, \a, \n ou \f para converter, e map_tree move os parágrafos para o
+# body existente em vez de trocar o body inteiro (o replace do lxml entre
+# documentos é três vezes mais lento).
+
+# Texto de <w:t> com algum caractere que o resolve_listing converte.
+_TEXTO_ESPECIAL = re.compile(r"<w:t(?: [^>]*)?>[^<]*[\t\a\n\f]")
+
+
+class TemplatePreCompilado(DocxTemplate):
+    """DocxTemplate que usa o documento e o Jinja já preparados pelo registro."""
+
+    def __init__(self, caminho, docx, corpo_xml, jinja):
+        super().__init__(caminho)
+        self.docx = copy.deepcopy(docx)
+        self._corpo_xml = corpo_xml
+        self._jinja = jinja
+
+    def build_xml(self, context, jinja_env=None):
+        return self.render_xml_part(self._corpo_xml, self.docx._part, context, jinja_env)
+
+    def render_xml_part(self, src_xml, part, context, jinja_env=None):
+        if jinja_env is not None:
+            return super().render_xml_part(src_xml, part, context, jinja_env)
+
+        self.current_rendering_part = part
+        template = self._jinja.get(src_xml)
+        if template is None:
+            template = Template(re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml))
+            self._jinja[src_xml] = template
+        try:
+            dst_xml = template.render(context)
+        except TemplateError:
+            # Refaz pelo caminho original do docxtpl, que anexa o trecho do erro à exceção.
+            return super().render_xml_part(src_xml, part, context)
+
+        # Mesmo pós-processamento do DocxTemplate.render_xml_part.
+        dst_xml = dst_xml.replace("\n<w:p ", "<w:p ").replace("\n<w:p>", "<w:p>")
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
+
+    def resolve_listing(self, xml):
+        if not _TEXTO_ESPECIAL.search(xml):
+            return xml
+        return super().resolve_listing(xml)
+
+    def map_tree(self, tree):
+        self.docx._element.body[:] = list(tree)
@@ -0,0 +1,57 @@
+import os
+
+from cache_raster import CacheRaster
+
+# Cache de páginas: despejo LRU nas duas camadas e promoção do disco para a memória.
+
+
+def test_memoria_despeja_a_menos_usada():
+    cache = CacheRaster(limite_memoria=30, pasta=None)
+    for chave in ("a", "b", "c"):
+        cache.put(chave, chave.encode() * 10)
+    assert cache.get("a") == b"a" * 10   # "a" passa a ser a mais recente
+    cache.put("d", b"d" * 10)
+
+    assert not cache.contem("b")
+    assert all(cache.contem(chave) for chave in ("a", "c", "d"))
+    assert cache.estatisticas()['bytes_memoria'] == 30
+
+
+def test_item_maior_que_a_memoria_nao_entra():
+    cache = CacheRaster(limite_memoria=10, pasta=None)
+    cache.put("grande", b"x" * 11)
+    assert cache.get("grande") is None
+
+
+def test_acerto_no_disco_promove_para_a_memoria(tmp_path):
+    cache = CacheRaster(limite_memoria=10, pasta=str(tmp_path))
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)   # tira "a" da memória; no disco continua
+
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("a") == b"a" * 10
+    assert cache.contadores() == {'hits_memoria': 1, 'hits_disco': 1, 'misses': 0}
+    # Outro processo (outra instância na mesma pasta) lê do disco.
+    assert CacheRaster(limite_memoria=10, pasta=str(tmp_path)).get("b") == b"b" * 10
+
+
+def test_disco_despeja_pelo_uso_mais_antigo(tmp_path):
+    cache = CacheRaster(limite_memoria=0, pasta=str(tmp_path), limite_disco=25)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    # O mtime marca o último uso: "b" fica como a mais antiga.
+    os.utime(cache._caminho("a"), (2_000_000_000, 2_000_000_000))
+    os.utime(cache._caminho("b"), (1_000_000_000, 1_000_000_000))
+    cache.put("c", b"c" * 10)
+
+    assert not cache.contem("b")
+    assert cache.contem("a") and cache.contem("c")
+    assert cache.estatisticas()['bytes_disco'] == 20
+
+
+def test_consulta_sem_contar_nao_altera_as_estatisticas():
+    cache = CacheRaster(pasta=None)
+    cache.put("paginas", b"3")
+    assert cache.get("paginas", contar=False) == b"3"
+    assert cache.get("outro", contar=False) is None
+    assert cache.contadores() == {'hits_memoria': 0, 'hits_disco': 0, 'misses': 0}
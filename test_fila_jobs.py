@@ -0,0 +1,86 @@
+import datetime
+from io import BytesIO
+
+import fitz
+import pytest
+from docx import Document
+
+import armazem_artefatos
+from campos import periodos_from_datas
+from fila_jobs import CONCLUIDO, NA_FILA, FilaCheia, FilaJobs
+
+# Fila de gerações: envio, acompanhamento pelo status e leitura do dossiê pronto.
+
+
+@pytest.fixture
+def armazem(tmp_path, monkeypatch):
+    # Workers (spawn) leem as variáveis; este processo usa o armazém trocado aqui.
+    monkeypatch.setenv("DOSSIE_ARTEFATOS_DIR", str(tmp_path / "artefatos"))
+    for variavel in ("DOSSIE_CACHE_DIR", "DOSSIE_CACHE_ETAPAS_DIR", "DOSSIE_CACHE_MARKDOWN_DIR", "DOSSIE_LOG_MEDICOES"):
+        monkeypatch.setenv(variavel, "")
+    monkeypatch.setattr(armazem_artefatos, "_armazem",
+                        armazem_artefatos.ArmazemArtefatos(pasta=str(tmp_path / "artefatos")))
+
+
+def _pdf(paginas):
+    doc = fitz.open()
+    for n in range(paginas):
+        doc.new_page().insert_text((72, 72), f"Página {n + 1}")
+    dados = doc.tobytes()
+    doc.close()
+    return dados
+
+
+def _docx(texto):
+    documento = Document()
+    documento.add_paragraph(texto)
+    buffer = BytesIO()
+    documento.save(buffer)
+    return buffer.getvalue()
+
+
+def _pedido(**campos):
+    return {
+        'nome_empresa': "Empresa", 'razao_social_empresa': "Empresa LTDA", 'cnpj_empresa': "11.222.333/0001-81",
+        'socios': [{'nome': "Sócio", 'cpf': "111.444.777-35", 'cargo': "Administrador"}],
+        **periodos_from_datas(datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)),
+        'uploads': {
+            'balanco_file': _pdf(2), 'demstr_result_file': _pdf(1),
+            'explic_demonstr_file': _docx("Notas"), 'carta_responsb_file': _docx("Carta"),
+        },
+        **campos,
+    }
+
+
+def test_envio_status_e_dossie_pronto(tmp_path, armazem):
+    fila = FilaJobs(pasta=str(tmp_path / "fila"), max_simultaneos=1, raster_workers=1)
+    try:
+        job_id = fila.enviar(_pedido())
+        assert fila.status(job_id)['estado'] in (NA_FILA, 'executando')
+
+        status = fila.aguardar(job_id, timeout=120)
+        assert status['estado'] == CONCLUIDO, status['erro']
+        assert status['progresso'] == 1.0
+        assert status['medicoes']['etapas']
+
+        arquivo = fila.abrir_artefato(job_id)
+        with arquivo:
+            dossie = Document(BytesIO(arquivo.read()))
+        assert any("Notas" in p.text for p in dossie.paragraphs)
+    finally:
+        fila.encerrar()
+    assert fila.status("inexistente") is None
+
+
+def test_fila_cheia_recusa_novos_pedidos(tmp_path, armazem):
+    fila = FilaJobs(pasta=str(tmp_path / "fila"), max_pendentes=1)
+    fila.encerrar()  # sem workers: os pedidos ficam na fila
+    job_id = fila.enviar(_pedido())
+    assert fila.status(job_id)['estado'] == NA_FILA
+    assert fila.status(job_id)['posicao_fila'] == 1
+    assert fila.abrir_artefato(job_id) is None
+
+    with pytest.raises(FilaCheia):
+        fila.enviar(_pedido())
+    with pytest.raises(ValueError, match="CNPJ inválido"):
+        fila.enviar(_pedido(cnpj_empresa="11.222.333/0001-82"))
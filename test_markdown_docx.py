@@ -0,0 +1,39 @@
+from io import BytesIO
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+
+from cache_raster import CacheRaster
+from markdown_docx import _pode_agrupar, converter_markdown
+
+
+def _links(docx):
+    documento = Document(BytesIO(docx))
+    return [documento.part.rels[h.get(qn('r:id'))].target_ref for h in documento.element.body.iter(qn('w:hyperlink'))]
+
+
+def test_definicao_de_link_nao_e_agrupada():
+    assert _pode_agrupar("Texto com [link](http://exemplo.com).")
+    assert not _pode_agrupar("Texto com [link][ref].\n\n[ref]: http://exemplo.com\n")
+    assert not _pode_agrupar("Texto.\n\n   [Ref Longa]: <http://exemplo.com> \"título\"\n")
+
+
+def test_bloco_de_codigo_aberto_nao_e_agrupado():
+    assert _pode_agrupar("```python\nx = 1\n```\n")
+    assert _pode_agrupar("~~~\n```\n~~~\n")   # ``` dentro de ~~~ é conteúdo
+    assert not _pode_agrupar("~~~\ncódigo sem fim\n")
+    assert not _pode_agrupar("````\ncódigo\n```\n")   # cerca menor não fecha
+
+
+def test_links_por_referencia_ficam_em_cada_arquivo():
+    pytest.importorskip("pypandoc")
+    arquivos = [
+        b"Site da [empresa][ref].\n\n[ref]: http://empresa-a.com.br\n",
+        b"Site da [empresa][ref].\n\n[ref]: http://empresa-b.com.br\n",
+    ]
+    try:
+        convertidos = converter_markdown(arquivos, cache=CacheRaster(pasta=None))
+    except OSError:
+        pytest.skip("pandoc não encontrado")
+    assert [_links(docx) for docx in convertidos] == [["http://empresa-a.com.br"], ["http://empresa-b.com.br"]]
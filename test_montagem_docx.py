@@ -0,0 +1,161 @@
+from io import BytesIO
+
+import pytest
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import PartFactory
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from PIL import Image
+
+from dossie import (
+    indexar_marcadores, insert_docx_at_placeholder, preencher_com_docx, preencher_com_imagens,
+    preencher_com_tabelas, preencher_marcadores,
+)
+from mesclar_docx import MescladorDocx
+
+# Regressões da montagem do DOCX: mescla das notas/carta e preenchimento dos marcadores.
+
+
+def _pandoc(markdown):
+    pytest.importorskip("pypandoc")
+    from markdown_docx import _pandoc
+    try:
+        return _pandoc(markdown)
+    except OSError:
+        pytest.skip("pandoc não encontrado")
+
+
+def _salvar_e_abrir(documento):
+    buffer = BytesIO()
+    documento.save(buffer)
+    return Document(BytesIO(buffer.getvalue()))
+
+
+def _documento(*textos):
+    documento = Document()
+    for texto in textos:
+        documento.add_paragraph(texto)
+    return documento
+
+
+def _png():
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _imagens(documento):
+    return len(list(documento.element.body.iter(qn('w:drawing'))))
+
+
+def test_varios_marcadores_no_mesmo_paragrafo():
+    main_doc = Document()
+    paragrafo = main_doc.add_paragraph("Antes ")
+    paragrafo.add_run("[[A]]").bold = True
+    paragrafo.add_run(" e [[")
+    paragrafo.add_run("B]] depois")  # marcador partido entre runs, como o Word grava
+    faltando = preencher_marcadores(main_doc, {
+        '[[A]]': preencher_com_imagens([_png()]),
+        '[[B]]': preencher_com_imagens([_png(), _png()]),
+    })
+
+    assert faltando == []
+    assert paragrafo.text == "Antes  e  depois"
+    assert _imagens(main_doc) == 3
+    assert paragrafo.runs[1].bold  # a formatação dos runs continua
+
+
+def test_marcador_repetido_no_paragrafo_entra_uma_vez():
+    main_doc = _documento("[[A]] e de novo [[A]]")
+    assert len(indexar_marcadores(main_doc)['[[A]]']) == 1
+    preencher_marcadores(main_doc, {'[[A]]': preencher_com_imagens([_png()])})
+    assert main_doc.paragraphs[0].text == " e de novo "
+    assert _imagens(main_doc) == 1
+
+
+def test_marcador_em_caixa_de_texto_indexa_so_o_paragrafo_interno():
+    main_doc = _documento("Fora")
+    main_doc.paragraphs[0]._p.append(parse_xml(
+        '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+        ' xmlns:v="urn:schemas-microsoft-com:vml"><w:pict><v:shape><v:textbox><w:txbxContent>'
+        '<w:p><w:r><w:t>[[A]]</w:t></w:r></w:p>'
+        '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+    ))
+    ocorrencias = indexar_marcadores(main_doc)['[[A]]']
+    assert len(ocorrencias) == 1
+    assert ocorrencias[0]._p is not main_doc.paragraphs[0]._p
+
+
+def test_imagem_do_modo_tabela_no_cabecalho_usa_a_parte_do_cabecalho():
+    main_doc = _documento("Corpo")
+    main_doc.sections[0].header.paragraphs[0].text = "[[T]]"
+    # Página sem texto aproveitável: a extração devolve a imagem da página.
+    preencher_marcadores(main_doc, {'[[T]]': preencher_com_tabelas(main_doc, extraidas=[(None, _png())])})
+
+    salvo = _salvar_e_abrir(main_doc)
+    cabecalho = salvo.sections[0].header.part
+    blips = list(cabecalho.element.iter(qn('a:blip')))
+    assert len(blips) == 1
+    assert cabecalho.related_parts[blips[0].get(qn('r:embed'))].content_type == "image/png"
+
+
+def test_mescla_leva_notas_de_rodape():
+    notas = _pandoc("Texto com nota[^1].\n\n[^1]: Nota de **rodapé** com [site](http://exemplo.com).\n")
+    carta = _pandoc("Carta[^a] com outra nota.\n\n[^a]: Segunda nota.\n")
+    main_doc = _documento("[[EXP_DEMONSTR]]", "[[CARTA_RESP]]")
+    mesclador = MescladorDocx(main_doc)
+    preencher_marcadores(main_doc, {
+        '[[EXP_DEMONSTR]]': preencher_com_docx(main_doc, notas, mesclador),
+        '[[CARTA_RESP]]': preencher_com_docx(main_doc, carta, mesclador),
+    })
+
+    salvo = _salvar_e_abrir(main_doc)
+    parte = salvo.part.part_related_by(RT.FOOTNOTES)
+    entradas = _notas_de_rodape(salvo)
+    refs = [r.get(qn('w:id')) for r in salvo.element.body.iter(qn('w:footnoteReference'))]
+    assert len(refs) == 2 and len(set(refs)) == 2
+    assert all(ref in entradas for ref in refs)
+    textos = ["".join(t.text for t in entradas[ref].iter(qn('w:t'))) for ref in refs]
+    assert "rodapé" in textos[0] and "Segunda nota" in textos[1]
+    # O hyperlink da nota aponta para um relacionamento da parte de notas.
+    link = next(entradas[refs[0]].iter(qn('w:hyperlink')))
+    assert parte.rels[link.get(qn('r:id'))].target_ref == "http://exemplo.com"
+    assert salvo.styles.element.get_by_id('FootnoteText') is not None
+
+
+def _notas_de_rodape(documento):
+    # Ao abrir, o python-docx deixa a parte de notas como binária: o XML vem do blob.
+    parte = documento.part.part_related_by(RT.FOOTNOTES)
+    return {n.get(qn('w:id')): n for n in parse_xml(parte.blob).iter(qn('w:footnote'))}
+
+
+def test_mescla_em_documento_que_ja_tem_notas():
+    main_doc = _documento("[[EXP_DEMONSTR]]")
+    preencher_marcadores(main_doc, {'[[EXP_DEMONSTR]]': preencher_com_docx(main_doc, _pandoc("Um[^1].\n\n[^1]: Primeira.\n"))})
+    # Reaberto, como um template que já vem com notas de rodapé.
+    main_doc = _salvar_e_abrir(main_doc)
+    main_doc.add_paragraph("[[CARTA_RESP]]")
+    preencher_marcadores(main_doc, {'[[CARTA_RESP]]': preencher_com_docx(main_doc, _pandoc("Dois[^1].\n\n[^1]: Segunda.\n"))})
+
+    salvo = _salvar_e_abrir(main_doc)
+    entradas = _notas_de_rodape(salvo)
+    refs = [r.get(qn('w:id')) for r in salvo.element.body.iter(qn('w:footnoteReference'))]
+    textos = ["".join(t.text for t in entradas[ref].iter(qn('w:t'))) for ref in refs]
+    assert len(set(refs)) == 2
+    assert "Primeira" in textos[0] and "Segunda" in textos[1]
+    # A mescla não muda como o python-docx carrega partes nos demais documentos do processo.
+    assert CT.WML_FOOTNOTES not in PartFactory.part_type_for
+
+
+def test_referencia_sem_nota_e_removida():
+    origem = _documento("Texto")
+    run = origem.paragraphs[0].add_run()._r
+    run.append(run.makeelement(qn('w:footnoteReference'), {qn('w:id'): '7'}))
+    main_doc = _documento("[[EXP_DEMONSTR]]")
+    insert_docx_at_placeholder(main_doc, '[[EXP_DEMONSTR]]', origem)
+
+    salvo = _salvar_e_abrir(main_doc)
+    assert not list(salvo.element.body.iter(qn('w:footnoteReference')))
+    assert [p.text for p in salvo.paragraphs] == ["", "Texto"]
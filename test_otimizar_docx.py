@@ -0,0 +1,65 @@
+from io import BytesIO
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.shared import Inches
+from PIL import Image
+
+from otimizar_docx import otimizar_docx
+
+# Otimização do pacote DOCX: o resultado abre no python-docx, com o mesmo conteúdo, e nunca é maior.
+
+
+def _salvar(documento):
+    buffer = BytesIO()
+    documento.save(buffer)
+    return buffer.getvalue()
+
+
+def _foto(lado):
+    # Gradiente colorido: não cabe em paleta, então a redução tem o que economizar.
+    imagem = Image.new("RGB", (lado, lado))
+    imagem.putdata([(x % 256, y % 256, (x + y) % 256) for y in range(lado) for x in range(lado)])
+    buffer = BytesIO()
+    imagem.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _abrir(dados):
+    documento = Document(BytesIO(dados))
+    blips = list(documento.element.body.iter(qn('a:blip')))
+    return documento, [documento.part.related_parts[b.get(qn('r:embed'))] for b in blips]
+
+
+def test_resultado_abre_com_o_mesmo_conteudo_e_menor():
+    documento = Document()
+    documento.add_paragraph("Notas explicativas")
+    documento.add_picture(BytesIO(_foto(1200)), width=Inches(1))
+    documento.add_paragraph("Carta de responsabilidade")
+    # Relacionamento que nenhum elemento do documento referencia.
+    documento.part.relate_to("http://exemplo.com", RT.HYPERLINK, is_external=True)
+    dados = _salvar(documento)
+
+    otimizado, relatorio = otimizar_docx(dados, perfil='screen')
+
+    assert len(otimizado) < len(dados)
+    assert relatorio['bytes_depois'] == len(otimizado) and relatorio['economia_bytes'] > 0
+    assert relatorio['relacionamentos_removidos'] >= 1 and relatorio['imagens_reduzidas'] == 1
+    saida, imagens = _abrir(otimizado)
+    assert [p.text for p in saida.paragraphs if p.text] == ["Notas explicativas", "Carta de responsabilidade"]
+    assert len(imagens) == 1
+    assert Image.open(BytesIO(imagens[0].blob)).width < 1200
+    assert not any(rel.reltype == RT.HYPERLINK for rel in saida.part.rels.values())
+
+
+def test_documento_sem_ganho_volta_igual():
+    documento = Document()
+    documento.add_paragraph("Texto")
+    dados = _salvar(documento)
+
+    otimizado, relatorio = otimizar_docx(dados)
+
+    assert len(otimizado) <= len(dados)
+    assert relatorio['bytes_depois'] == len(otimizado)
+    assert [p.text for p in Document(BytesIO(otimizado)).paragraphs] == ["Texto"]
@@ -0,0 +1,98 @@
+from io import BytesIO
+
+import fitz
+from docx import Document
+
+from campos import cnpj_valido, cpf_valido, digitos_cpf, normalizar_campos, validar_campos
+from validacao import contar_paginas, validar_entrada, validar_manifesto
+
+# Validação prévia: dígitos verificadores, datas do período e arquivos recusados antes da geração.
+
+CNPJ = "11.222.333/0001-81"
+CPF = "111.444.777-35"
+
+
+def _pdf(paginas):
+    doc = fitz.open()
+    for _ in range(paginas):
+        doc.new_page()
+    dados = doc.tobytes()
+    doc.close()
+    return dados
+
+
+def _docx():
+    buffer = BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+
+def _empresa(**uploads):
+    return {
+        'nome_empresa': "Empresa", 'cnpj_empresa': CNPJ,
+        'socios': [{'nome': "Sócio", 'cpf': CPF, 'cargo': "Administrador"}],
+        'data_inicio': "2024-01-01", 'data_fim': "2024-12-31",
+        'uploads': {
+            'balanco_file': _pdf(2), 'demstr_result_file': _pdf(1),
+            'explic_demonstr_file': _docx(), 'carta_responsb_file': "# Carta\n\nTexto.".encode(),
+            **uploads,
+        },
+    }
+
+
+def test_digitos_verificadores_cnpj():
+    assert cnpj_valido(CNPJ) and cnpj_valido("11222333000181")
+    assert not cnpj_valido("11.222.333/0001-82")
+    assert not cnpj_valido("11111111111111")
+    assert not cnpj_valido("1122233300018")
+
+
+def test_digitos_verificadores_cpf():
+    assert digitos_cpf("111444777") == "35"
+    assert cpf_valido(CPF) and cpf_valido("11144477735")
+    assert not cpf_valido("111.444.777-36")
+    assert not cpf_valido("000.000.000-00")
+
+
+def test_entrada_valida_passa():
+    assert validar_entrada(_empresa()) == []
+
+
+def test_pdf_curto_ou_invalido_e_recusado():
+    assert contar_paginas(b"nada de PDF") is None
+    [erro] = validar_entrada(_empresa(balanco_file=_pdf(1)))
+    assert "Balanco Patrimonial" in erro and "pelo menos 2 páginas" in erro
+    [erro] = validar_entrada(_empresa(demstr_result_file=b"%PDF-1.4 truncado"))
+    assert "DRE" in erro and "não é um PDF válido" in erro
+
+
+def test_docx_corrompido_e_recusado():
+    [erro] = validar_entrada(_empresa(explic_demonstr_file=b"PK\x03\x04 truncado"))
+    assert "Notas Explicativas" in erro and "corrompido" in erro
+
+
+def test_datas_invalidas_sao_recusadas():
+    [erro] = validar_campos({**_empresa(), 'data_inicio': "2024-13-01"})
+    assert "Data de início inválida" in erro
+    [erro] = validar_campos({**_empresa(), 'data_inicio': "2025-01-01"})
+    assert "Período inválido" in erro
+    # A normalização do manifesto não quebra: o erro aparece na validação da empresa.
+    empresa = normalizar_campos({'cnpj_empresa': CNPJ, 'data_inicio': "01/01/2024", 'data_fim': "2024-12-31"})
+    assert 'periodo_em_data' not in empresa
+    assert validar_campos(empresa) == ["Data de início inválida: '01/01/2024' (use AAAA-MM-DD)."]
+
+
+def test_manifesto_aponta_cada_empresa_invalida():
+    empresas = [_empresa(), {**_empresa(), 'cnpj_empresa': "11.222.333/0001-82"}, {**_empresa(), 'data_fim': "2024-02-30"}]
+    invalidas = validar_manifesto(empresas)
+    assert sorted(invalidas) == [1, 2]
+    assert "CNPJ inválido" in invalidas[1][0] and "Data de fim inválida" in invalidas[2][0]
+
+
+def test_arquivo_de_saida_repetido_e_recusado():
+    outra = {**_empresa(), 'nome_empresa': "Outra"}
+    empresas = [_empresa(), outra, _empresa(), {**_empresa(), 'arquivo_saida': "empresa_2024.docx"}]
+    invalidas = validar_manifesto(empresas)
+    assert sorted(invalidas) == [2]
+    [erro] = invalidas[2]
+    assert "Dossie_Contabil_Empresa.docx" in erro and "item 1" in erro
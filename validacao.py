@@ -0,0 +1,123 @@
+import os
+import zipfile
+from io import BytesIO
+
+from campos import ARQUIVOS_OBRIGATORIOS, ARQUIVOS_TEXTO, nome_saida_empresa, validar_campos
+from perfis_raster import TRAVA_FITZ
+
+# Validação prévia da entrada, antes de qualquer trabalho caro.
+#
+# Antes, um balanço com uma página só era descoberto no meio da geração, e
+# um DOCX corrompido só depois de o template ser renderizado. Aqui tudo é
+# conferido em milissegundos: número de páginas dos PDFs pelo índice do
+# arquivo (sem renderizar nada), diretório central do zip e presença do
+# word/document.xml nos DOCX, Markdown em UTF-8 e dígitos verificadores de
+# CNPJ/CPF. Roda no início de cada geração (dossie.preparar_uploads) e, na
+# geração em lote, sobre o manifesto inteiro antes da primeira empresa.
+
+ROTULOS = {
+    'balanco_file': "Balanco Patrimonial",
+    'demstr_result_file': "Demonstração do Resultado (DRE)",
+    'explic_demonstr_file': "Notas Explicativas",
+    'carta_responsb_file': "Carta de Responsabilidade",
+}
+MINIMO_PAGINAS = {'balanco_file': 2, 'demstr_result_file': 1}
+
+
+def contar_paginas(pdf):
+    """Páginas do PDF (bytes ou caminho) sem renderizar. None se não abrir ou tiver senha."""
+    import fitz
+
+    with TRAVA_FITZ:
+        try:
+            if isinstance(pdf, (bytes, bytearray)):
+                doc = fitz.open(stream=pdf, filetype="pdf")
+            else:
+                doc = fitz.open(pdf, filetype="pdf")
+        except Exception:
+            return None
+        try:
+            return None if doc.needs_pass else doc.page_count
+        finally:
+            doc.close()
+
+
+def _validar_pdf(chave, pdf):
+    rotulo, minimo = ROTULOS[chave], MINIMO_PAGINAS[chave]
+    paginas = contar_paginas(pdf)
+    if paginas is None:
+        return f"Erro: O arquivo '{rotulo}' não é um PDF válido (corrompido ou protegido por senha)."
+    if paginas < minimo:
+        return f"Erro: O arquivo '{rotulo}' (PDF) deve ter pelo menos {minimo} {'página' if minimo == 1 else 'páginas'}."
+    return None
+
+
+def _validar_texto(chave, dados):
+    rotulo = ROTULOS[chave]
+    if dados[:4] != b"PK\x03\x04":
+        # Não é zip: tem de ser Markdown.
+        try:
+            dados.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return f"Erro: O arquivo '{rotulo}' deve ser DOCX ou Markdown (UTF-8)."
+        return None
+    try:
+        # Só o diretório central é lido: nada é descompactado.
+        with zipfile.ZipFile(BytesIO(dados)) as z:
+            nomes = set(z.namelist())
+    except zipfile.BadZipFile:
+        return f"Erro: O arquivo '{rotulo}' está corrompido (DOCX inválido)."
+    if "word/document.xml" not in nomes:
+        return f"Erro: O arquivo '{rotulo}' não é um documento do Word (falta word/document.xml)."
+    return None
+
+
+def validar_arquivos(uploads):
+    """Erros dos arquivos de `uploads` ({chave: bytes ou caminho}); lista vazia se estão todos bons."""
+    erros = []
+    for chave in ARQUIVOS_OBRIGATORIOS:
+        arquivo = uploads.get(chave)
+        if arquivo is None:
+            erros.append(f"O arquivo {chave} é obrigatório!")
+            continue
+        if isinstance(arquivo, (str, os.PathLike)) and not os.path.isfile(arquivo):
+            erros.append(f"Erro: O arquivo '{ROTULOS[chave]}' não foi encontrado: {arquivo}")
+            continue
+        if chave in ARQUIVOS_TEXTO:
+            if isinstance(arquivo, (str, os.PathLike)):
+                with open(arquivo, "rb") as f:
+                    arquivo = f.read()
+            erro = _validar_texto(chave, arquivo) if arquivo else f"Erro: O arquivo '{ROTULOS[chave]}' está vazio."
+        else:
+            erro = _validar_pdf(chave, arquivo)
+        if erro:
+            erros.append(erro)
+    return erros
+
+
+def validar_entrada(input_data, uploads=None):
+    """Erros dos campos e dos arquivos (`uploads` ou input_data['uploads'])."""
+    return validar_campos(input_data) + validar_arquivos(uploads if uploads is not None else input_data['uploads'])
+
+
+def validar_manifesto(empresas):
+    """Valida todas as empresas do lote. Retorna {índice: erros} só das que têm problema.
+
+    Duas empresas com o mesmo arquivo de saída (mesmo nome_empresa sem
+    arquivo_saida, por exemplo) sobrescreveriam uma à outra: a repetida é recusada.
+    """
+    invalidas = {}
+    saidas = {}
+    for i, empresa in enumerate(empresas):
+        erros = validar_entrada(empresa)
+        nome = nome_saida_empresa(empresa)
+        chave = os.path.normcase(os.path.normpath(nome))
+        if chave in saidas:
+            j = saidas[chave]
+            erros.append(f"Arquivo de saída '{nome}' repetido: já é o de '{empresas[j].get('nome_empresa', '')}' "
+                         f"(item {j + 1} do manifesto). Defina arquivo_saida para uma delas.")
+        else:
+            saidas[chave] = i
+        if erros:
+            invalidas[i] = erros
+    return invalidas